@@ -0,0 +1,417 @@
+from __future__ import print_function, division
+"""
+Solve the model by Benders decomposition, with a master problem for the
+construction plan and a separate operating subproblem for each period, solved
+in parallel.
+
+With --benders, the standard solve is replaced by these steps:
+
+1. The master problem chooses values for the variables in
+   --benders-master-vars (BuildGen, BuildUnits, BuildStorageEnergy,
+   BuildPumpedHydroMW and the related construction and fuel tier flags by
+   default), subject to the constraints that only use those variables. Its
+   objective is the cost components that only depend on those variables (mainly
+   capital and fixed O&M costs), plus an estimate of the operating cost of each
+   period (Benders_Theta[p]), which is limited by the cuts found so far.
+2. Each period is then solved as a separate model with the construction plan
+   fixed at the master solution, in a pool of worker processes. Each
+   subproblem is solved with integer variables relaxed, and the operating
+   cost and the duals of the fixed construction variables are added to the
+   master problem as a cut. Unless --benders-relaxed-upper-bound is
+   specified, the subproblem is then solved again with integer variables
+   (e.g., unit commitment), to find the true operating cost of the plan.
+3. The master objective is a lower bound on total cost and the lowest total
+   cost of any plan evaluated so far is an upper bound. Steps 1 and 2 are
+   repeated until the gap between them is below --benders-gap, or for
+   --benders-max-iterations.
+
+Finally, the construction variables are fixed at the best plan found and the
+full model is solved in the usual way, so all the standard outputs are saved.
+The bounds for each iteration are saved in benders_convergence.csv in the
+outputs directory.
+
+Each constraint must either use only construction variables or use
+operating variables from a single period (identified by timepoint, timeseries
+or period indexes); otherwise an error is reported, and the variables that
+link periods should be added to --benders-master-vars. Each subproblem must
+be feasible for any plan the master problem chooses, so
+switch_model.hawaii.unserved_load must be included, and operating costs are
+assumed to be non-negative. The bounds are only exact if the master problem and
+subproblems are solved to optimality (mipgap=0).
+"""
+
+import os, csv, time, multiprocessing
+
+from pyomo.environ import (
+    Var, Constraint, ConstraintList, Objective, Param, Suffix, Set,
+    NonNegativeReals, Reals, PercentFraction, NonNegativeIntegers, value,
+)
+from pyomo.core.expr.current import identify_variables
+
+convergence_file = 'benders_convergence.csv'
+default_master_vars = [
+    'BuildGen', 'BuildMinGenCap', 'BuildUnits', 'BuildStorageEnergy',
+    'BuildPumpedHydroMW', 'BuildAnyPumpedHydro',
+    'RFMBuildSupplyTier', 'RFMSupplyTierActivate',
+]
+
+# model used by the worker processes, which receive a copy when they start
+subproblem_model = None
+
+def define_arguments(argparser):
+    argparser.add_argument('--benders', action='store_true', default=False,
+        help='Solve by Benders decomposition, with a master problem for '
+        'construction and an operating subproblem for each period (see benders.py).')
+    argparser.add_argument('--benders-master-vars', nargs='+', default=default_master_vars,
+        help='Variables to include in the master problem (default is %(default)s).')
+    argparser.add_argument('--benders-gap', type=float, default=0.005,
+        help='Relative gap between the upper and lower bounds at which to '
+        'stop (default is %(default)s).')
+    argparser.add_argument('--benders-max-iterations', type=int, default=50,
+        help='Maximum number of master problem solutions (default is %(default)s).')
+    argparser.add_argument('--benders-processes', type=int, default=None,
+        help='Number of periods to solve at the same time (default is one per period).')
+    argparser.add_argument('--benders-relaxed-upper-bound', action='store_true', default=False,
+        help='Only solve the subproblems with integer variables relaxed; the '
+        'upper bound is then only valid for the relaxed model.')
+
+def define_components(m):
+    if m.options.benders:
+        if 'switch_model.hawaii.unserved_load' not in m.module_list:
+            raise ValueError(
+                '--benders requires the switch_model.hawaii.unserved_load '
+                'module, so each subproblem is feasible for any construction plan.'
+            )
+        if m.options.benders_max_iterations < 1:
+            raise ValueError('--benders-max-iterations must be at least 1.')
+        # switch_model.solve.main() calls solve() from that module's namespace,
+        # so this replaces the standard solve function with the decomposition
+        # (see solve_checkpoints.py)
+        from switch_model import solve
+        if not hasattr(solve.solve, 'benders_base_solve'):
+            base_solve = solve.solve
+            def benders_solve(model):
+                return solve_benders(model, base_solve)
+            benders_solve.benders_base_solve = base_solve
+            solve.solve = benders_solve
+
+def var_period(m, v):
+    """
+    Return the period of an operating variable, based on the first timepoint,
+    timeseries or period in its index, or None if there is none.
+    """
+    index = v.index()
+    if not isinstance(index, tuple):
+        index = (index,)
+    for i in index:
+        if i in m.TIMEPOINTS:
+            return m.tp_period[i]
+    for i in index:
+        if i in m.TIMESERIES:
+            return m.ts_period[i]
+    for i in index:
+        if i in m.PERIODS:
+            return i
+    return None
+
+def partition_model(m):
+    """
+    Assign each active constraint to the master problem or to the subproblem
+    for one period. Returns a dict with the master variables, the master
+    constraints, the constraints for each period, the master variables used
+    by each period, the integer operating variables in each period and the
+    cost components that belong in the master problem.
+    """
+    master_vars = [
+        v for name in m.options.benders_master_vars if hasattr(m, name)
+        for v in getattr(m, name).values()
+    ]
+    master_ids = {id(v): i for i, v in enumerate(master_vars)}
+    periods = {}
+    part = dict(
+        master_vars=master_vars,
+        master_constraints=[],
+        period_constraints={p: [] for p in m.PERIODS},
+        period_master_vars={p: set() for p in m.PERIODS},
+        period_integer_vars={p: [] for p in m.PERIODS},
+    )
+    for c in m.component_data_objects(Constraint, active=True):
+        c_periods = set()
+        c_master = set()
+        for v in identify_variables(c.body, include_fixed=False):
+            if id(v) in master_ids:
+                c_master.add(master_ids[id(v)])
+                continue
+            if id(v) not in periods:
+                periods[id(v)] = var_period(m, v)
+                if periods[id(v)] is None:
+                    raise ValueError(
+                        'Variable {} is not a construction variable and is not '
+                        'indexed by timepoint, timeseries or period; add {} to '
+                        '--benders-master-vars.'.format(v.name, v.parent_component().name)
+                    )
+                if v.is_integer():
+                    part['period_integer_vars'][periods[id(v)]].append(v)
+            c_periods.add(periods[id(v)])
+        if not c_periods:
+            part['master_constraints'].append(c)
+        elif len(c_periods) == 1:
+            p = c_periods.pop()
+            part['period_constraints'][p].append(c)
+            part['period_master_vars'][p].update(c_master)
+        else:
+            raise ValueError(
+                'Constraint {} links periods {}; add the variables that link '
+                'them to --benders-master-vars.'
+                .format(c.name, ', '.join(str(p) for p in sorted(c_periods)))
+            )
+    # annual cost components that only depend on the master variables
+    part['master_costs'] = {
+        p: [
+            c for c in m.Cost_Components_Per_Period
+            if all(
+                id(v) in master_ids
+                for v in identify_variables(getattr(m, c)[p], include_fixed=False)
+            )
+        ]
+        for p in m.PERIODS
+    }
+    # master variables that only appear in the operating costs must also be
+    # fixed in the subproblems
+    for p in m.PERIODS:
+        part['period_master_vars'][p].update(
+            master_ids[id(v)]
+            for v in identify_variables(operating_cost(m, part, p), include_fixed=False)
+            if id(v) in master_ids
+        )
+    return part
+
+def master_cost(m, part, p):
+    """ Return the discounted cost of the master components in period p. """
+    return sum(getattr(m, c)[p] for c in part['master_costs'][p]) * m.bring_annual_costs_to_base_year[p]
+
+def operating_cost(m, part, p):
+    """ Return the discounted cost of the other components in period p. """
+    # same terms as SystemCostPerPeriod in switch_model.financials
+    return (
+        sum(
+            getattr(m, c)[p] for c in m.Cost_Components_Per_Period
+            if c not in part['master_costs'][p]
+        )
+        + sum(
+            getattr(m, c)[t] * m.tp_weight_in_year[t]
+            for c in m.Cost_Components_Per_TP for t in m.TPS_IN_PERIOD[p]
+        )
+    ) * m.bring_annual_costs_to_base_year[p]
+
+def relax_integers(variables):
+    """
+    Relax the domains of integer variables, and return a list of (variable,
+    domain) pairs to restore them with.
+    """
+    relaxed = []
+    for v in variables:
+        relaxed.append((v, v.domain))
+        if v.is_binary():
+            v.domain = PercentFraction
+        elif v.domain is NonNegativeIntegers or (v.lb is not None and v.lb >= 0):
+            v.domain = NonNegativeReals
+        else:
+            v.domain = Reals
+    return relaxed
+
+def prepare_subproblem(m, part):
+    """
+    Set up the worker's copy of the model to solve one period at a time: all
+    constraints and objectives are deactivated, and the master variables are
+    set by constraints (so their duals are available) instead of fixed.
+    """
+    for c in m.component_data_objects(Constraint, active=True):
+        c.deactivate()
+    for o in m.component_data_objects(Objective, active=True):
+        o.deactivate()
+    n = len(part['master_vars'])
+    m.BENDERS_MASTER_VARS = Set(initialize=list(range(n)), ordered=True)
+    m.benders_master_value = Param(m.BENDERS_MASTER_VARS, initialize=0.0, mutable=True)
+    m.Benders_Fix_Master_Vars = Constraint(m.BENDERS_MASTER_VARS, rule=lambda m, i:
+        part['master_vars'][i] == m.benders_master_value[i]
+    )
+    m.Benders_Fix_Master_Vars.deactivate()
+    m.Benders_Operating_Cost = Objective(m.PERIODS, rule=lambda m, p: operating_cost(m, part, p))
+    m.Benders_Operating_Cost.deactivate()
+    if not hasattr(m, 'dual'):
+        m.dual = Suffix(direction=Suffix.IMPORT)
+    m.benders_prepared = True
+
+def solve_subproblem(job):
+    """
+    Solve the operating subproblem for one period, with the master variables
+    set to master_values. Returns the period, the operating cost and the
+    duals of the master variables used in that period (from the relaxed
+    subproblem) and the operating cost with integer variables.
+    """
+    p, master_values = job
+    m = subproblem_model
+    part = m.benders_partition
+    if not getattr(m, 'benders_prepared', False):
+        prepare_subproblem(m, part)
+    used = sorted(part['period_master_vars'][p])
+    for i in used:
+        m.benders_master_value[i] = master_values[i]
+        m.Benders_Fix_Master_Vars[i].activate()
+    for c in part['period_constraints'][p]:
+        c.activate()
+    m.Benders_Operating_Cost[p].activate()
+    try:
+        # master variables are relaxed too, so the solver reports duals
+        relaxed = relax_integers(
+            part['period_integer_vars'][p]
+            + [part['master_vars'][i] for i in used if part['master_vars'][i].is_integer()]
+        )
+        try:
+            m.benders_base_solve(m)
+        finally:
+            for v, domain in relaxed:
+                v.domain = domain
+        cost = value(m.Benders_Operating_Cost[p])
+        duals = {i: m.dual.get(m.Benders_Fix_Master_Vars[i], 0.0) for i in used}
+        integer_cost = cost
+        if part['period_integer_vars'][p] and not m.options.benders_relaxed_upper_bound:
+            m.benders_base_solve(m)
+            integer_cost = value(m.Benders_Operating_Cost[p])
+    finally:
+        for i in used:
+            m.Benders_Fix_Master_Vars[i].deactivate()
+        for c in part['period_constraints'][p]:
+            c.deactivate()
+        m.Benders_Operating_Cost[p].deactivate()
+    return p, cost, duals, integer_cost
+
+def master_value(v):
+    if v.value is None:
+        return v.lb if v.lb is not None else 0.0
+    return round(v.value) if v.is_integer() else v.value
+
+def solve_benders(m, base_solve):
+    """
+    Solve model m by Benders decomposition as described above, using
+    base_solve() for the master problem and subproblems, then solve the full
+    model with the best construction plan. Returns the results from the last
+    solve.
+    """
+    global subproblem_model
+    start = time.time()
+    print("Dividing model into master problem and period subproblems...")
+    part = partition_model(m)
+    print(
+        "Master problem has {} variables and {} constraints; subproblems have "
+        "{} constraints ({:.0f}s).".format(
+            len(part['master_vars']), len(part['master_constraints']),
+            sum(len(c) for c in part['period_constraints'].values()),
+            time.time() - start
+        )
+    )
+    m.benders_partition = part
+    m.benders_base_solve = base_solve
+    # workers get a copy of the model as it is now
+    subproblem_model = m
+    pool = multiprocessing.Pool(
+        processes=m.options.benders_processes or len(m.PERIODS)
+    )
+
+    # set up the master problem
+    period_constraints = [c for p in m.PERIODS for c in part['period_constraints'][p]]
+    for c in period_constraints:
+        c.deactivate()
+    objectives = list(m.component_data_objects(Objective, active=True))
+    for o in objectives:
+        o.deactivate()
+    m.Benders_Theta = Var(m.PERIODS, within=NonNegativeReals)
+    m.Benders_Cuts = ConstraintList()
+    m.Benders_Master_Cost = Objective(rule=lambda m:
+        sum(master_cost(m, part, p) + m.Benders_Theta[p] for p in m.PERIODS)
+    )
+
+    history = []
+    best_plan = None
+    plans_tried = set()
+    upper_bound = float('inf')
+    try:
+        for iteration in range(1, m.options.benders_max_iterations + 1):
+            base_solve(m)
+            lower_bound = value(m.Benders_Master_Cost)
+            plan = [master_value(v) for v in part['master_vars']]
+            if tuple(plan) in plans_tried:
+                # the cuts for this plan are already in the master problem
+                print(
+                    "Master problem chose the same plan again; the remaining gap "
+                    "is due to integer operating decisions or solver tolerances."
+                )
+                break
+            plans_tried.add(tuple(plan))
+            plan_cost = sum(value(master_cost(m, part, p)) for p in m.PERIODS)
+            jobs = [(p, plan) for p in m.PERIODS]
+            for p, cost, duals, integer_cost in pool.imap_unordered(solve_subproblem, jobs):
+                plan_cost += integer_cost
+                m.Benders_Cuts.add(
+                    m.Benders_Theta[p] >= cost + sum(
+                        d * (part['master_vars'][i] - plan[i]) for i, d in duals.items()
+                    )
+                )
+            if plan_cost < upper_bound:
+                upper_bound = plan_cost
+                best_plan = plan
+            gap = (upper_bound - lower_bound) / upper_bound
+            history.append(dict(
+                iteration=iteration, lower_bound=lower_bound, upper_bound=upper_bound,
+                gap=gap, elapsed_time=time.time() - start
+            ))
+            print(
+                "Benders iteration {}: lower bound {:,.0f}, upper bound {:,.0f}, "
+                "gap {:.3%}; elapsed time: {:.0f}s".format(
+                    iteration, lower_bound, upper_bound, gap, time.time() - start
+                )
+            )
+            if gap <= m.options.benders_gap:
+                break
+        else:
+            print(
+                "WARNING: Benders decomposition did not converge in {} iterations; "
+                "using the best plan found.".format(m.options.benders_max_iterations)
+            )
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        # restore the full model
+        m.del_component('Benders_Master_Cost')
+        m.del_component('Benders_Cuts')
+        m.del_component('Benders_Theta')
+        for o in objectives:
+            o.activate()
+        for c in period_constraints:
+            c.activate()
+    save_convergence(m, history)
+
+    # solve the full model with the best plan, to get all the standard outputs
+    print("Solving full model with the best construction plan.")
+    fixed = [v for v in part['master_vars'] if not v.fixed]
+    for v, x in zip(part['master_vars'], best_plan):
+        if not v.fixed:
+            v.fix(x)
+    try:
+        results = base_solve(m)
+    finally:
+        for v in fixed:
+            v.unfix()
+    return results
+
+def save_convergence(m, history):
+    path = os.path.join(m.options.outputs_dir, convergence_file)
+    with open(path, 'w') as f:
+        w = csv.writer(f, lineterminator='\n')
+        columns = ['iteration', 'lower_bound', 'upper_bound', 'gap', 'elapsed_time']
+        w.writerow(columns)
+        w.writerows([row[c] for c in columns] for row in history)
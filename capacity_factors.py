@@ -0,0 +1,153 @@
+from __future__ import print_function, division
+"""
+Write variable_capacity_factors.csv using several processes, one project at a
+time.
+
+The standard query in scenario_data.write_tables() retrieves capacity factors
+for all projects in one query, which is slow for the larger time samples and
+holds everything on the server until the end (hence the --skip-cf option in
+get_scenario_data.py). Here, a pool of worker processes each retrieve one
+project at a time, streaming rows from the server in chunks via a server-side
+cursor, and the main process appends each project's rows to
+variable_capacity_factors.csv in project order as they arrive. Only about two
+projects per worker are requested at a time, so memory use is limited to
+about that many projects' rows, even if one project is slow.
+
+Call write_table(args) after scenario_data.write_tables(args) (with
+skip_cf=True), while the study_projects and study_generator_info temporary
+tables are still available, or pass a list of projects.
+"""
+
+import sys, time, io, itertools, collections, multiprocessing
+
+import switch_model.hawaii.scenario_data as scenario_data
+
+def write_table(args, timepoints=None, projects=None, processes=None, chunk_size=10000):
+    """
+    Write variable_capacity_factors.csv for the projects and time sample
+    identified by args, using `processes` workers (default is one per core).
+    If processes is 1, all the work is done in the current process.
+
+    timepoints can be a DataFrame with study_hour and date_time columns; if
+    omitted, these are retrieved for args['time_sample']. projects can be a
+    list of (GENERATION_PROJECT, project_id) tuples; if omitted, these are
+    retrieved from the temporary tables created by write_tables().
+
+    Note: this closes the shared database connection (and any temporary tables)
+    before starting the workers, because the forked workers can't share it.
+    """
+    output_file = scenario_data.make_file_path('variable_capacity_factors.csv', args)
+    start = time.time()
+    print("Writing {file} ...".format(file=output_file))
+
+    cur = scenario_data.db_cursor()
+    if projects is None:
+        cur.execute("""
+            SELECT DISTINCT "GENERATION_PROJECT", project_id
+            FROM study_generator_info g
+                JOIN study_projects p USING (technology)
+            WHERE EXISTS (SELECT 1 FROM cap_factor c WHERE c.project_id = p.project_id)
+            ORDER BY 1;
+        """)
+        projects = list(cur)
+    if timepoints is None:
+        cur.execute("""
+            SELECT study_hour, date_time FROM study_hour
+            WHERE time_sample = %(time_sample)s
+            ORDER BY 1;
+        """, args)
+        hours = list(cur)
+    else:
+        hours = list(
+            timepoints[['study_hour', 'date_time']]
+            .sort_values('study_hour')
+            .itertuples(index=False, name=None)
+        )
+    if processes != 1:
+        scenario_data.con.close()
+        scenario_data.con = None
+
+    tasks = [(gen, project_id, chunk_size) for gen, project_id in sorted(projects)]
+    n_rows = 0
+    with open(output_file, 'w') as f:
+        scenario_data.writerow(f, ['GENERATION_PROJECT', 'timepoint', 'gen_max_capacity_factor'])
+        if processes == 1:
+            set_hours(hours)
+            pool = None
+            results = map(project_rows, tasks)
+        else:
+            pool = multiprocessing.Pool(
+                processes=processes, initializer=set_hours, initargs=(hours,)
+            )
+            results = ordered_results(
+                pool, tasks, 2 * (processes or multiprocessing.cpu_count())
+            )
+        try:
+            for i, (text, rows) in enumerate(results):
+                f.write(text)
+                n_rows += rows
+                print(
+                    "\r  {}/{} projects, {} rows".format(i+1, len(tasks), n_rows),
+                    end=''
+                )
+                sys.stdout.flush()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    print("\n  time taken: {dur:.2f}s".format(dur=time.time()-start))
+
+def ordered_results(pool, tasks, max_pending):
+    """
+    Yield the results of project_rows() for each task in order (so the file
+    is sorted by project, as with the standard query), with no more than
+    max_pending tasks submitted but not yet yielded at any time.
+    """
+    pending = collections.deque()
+    tasks = iter(tasks)
+    for task in itertools.islice(tasks, max_pending):
+        pending.append(pool.apply_async(project_rows, (task,)))
+    while pending:
+        result = pending.popleft().get()
+        # refill the window before handing this result on
+        for task in itertools.islice(tasks, 1):
+            pending.append(pool.apply_async(project_rows, (task,)))
+        yield result
+
+# list of (study_hour, date_time) tuples used by project_rows() in each
+# worker, and the distinct historical hours in that list
+hours = None
+date_times = None
+def set_hours(study_hours):
+    global hours, date_times
+    hours = study_hours
+    date_times = tuple(sorted(set(dt for h, dt in hours)))
+
+def project_rows(task):
+    """
+    Retrieve capacity factors for one project, in chunks; return the rows as
+    text in .csv format, along with the number of rows.
+    """
+    gen, project_id, chunk_size = task
+    # use a named (server-side) cursor so rows are streamed from the server
+    # in chunks instead of being retrieved all at once
+    scenario_data.db_cursor()  # create the connection for this worker if needed
+    cur = scenario_data.con.cursor(name='cf_{}'.format(project_id))
+    cur.execute("""
+        SELECT date_time, cap_factor
+        FROM cap_factor
+        WHERE project_id = %(project_id)s AND date_time IN %(date_times)s;
+    """, dict(project_id=project_id, date_times=date_times))
+    cap_factor = {}
+    while True:
+        chunk = cur.fetchmany(chunk_size)
+        if not chunk:
+            break
+        cap_factor.update(chunk)
+    cur.close()
+    scenario_data.con.commit()  # end the transaction used by the named cursor
+    # assign capacity factors to all timepoints that use each historical hour
+    text = io.StringIO()
+    rows = [(gen, h, cap_factor[dt]) for h, dt in hours if dt in cap_factor]
+    scenario_data.writerows(text, rows)
+    return text.getvalue(), len(rows)
@@ -0,0 +1,195 @@
+from __future__ import print_function, division
+"""
+Start each timeseries from a saved storage and commitment state instead of
+wrapping around from its own last timepoint, and save the state partway
+through each timeseries for the next model in a sequence. This is used by
+rolling_horizon.py to solve a long run of consecutive days as a series of
+overlapping windows.
+
+Normally Switch treats each timeseries as a repeating cycle: the first
+timepoint follows the last one, so storage must end each timeseries at the
+level where it started, commitment at the start follows commitment at the end,
+and pumped hydro must balance its pumping and generation over the timeseries.
+
+With --initial-state-file <file>, the first timepoint of each timeseries
+follows the state in that file instead, for the projects and periods listed
+in it:
+
+- StateOfCharge: storage level (MWh) before the first timepoint
+- CommitGen and CommitGenRenewable: committed capacity (MW) before the first
+  timepoint
+- PumpedHydroSurplus: net water stored by each pumped hydro project in earlier
+  windows, as MW of generation (the same units as the daily balance); a
+  positive surplus can be used during this timeseries, and a negative one
+  (a deficit) must be made up by pumping during this timeseries
+
+Minimum up- and down-time rules still wrap around within each timeseries.
+
+With --save-state-after-tps <n>, post_solve() saves the state after the n-th
+timepoint of each timeseries in end_state.csv in the outputs directory, with
+columns variable, project, period and value, in the format used by
+--initial-state-file.
+"""
+
+import os, csv
+
+from pyomo.environ import Constraint, BuildAction, value
+
+state_file = 'end_state.csv'
+
+def define_arguments(argparser):
+    argparser.add_argument('--initial-state-file', default=None,
+        help='File with the storage and commitment state to use at the start '
+        'of each timeseries (see carry_over_state.py).')
+    argparser.add_argument('--save-state-after-tps', type=int, default=None,
+        help='Save the storage and commitment state after this many timepoints '
+        'of each timeseries in {} (see carry_over_state.py).'.format(state_file))
+
+def read_state(path):
+    """
+    Return a dict of {variable: {(project, period): value}} from a state file.
+    """
+    state = {}
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            state.setdefault(row['variable'], {})[
+                (row['project'], int(row['period']))
+            ] = float(row['value'])
+    return state
+
+def define_components(m):
+    if m.options.initial_state_file is None:
+        return
+    m.initial_state = read_state(m.options.initial_state_file)
+    print("Using initial state for {} values from {}.".format(
+        sum(len(v) for v in m.initial_state.values()), m.options.initial_state_file
+    ))
+
+    # each rule below replaces one element of a standard constraint, which is
+    # deactivated by the BuildAction after it
+    if hasattr(m, 'Track_State_Of_Charge'):
+        m.Track_Initial_State_Of_Charge = Constraint(
+            m.STORAGE_GEN_TPS,
+            rule=lambda m, g, t:
+                m.StateOfCharge[g, t] ==
+                initial_value(m, 'StateOfCharge', g, t) +
+                (m.ChargeStorage[g, t] * m.gen_storage_efficiency[g]
+                    - m.DispatchGen[g, t]) * m.tp_duration_hrs[t]
+                if initial_value(m, 'StateOfCharge', g, t) is not None
+                else Constraint.Skip
+        )
+        m.Release_Cyclic_State_Of_Charge = BuildAction(rule=lambda m: [
+            m.Track_State_Of_Charge[gt].deactivate()
+            for gt in m.Track_Initial_State_Of_Charge
+        ])
+
+    if hasattr(m, 'Commit_StartupGenCapacity_ShutdownGenCapacity_Consistency'):
+        m.Initial_Commit_StartupGenCapacity_ShutdownGenCapacity_Consistency = Constraint(
+            m.GEN_TPS,
+            rule=lambda m, g, t:
+                initial_value(m, 'CommitGen', g, t)
+                + m.StartupGenCapacity[g, t] - m.ShutdownGenCapacity[g, t]
+                == m.CommitGen[g, t]
+                if initial_value(m, 'CommitGen', g, t) is not None
+                else Constraint.Skip
+        )
+        m.Release_Cyclic_Commitment = BuildAction(rule=lambda m: [
+            m.Commit_StartupGenCapacity_ShutdownGenCapacity_Consistency[gt].deactivate()
+            for gt in m.Initial_Commit_StartupGenCapacity_ShutdownGenCapacity_Consistency
+        ])
+
+    if hasattr(m, 'Commit_StartupGenCapacity_ShutdownGenCapacity_Consistency_Renewable'):
+        # from switch_model.hawaii.rps with --rps-allocation relaxed_split_commit
+        m.Initial_Commit_StartupGenCapacity_ShutdownGenCapacity_Consistency_Renewable = Constraint(
+            m.FUEL_BASED_GEN_TPS,
+            rule=lambda m, g, t:
+                initial_value(m, 'CommitGenRenewable', g, t)
+                + m.StartupGenCapacityRenewable[g, t]
+                - m.ShutdownGenCapacityRenewable[g, t]
+                == m.CommitGenRenewable[g, t]
+                if initial_value(m, 'CommitGenRenewable', g, t) is not None
+                else Constraint.Skip
+        )
+        m.Release_Cyclic_Commitment_Renewable = BuildAction(rule=lambda m: [
+            m.Commit_StartupGenCapacity_ShutdownGenCapacity_Consistency_Renewable[gt].deactivate()
+            for gt in m.Initial_Commit_StartupGenCapacity_ShutdownGenCapacity_Consistency_Renewable
+        ])
+
+    if hasattr(m, 'Pumped_Hydro_Daily_Balance'):
+        m.Pumped_Hydro_Balance_With_Surplus = Constraint(
+            m.PH_GENS, m.TIMESERIES,
+            rule=lambda m, g, ts:
+                initial_value(m, 'PumpedHydroSurplus', g, m.TPS_IN_TS[ts].first())
+                + pumped_hydro_balance(m, g, m.TPS_IN_TS[ts]) >= 0
+                if initial_value(m, 'PumpedHydroSurplus', g, m.TPS_IN_TS[ts].first()) is not None
+                else Constraint.Skip
+        )
+        m.Release_Pumped_Hydro_Daily_Balance = BuildAction(rule=lambda m: [
+            m.Pumped_Hydro_Daily_Balance[g_ts].deactivate()
+            for g_ts in m.Pumped_Hydro_Balance_With_Surplus
+        ])
+
+def initial_value(m, var, g, t):
+    """
+    Return the initial value of var for project g if t is the first timepoint
+    of its timeseries and a value was given, otherwise None.
+    """
+    if t != m.TPS_IN_TS[m.tp_ts[t]].first():
+        return None
+    return m.initial_state.get(var, {}).get((g, m.tp_period[t]))
+
+def pumped_hydro_balance(m, g, tps):
+    # same terms as Pumped_Hydro_Daily_Balance in switch_model.hawaii.pumped_hydro
+    return sum(
+        m.PumpedHydroProjStoreMW[g, tp] * m.ph_efficiency[g]
+        + m.ph_inflow_mw[g]
+        - m.PumpedHydroProjGenerateMW[g, tp]
+        for tp in tps
+    )
+
+def post_solve(m, outputs_dir):
+    if m.options.save_state_after_tps is not None:
+        save_state(m, os.path.join(outputs_dir, state_file), m.options.save_state_after_tps)
+
+def save_state(m, path, n_tps):
+    """
+    Save the state after the n_tps-th timepoint of each timeseries in path.
+    """
+    end_tps = {}
+    for ts in m.TIMESERIES:
+        tps = list(m.TPS_IN_TS[ts])
+        if n_tps > len(tps):
+            raise ValueError(
+                '--save-state-after-tps {} is longer than timeseries {} ({} timepoints).'
+                .format(n_tps, ts, len(tps))
+            )
+        end_tps[ts] = tps[:n_tps]
+    rows = []
+    for ts, tps in end_tps.items():
+        t, p = tps[-1], m.ts_period[ts]
+        if hasattr(m, 'StateOfCharge'):
+            rows.extend(
+                ('StateOfCharge', g, p, value(m.StateOfCharge[g, t]))
+                for g in m.STORAGE_GENS if (g, t) in m.StateOfCharge
+            )
+        if hasattr(m, 'CommitGen'):
+            rows.extend(
+                ('CommitGen', g, p, value(m.CommitGen[g, t]))
+                for g in m.GENS_IN_PERIOD[p] if (g, t) in m.CommitGen
+            )
+        if hasattr(m, 'CommitGenRenewable'):
+            rows.extend(
+                ('CommitGenRenewable', g, p, value(m.CommitGenRenewable[g, t]))
+                for g in m.GENS_IN_PERIOD[p] if (g, t) in m.CommitGenRenewable
+            )
+        if hasattr(m, 'PH_GENS'):
+            for g in m.PH_GENS:
+                surplus = value(pumped_hydro_balance(m, g, tps))
+                if hasattr(m, 'initial_state'):
+                    surplus += m.initial_state.get('PumpedHydroSurplus', {}).get((g, p), 0.0)
+                rows.append(('PumpedHydroSurplus', g, p, surplus))
+    with open(path, 'w') as f:
+        w = csv.writer(f, lineterminator='\n')
+        w.writerow(['variable', 'project', 'period', 'value'])
+        w.writerows(rows)
+    print("Saved state after {} timepoints of each timeseries in {}.".format(n_tps, path))
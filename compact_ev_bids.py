@@ -0,0 +1,128 @@
+from __future__ import print_function
+"""
+Store EV charging bids in a compact form and expand them when the model loads
+its inputs.
+
+ev_charging_bids.csv has one row per load zone, vehicle type, bid number and
+timepoint, but the bids only depend on the hour of day and the length of the
+timestep (see the ev_charging_bids query in scenario_data.py). So
+ev_charging_bids_compact.csv stores one row per load zone, vehicle type, bid
+number and timestep length, with one column per hour of day (hour_00, hour_01,
+etc.). For the main inputs, this replaces 32,448 rows (1.8 MB) with 26 rows
+(6 kB).
+
+If ev_charging_bids.csv is missing and ev_charging_bids_compact.csv is present
+in the inputs directory, this module expands the compact file into the
+standard bid data when the EV module reads its inputs. This module must come
+before switch_model.hawaii.ev in modules.txt. (Note: patches from
+input_overlay are not applied to bids read from the compact file.)
+
+Run `python compact_ev_bids.py <inputs_dir> [...]` to convert existing
+ev_charging_bids.csv files to compact form.
+"""
+
+import os, sys, time
+import pandas as pd
+
+bid_file = 'ev_charging_bids.csv'
+compact_bid_file = 'ev_charging_bids_compact.csv'
+key_cols = ['LOAD_ZONE', 'VEHICLE_TYPE', 'BID_NUM', 'ts_duration_of_tp']
+
+def load_inputs(m, switch_data, inputs_dir):
+    """
+    Wrap switch_data.load_aug() so requests for ev_charging_bids.csv are
+    satisfied from ev_charging_bids_compact.csv if needed.
+    """
+    base_load_aug = switch_data.load_aug
+    def load_aug(*args, **kwds):
+        path = kwds['filename']
+        dir, file = os.path.split(path)
+        compact_path = os.path.join(dir, compact_bid_file)
+        if file == bid_file and not os.path.exists(path) and os.path.exists(compact_path):
+            bids = expand_bids(dir, read_compact_bids(compact_path))
+            index, param = kwds['index'], kwds['param']
+            switch_data[index.name] = list(bids.index)
+            switch_data[param.name] = bids.to_dict()
+            print("Read {} EV bids from {}.".format(len(bids), compact_path))
+        else:
+            base_load_aug(*args, **kwds)
+    switch_data.load_aug = load_aug
+
+def timepoint_hours(inputs_dir):
+    """
+    Return a DataFrame showing the hour of day and timestep length for each
+    timepoint in inputs_dir.
+    """
+    timepoints = pd.read_csv(os.path.join(inputs_dir, 'timepoints.csv'))
+    timeseries = pd.read_csv(os.path.join(inputs_dir, 'timeseries.csv'))
+    timepoints = timepoints.merge(
+        timeseries[['TIMESERIES', 'ts_duration_of_tp']],
+        left_on='timeseries', right_on='TIMESERIES'
+    )
+    # timestamps are 'YYYY-MM-DD HH:MM'
+    timepoints['hour'] = timepoints['timestamp'].str[11:13].astype(int)
+    return timepoints[['timepoint_id', 'hour', 'ts_duration_of_tp']]
+
+def read_compact_bids(compact_path):
+    """
+    Read compact bids into long form, with one row per bid key and hour.
+    """
+    bids = pd.read_csv(compact_path).melt(
+        id_vars=key_cols, var_name='hour', value_name='ev_bid_by_type'
+    )
+    bids['hour'] = bids['hour'].str.replace('hour_', '').astype(int)
+    return bids.dropna(subset=['ev_bid_by_type'])
+
+def expand_bids(inputs_dir, bids):
+    """
+    Broadcast long-form bids from read_compact_bids() to all matching
+    timepoints in inputs_dir. Returns a Series indexed by load zone, vehicle
+    type, bid number and timepoint, as in ev_charging_bids.csv.
+    """
+    bids = timepoint_hours(inputs_dir).merge(bids, on=['hour', 'ts_duration_of_tp'])
+    return (
+        bids.rename(columns={'timepoint_id': 'TIMEPOINT'})
+        .set_index(['LOAD_ZONE', 'VEHICLE_TYPE', 'BID_NUM', 'TIMEPOINT'])
+        ['ev_bid_by_type']
+        .sort_index()
+    )
+
+def write_compact_bids(bids, compact_path):
+    """
+    Save long-form bids (columns key_cols + ['hour', 'ev_bid_by_type']) in
+    compact form.
+    """
+    compact = bids.pivot_table(
+        index=key_cols, columns='hour', values='ev_bid_by_type', aggfunc='first'
+    )
+    compact.columns = ['hour_{:02d}'.format(h) for h in compact.columns]
+    compact.reset_index().to_csv(compact_path, index=False, na_rep='.')
+
+def compact_inputs(inputs_dir):
+    """
+    Convert ev_charging_bids.csv in inputs_dir to ev_charging_bids_compact.csv
+    and remove the original.
+    """
+    start = time.time()
+    path = os.path.join(inputs_dir, bid_file)
+    compact_path = os.path.join(inputs_dir, compact_bid_file)
+    bids = pd.read_csv(path).merge(
+        timepoint_hours(inputs_dir), left_on='TIMEPOINT', right_on='timepoint_id'
+    )
+    # make sure the bids really are the same for all timepoints with the same
+    # hour and duration
+    n_bids = bids.groupby(key_cols + ['hour'])['ev_bid_by_type'].nunique()
+    if (n_bids > 1).any():
+        raise ValueError(
+            'EV bids in {} vary between timepoints with the same hour of day; '
+            'they cannot be stored in compact form.'.format(path)
+        )
+    write_compact_bids(bids, compact_path)
+    os.remove(path)
+    print("Converted {} to {}; time taken: {:.2f}s".format(
+        path, compact_path, time.time()-start
+    ))
+
+if __name__ == '__main__':
+    for inputs_dir in sys.argv[1:]:
+        compact_inputs(inputs_dir)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+"""
+Solve several sibling scenarios from scenarios.txt by constructing the model
+once and forking a copy for each scenario.
+
+Most scenarios in scenarios.txt use the same inputs and modules as the main
+model, and differ only in a few settings that can be changed after the model
+has been constructed:
+
+    --exclude-module no_new_thermal_capacity  (releases its fixed variables)
+    --onshore-wind-limit <MW>                 (sets onshore_wind_limit_mw)
+    --ph-mw <MW> and --ph-year <year>         (rebuilds the pumped hydro rules)
+    --warm-start-from <outputs_dir>           (see warm_start.py)
+    --outputs-dir and --scenario-name
+
+This script reads options.txt (plus any --extra-args), constructs that model
+once, then forks a child process for each scenario. The child starts with a
+copy-on-write copy of the constructed model, applies the scenario's settings,
+then solves the model and saves results as `switch solve` would. Scenarios
+with any other settings (e.g., different inputs or modules) are solved with a
+normal `switch solve` run afterwards.
+
+Output and .done markers are written to scenario_runs/ as in run_scenarios.py,
+so finished scenarios are skipped if this script is run again. Use
+--processes to solve more than one scenario at a time (each child process
+needs its own solver memory; pages from the parent model are shared until
+they are modified).
+
+Examples:
+
+    python fork_scenarios.py --scenarios base accept resist no_hydro
+    python fork_scenarios.py --processes 2 --extra-args "--inputs-dir inputs_tiny"
+
+This only works on platforms that support os.fork() (e.g., Linux or MacOS).
+"""
+
+import os, sys, time, shlex, argparse, subprocess
+
+from pyomo.environ import Constraint
+
+import run_scenarios
+import no_new_thermal_capacity
+import limit_new_onshore_wind_capacity
+import warm_start
+
+# settings that can be applied to a constructed model, and the model
+# attribute or option they control
+value_settings = {
+    '--scenario-name': 'scenario_name',
+    '--outputs-dir': 'outputs_dir',
+    '--onshore-wind-limit': 'onshore_wind_limit',
+    '--ph-mw': 'ph_mw',
+    '--ph-year': 'ph_year',
+    '--warm-start-from': 'warm_start_from',
+}
+# modules that can be excluded from a constructed model, and the functions
+# that remove their effects
+optional_modules = {
+    'no_new_thermal_capacity': no_new_thermal_capacity.release,
+}
+
+def scenario_settings(args):
+    """
+    Split a scenario's arguments into settings that can be applied to a
+    constructed model (returned as a dict) and any others (returned as a list,
+    which is empty if the scenario can be forked from the shared model).
+    """
+    settings = dict(exclude_modules=[])
+    other_args = []
+    i = 0
+    while i < len(args):
+        a = args[i]
+        if a in value_settings and i + 1 < len(args):
+            settings[value_settings[a]] = args[i+1]
+            i += 2
+        elif a in ('--exclude-module', '--exclude-modules'):
+            modules = []
+            i += 1
+            while i < len(args) and not args[i].startswith('--'):
+                modules.append(args[i])
+                i += 1
+            if all(mod in optional_modules for mod in modules):
+                settings['exclude_modules'].extend(modules)
+            else:
+                other_args.extend([a] + modules)
+        else:
+            other_args.append(a)
+            i += 1
+    return settings, other_args
+
+def replace_component(m, name, component):
+    """
+    Replace component `name` on the constructed model m (if present) with a
+    new component, which is constructed immediately.
+    """
+    if hasattr(m, name):
+        m.del_component(name)
+        # constraints with several indexing sets also create an implicit set
+        if hasattr(m, name + '_index'):
+            m.del_component(name + '_index')
+    if component is not None:
+        setattr(m, name, component)
+
+def set_pumped_hydro(m, ph_mw, ph_year):
+    """
+    Rebuild the rules from switch_model.hawaii.pumped_hydro that force
+    construction of ph_mw MW of pumped hydro and only allow it in ph_year
+    (either can be None).
+    """
+    m.options.ph_mw = ph_mw
+    m.options.ph_year = ph_year
+    if not hasattr(m, 'PH_GENS'):
+        return
+    replace_component(m, 'Build_Pumped_Hydro_MW',
+        None if ph_mw is None else Constraint(m.LOAD_ZONES, rule=lambda m, z:
+            m.Pumped_Hydro_Capacity_MW[z, m.PERIODS.last()] == m.options.ph_mw
+        )
+    )
+    replace_component(m, 'Build_Pumped_Hydro_Year',
+        None if ph_year is None else Constraint(
+            m.PH_GENS, m.PERIODS,
+            rule=lambda m, g, pe:
+                m.BuildPumpedHydroMW[g, pe] == 0.0 if pe != m.options.ph_year else Constraint.Skip
+        )
+    )
+
+def apply_settings(m, settings):
+    """
+    Apply settings from scenario_settings() to the constructed model m.
+    """
+    m.options.scenario_name = settings.get('scenario_name', m.options.scenario_name)
+    m.options.outputs_dir = settings.get('outputs_dir', m.options.outputs_dir)
+    for module in settings['exclude_modules']:
+        optional_modules[module](m)
+        print("Excluded {} from the shared model.".format(module))
+    if 'onshore_wind_limit' in settings and hasattr(m, 'Limit_New_Wind'):
+        limit_new_onshore_wind_capacity.set_onshore_wind_limit(
+            m, float(settings['onshore_wind_limit'])
+        )
+    if 'ph_mw' in settings or 'ph_year' in settings:
+        set_pumped_hydro(
+            m,
+            float(settings['ph_mw']) if 'ph_mw' in settings else m.options.ph_mw,
+            int(settings['ph_year']) if 'ph_year' in settings else m.options.ph_year,
+        )
+    # pre_solve() has already run in the parent process, so apply the warm
+    # start here (after other changes, so it can be repaired to match them)
+    if 'warm_start_from' in settings:
+        m.options.warm_start_from = settings['warm_start_from']
+        warm_start.load_warm_start(m, settings['warm_start_from'])
+
+def solve_instance(instance):
+    """
+    Solve a constructed model instance and report results, following the same
+    steps as switch_model.solve.main().
+    """
+    from switch_model import solve
+    if not os.path.isdir(instance.options.outputs_dir):
+        os.makedirs(instance.options.outputs_dir)
+    iterate_modules = solve.get_iteration_list(instance)
+    if iterate_modules:
+        solve.iterate(instance, iterate_modules)
+    else:
+        results = solve.solve(instance)
+        print("\nOptimization termination condition was {}.\n".format(
+            results.solver.termination_condition
+        ))
+        if not instance.options.no_save_solution:
+            solve.save_results(instance, instance.options.outputs_dir)
+    if not instance.options.no_post_solve:
+        instance.post_solve()
+
+def run_child(instance, s):
+    """
+    Apply the settings for scenario s to the (forked) instance, solve it and
+    exit with 0 for success or 1 for failure. Output goes to the scenario's
+    log file.
+    """
+    log = open(run_scenarios.log_file(s['name']), 'w')
+    # redirect at the file-descriptor level so solver output is captured too
+    os.dup2(log.fileno(), sys.stdout.fileno())
+    os.dup2(log.fileno(), sys.stderr.fileno())
+    status = 1
+    try:
+        print("Solving scenario {} from the shared model with arguments: {}\n".format(
+            s['name'], ' '.join(s['args'])
+        ))
+        apply_settings(instance, s['settings'])
+        solve_instance(instance)
+        status = 0
+    except:
+        import traceback
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
+
+def finish_scenario(s, status):
+    elapsed = (time.time() - s['start']) / 60
+    if status == 0:
+        with open(run_scenarios.done_file(s['name']), 'w') as f:
+            f.write('finished {} after {:.1f} minutes\n'.format(time.ctime(), elapsed))
+        print("Finished {} in {:.1f} minutes.".format(s['name'], elapsed))
+    else:
+        print("Scenario {} failed after {:.1f} minutes; see {}.".format(
+            s['name'], elapsed, run_scenarios.log_file(s['name'])
+        ))
+    return status == 0
+
+def fork_scenarios(instance, scenarios, processes=1):
+    """
+    Solve each scenario in a forked copy of instance, running up to
+    `processes` at a time. Returns a list of the scenarios that failed.
+    """
+    queue = list(scenarios)
+    running = {}
+    failed = []
+    while queue or running:
+        while queue and len(running) < processes:
+            s = queue.pop(0)
+            s['start'] = time.time()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                run_child(instance, s)  # never returns
+            running[pid] = s
+            print("Started {} (pid {}); log in {}.".format(
+                s['name'], pid, run_scenarios.log_file(s['name'])
+            ))
+            sys.stdout.flush()
+        pid, status = os.wait()
+        s = running.pop(pid)
+        if not finish_scenario(s, status):
+            failed.append(s['name'])
+    return failed
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Solve sibling scenarios from a shared model (see fork_scenarios.py).'
+    )
+    parser.add_argument('--scenarios', nargs='+', default=None,
+        help='Names of scenarios to run (default is all scenarios in the scenario list).')
+    parser.add_argument('--scenario-list', default='scenarios.txt',
+        help='File with arguments for each scenario, one scenario per line.')
+    parser.add_argument('--processes', type=int, default=1,
+        help='Number of scenarios to solve at the same time (default is 1).')
+    parser.add_argument('--extra-args', default='',
+        help='Additional arguments to use for the shared model and all scenarios.')
+    parser.add_argument('--rerun', action='store_true', default=False,
+        help='Solve scenarios again even if they have finished before.')
+    args = parser.parse_args(args)
+
+    from switch_model import solve
+
+    scenarios = []
+    for scenario_args in run_scenarios.read_arg_file(args.scenario_list):
+        name = run_scenarios.arg_value(scenario_args, '--scenario-name')
+        if args.scenarios is None or name in args.scenarios:
+            settings, other_args = scenario_settings(scenario_args)
+            scenarios.append(dict(
+                name=name, args=scenario_args, settings=settings, other_args=other_args
+            ))
+    if not os.path.exists(run_scenarios.runs_dir):
+        os.makedirs(run_scenarios.runs_dir)
+    for s in scenarios:
+        if os.path.exists(run_scenarios.done_file(s['name'])):
+            if args.rerun:
+                os.remove(run_scenarios.done_file(s['name']))
+            else:
+                print("Skipping finished scenario {}.".format(s['name']))
+    scenarios = [s for s in scenarios if not os.path.exists(run_scenarios.done_file(s['name']))]
+    forked = [s for s in scenarios if not s['other_args']]
+    others = [s for s in scenarios if s['other_args']]
+
+    failed = []
+    if forked:
+        start = time.time()
+        extra_args = shlex.split(args.extra_args)
+        instance = solve.main(
+            args=solve.get_option_file_args(extra_args=extra_args),
+            return_instance=True
+        )
+        print("Constructed shared model in {:.1f} minutes; solving {} scenario(s): {}".format(
+            (time.time() - start) / 60, len(forked), ', '.join(s['name'] for s in forked)
+        ))
+        failed.extend(fork_scenarios(instance, forked, processes=args.processes))
+
+    # solve scenarios that can't use the shared model the normal way
+    for s in others:
+        print("Solving {} separately because of these arguments: {}".format(
+            s['name'], ' '.join(s['other_args'])
+        ))
+        s['start'] = time.time()
+        cmd = ['switch', 'solve'] + s['args'] + shlex.split(args.extra_args)
+        with open(run_scenarios.log_file(s['name']), 'w') as log:
+            status = subprocess.call(cmd, stdout=log, stderr=subprocess.STDOUT)
+        if not finish_scenario(s, status):
+            failed.append(s['name'])
+
+    if failed:
+        print("The following scenario(s) failed: {}".format(', '.join(failed)))
+        return 1
+    print("All scenarios finished.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
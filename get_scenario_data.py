@@ -4,16 +4,31 @@ from __future__ import print_function, division
 import sys, os, argparse
 
 import switch_model.hawaii.scenario_data as scenario_data
+import time_sample_inputs
+import compact_ev_bids
+import capacity_factors
+import slices
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--skip-cf', action='store_true', default=False,
-    help='Skip writing variable capacity factors file (for faster execution)')
+    help='Skip writing variable capacity factors file')
+parser.add_argument('--cf-processes', type=int, default=None,
+    help='Number of processes to use for writing variable capacity factors '
+    '(default is one per core)')
 parser.add_argument('--skip-ev-bids', action='store_true', default=False,
     help='Skip writing EV charging bids file (for faster execution)')
+parser.add_argument('--compact-ev-bids', action='store_true', default=False,
+    help='Save EV charging bids in compact form (one row per bid and one column '
+    'per hour of day; see compact_ev_bids.py)')
 # default is daily slice samples for all but 4 days in 2007-08
 parser.add_argument('--slice-count', type=int, default=0, # default=727,
-    help='Number of slices to generate for post-optimization evaluation.')
+    help='Number of slices to generate for post-optimization evaluation. '
+    'The slice index is always written, and other slices can be created later '
+    'as needed with slices.py.')
+parser.add_argument('--slice-processes', type=int, default=None,
+    help='Number of processes to use for generating slices '
+    '(default is one per core)')
 parser.add_argument('--tiny-only', action='store_true', default=False,
     help='Only prepare inputs for the tiny scenario for testing.')
 
@@ -34,11 +49,11 @@ scenarios = [
     '--scenario-name heco --psip-force '
         '--exclude-module no_new_thermal_capacity switch_model.hawaii.heco_outlook_2020_08 '
         '--include-module switch_model.hawaii.heco_plan_2020_08 '
-        '--inputs-dir inputs_heco --outputs-dir outputs_heco',
+        '--input-overlay overlays/inputs_heco.json --outputs-dir outputs_heco',
     # no hydro
-    '--scenario-name no_hydro --ph-year 2045 --ph-mw 0',
+    '--scenario-name no_hydro --ph-year 2045 --ph-mw 0 --outputs-dir outputs_no_hydro',
     # optimized, but with HECO retirement dates
-    '--scenario-name heco_retirement --inputs-dir inputs_heco --outputs-dir outputs_heco_retirement',
+    '--scenario-name heco_retirement --input-overlay overlays/inputs_heco.json --outputs-dir outputs_heco_retirement',
 ]
 with open('scenarios.txt', 'w') as f:
     f.writelines(s + '\n' for s in scenarios)
@@ -364,9 +379,11 @@ Outstanding questions:
 args = dict(
     # directory to store data in
     inputs_dir='inputs',
-    # skip writing capacity factors file if specified (for speed)
+    # skip writing capacity factors file if specified
     skip_cf = cmd_line_args.skip_cf,
+    cf_processes = cmd_line_args.cf_processes,
     skip_ev_bids = cmd_line_args.skip_ev_bids,
+    compact_ev_bids = cmd_line_args.compact_ev_bids,
     # use heat rate curves for all thermal plants
     use_incremental_heat_rates=True,
     # could be 'tiny', 'rps', 'rps_mini' or possibly '2007', '2016test', 'rps_test_45', or 'main'
@@ -524,11 +541,17 @@ rps_2030 = {2020: 0.4, 2025: 0.7, 2030: 1.0}
 def write_inputs(args, **alt_args):
     all_args = args.copy()
     all_args.update(alt_args)
-    scenario_data.write_tables(all_args)
+    # capacity factors are written separately, in parallel (see capacity_factors.py)
+    scenario_data.write_tables(dict(all_args, skip_cf=True))
+    if all_args['skip_cf']:
+        print("SKIPPING variable_capacity_factors.csv")
+    else:
+        capacity_factors.write_table(all_args, processes=all_args['cf_processes'])
+    if all_args['compact_ev_bids'] and not all_args['skip_ev_bids']:
+        compact_ev_bids.compact_inputs(all_args['inputs_dir'])
 
 # write regular scenario
 write_inputs(args)
-write_inputs(args, inputs_dir='inputs_heco')
 
 # tiny scenario for testing
 write_inputs(args, inputs_dir='inputs_tiny', time_sample='tiny')
@@ -545,29 +568,49 @@ write_inputs(args, inputs_dir='inputs_small', time_sample='small_2050')
 
 # annual model for post-optimization evaluation (may be too big to solve)
 # (gets too big to solve if run hourly?)
-write_inputs(
+# These reuse the tables that don't depend on the time sample from inputs and
+# only create the time-dependent ones (much faster than write_inputs()).
+def write_time_sample_inputs(base_inputs_dir, args, **alt_args):
+    all_args = args.copy()
+    all_args.update(alt_args)
+    time_sample_inputs.write_tables(base_inputs_dir, all_args)
+
+write_time_sample_inputs(
+    'inputs',
     args,
     inputs_dir='inputs_annual',
     time_sample=args['time_sample'].replace('_325_', '_1_') # .replace('_2', '')
 )
-write_inputs(
-    args,
-    inputs_dir='inputs_annual_heco',
-    time_sample=args['time_sample'].replace('_325_', '_1_') # .replace('_2', '')
-)
 # short annual model for post-optimization evaluation (may be too big to solve)
-write_inputs(
+write_time_sample_inputs(
+    'inputs',
     args,
     inputs_dir='inputs_2019_2022',
     time_sample=args['time_sample'].replace('_325_2050_', '_2019_2022_')
 )
 
-# shift Kahe 5 and 6 retirement from 2045 to 2028 for HECO plan
-import os
-import pandas as pd
+# single-day slices for post-optimization evaluation, based on inputs_annual;
+# these are created lazily and cached, so only the first slice_count are
+# created here (see slices.py)
+slices.write_index('inputs_annual', args)
+slices.write_slices(
+    range(cmd_line_args.slice_count), processes=cmd_line_args.slice_processes
+)
+
+# shift Kahe 5 and 6 retirement from 2045 to 2028 for HECO plan; these are
+# applied to the standard inputs when the model is loaded (see input_overlay.py)
+import input_overlay
+heco_retirement_patches = [
+    {
+        'file': 'generation_projects_info.csv',
+        'where': {'gen_tech': ['Kahe_5', 'Kahe_6']},
+        'column': 'gen_max_age',
+        'add': 2028 - 2045,
+    },
+]
 for inputs_dir in ['inputs', 'inputs_annual']:
-    df = pd.read_csv(os.path.join(inputs_dir, 'generation_projects_info.csv'))
-    df.loc[(df['gen_tech']=='Kahe_5') | (df['gen_tech']=='Kahe_6'), 'gen_max_age'] \
-        += (2028 - 2045)
-    df.to_csv(os.path.join(inputs_dir+'_heco', 'generation_projects_info.csv'), index=False)
-print("Need to somehow remove existing Pearl City Peninsula Solar Park from inputs_heco and inputs_heco_annual")
+    input_overlay.write_overlay(
+        os.path.join('overlays', inputs_dir + '_heco.json'),
+        inputs_dir=inputs_dir, patches=heco_retirement_patches
+    )
+print("Need to somehow remove existing Pearl City Peninsula Solar Park from overlays/inputs_heco.json and overlays/inputs_annual_heco.json")
@@ -0,0 +1,119 @@
+from __future__ import print_function
+"""
+Save the input data read from the .csv files in the inputs directory in a
+binary cache, and reuse it on later runs instead of parsing the .csv files
+again.
+
+With --input-cache, the first run with a particular set of inputs reads them
+as usual, then saves all the data in input_cache/<key>.pickle. The key is
+based on the contents of every file in the inputs directory, the list of
+modules, the model options (other than ones that only affect solving or
+reporting, e.g., --outputs-dir or --verbose) and the contents of any
+--input-overlay file, so the cache is automatically ignored if any of these
+change. Later runs
+with the same key (including --reload-prior-solution runs) load the data
+from the cache and skip the .csv files.
+
+Old cache files are not removed automatically; the input_cache directory can
+be deleted at any time.
+"""
+
+import os, sys, json, time, types, pickle, hashlib
+
+from pyomo.environ import DataPortal
+import pyomo.version
+
+def define_arguments(argparser):
+    argparser.add_argument('--input-cache', action='store_true', default=False,
+        help='Save parsed inputs in a binary cache and reuse them when the '
+        'input files have not changed (see input_cache.py).')
+    argparser.add_argument('--input-cache-dir', default='input_cache',
+        help='Directory for the input cache (default is %(default)s).')
+
+def define_components(m):
+    if m.options.input_cache:
+        # create_model() attaches utilities.load_inputs() to the model, and
+        # solve.main() calls that to read the inputs, so this replaces it with a
+        # version that uses the cache
+        m.load_inputs = types.MethodType(cached_load_inputs, m)
+
+def cached_load_inputs(model, inputs_dir=None, attach_data_portal=True):
+    """
+    Create a model instance using cached input data if available; otherwise
+    read the inputs as usual and save them in the cache.
+    """
+    from switch_model.utilities import load_inputs, load_aug
+    if inputs_dir is None:
+        inputs_dir = getattr(model.options, 'inputs_dir', 'inputs')
+    cache_file = os.path.join(
+        model.options.input_cache_dir, cache_key(model, inputs_dir) + '.pickle'
+    )
+    if not os.path.exists(cache_file):
+        instance = load_inputs(model, inputs_dir, attach_data_portal=True)
+        start = time.time()
+        save_cache(cache_file, instance.DataPortal.data())
+        print("Saved inputs in {} in {:.2f} s.".format(cache_file, time.time()-start))
+        if not attach_data_portal:
+            del instance.DataPortal
+        return instance
+
+    start = time.time()
+    with open(cache_file, 'rb') as f:
+        cached_data = pickle.load(f)
+    data = DataPortal(model=model)
+    data.load_aug = types.MethodType(load_aug, data)
+    for name, value in cached_data.items():
+        data[name] = value
+    print("Read inputs from {} in {:.2f} s.".format(cache_file, time.time()-start))
+    instance = model.create_instance(data)
+    if attach_data_portal:
+        instance.DataPortal = data
+    return instance
+
+# options that don't affect the input data, so they can change without
+# invalidating the cache
+ignored_options = {
+    'outputs_dir', 'verbose', 'tee', 'sorted_output', 'logs_dir',
+    'log_run_to_file', 'debug', 'solver', 'solver_manager', 'solver_io',
+    'solver_options_string', 'keepfiles', 'symbolic_solver_labels', 'tempdir',
+    'suffixes', 'interact', 'no_save_solution', 'no_post_solve',
+    'reload_prior_solution', 'input_cache', 'input_cache_dir',
+}
+
+def cache_key(model, inputs_dir):
+    """
+    Return a hash of everything that affects the input data.
+    """
+    h = hashlib.md5()
+    settings = dict(
+        modules=list(model.module_list),
+        options={
+            k: v for k, v in vars(model.options).items()
+            if k not in ignored_options
+        },
+        pyomo_version=pyomo.version.version,
+        python_version=sys.version_info[:2],
+    )
+    overlay_file = getattr(model.options, 'input_overlay', None)
+    if overlay_file is not None:
+        with open(overlay_file) as f:
+            settings['input_overlay'] = f.read()
+    h.update(json.dumps(settings, sort_keys=True, default=str).encode('utf-8'))
+    for file in sorted(os.listdir(inputs_dir)):
+        path = os.path.join(inputs_dir, file)
+        if os.path.isfile(path):
+            h.update(file.encode('utf-8'))
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1024**2), b''):
+                    h.update(block)
+    return h.hexdigest()
+
+def save_cache(cache_file, data):
+    cache_dir = os.path.dirname(cache_file)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    # write to a temporary file first so a partial cache file is never used
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_file, cache_file)
@@ -0,0 +1,221 @@
+from __future__ import print_function
+"""
+Apply a declarative overlay to a base inputs directory while the model reads
+its inputs, instead of copying the whole directory to create a variant.
+
+An overlay is a .json file that names the base inputs directory and lists
+patches to apply to individual tables, e.g.,
+
+{
+    "inputs_dir": "inputs",
+    "patches": [
+        {
+            "file": "generation_projects_info.csv",
+            "where": {"gen_tech": ["Kahe_5", "Kahe_6"]},
+            "column": "gen_max_age",
+            "add": -17
+        }
+    ]
+}
+
+Each patch changes one column of the rows in "file" that match all the
+conditions in "where" (all rows if "where" is omitted). Each condition can be a
+single value or a list of acceptable values. The patch must have exactly one
+of these keys: "set" (use this value), "add" (add this amount) or "scale"
+(multiply by this amount). Patches are applied in the order listed. Index
+columns can be used in "where" but can't be patched.
+
+Use --input-overlay <file> to solve a model using an overlay. This module must
+be listed before any module that reads patched tables in modules.txt. Scripts
+can use read_csv() to read tables with the same patches applied.
+"""
+
+import os, json
+import pandas as pd
+
+patch_operations = ['set', 'add', 'scale']
+
+def define_arguments(argparser):
+    argparser.add_argument('--input-overlay', default=None,
+        help='Name of a .json file that identifies the base inputs directory '
+        'and patches to apply to it when inputs are loaded (see '
+        'input_overlay.py). This overrides --inputs-dir.')
+
+def define_components(m):
+    if m.options.input_overlay is None:
+        return
+    m.input_overlay = read_overlay(m.options.input_overlay)
+    # utilities.load_inputs() reads m.options.inputs_dir after the model has
+    # been constructed, so this makes all modules read from the base directory.
+    m.options.inputs_dir = m.input_overlay['inputs_dir']
+    print("Using inputs from {} with {} patch(es) from {}.".format(
+        m.options.inputs_dir, len(m.input_overlay['patches']),
+        m.options.input_overlay
+    ))
+
+def load_inputs(m, switch_data, inputs_dir):
+    """
+    Wrap switch_data.load_aug() so each table is patched right after it is
+    loaded by the module that uses it. This assumes the other modules read
+    .csv files via load_aug(), which is true for all standard Switch modules.
+    """
+    if m.options.input_overlay is None:
+        return
+    base_load_aug = switch_data.load_aug
+    def load_aug(*args, **kwds):
+        base_load_aug(*args, **kwds)
+        file = os.path.basename(kwds['filename'])
+        patches = [p for p in m.input_overlay['patches'] if p['file'] == file]
+        if patches:
+            patch_data_portal(
+                m, switch_data, kwds['filename'], kwds.get('param', []), patches
+            )
+    switch_data.load_aug = load_aug
+
+def read_overlay(overlay_file):
+    """
+    Read and validate an overlay file; return a dict with 'inputs_dir' and
+    'patches' elements.
+    """
+    with open(overlay_file) as f:
+        overlay = json.load(f)
+    if 'inputs_dir' not in overlay:
+        raise ValueError('No inputs_dir specified in {}.'.format(overlay_file))
+    overlay.setdefault('patches', [])
+    for p in overlay['patches']:
+        ops = [op for op in patch_operations if op in p]
+        if 'file' not in p or 'column' not in p or len(ops) != 1:
+            raise ValueError(
+                'Each patch in {} must have a file, a column and exactly one of {}; '
+                'found {}.'.format(overlay_file, ', '.join(patch_operations), p)
+            )
+        p['operation'] = ops[0]
+        # standardize where conditions as lists of acceptable values
+        p['where'] = {
+            col: vals if isinstance(vals, list) else [vals]
+            for col, vals in p.get('where', {}).items()
+        }
+    return overlay
+
+def write_overlay(overlay_file, inputs_dir, patches):
+    """
+    Save an overlay that applies the specified patches to inputs_dir.
+    """
+    overlay_dir = os.path.dirname(overlay_file)
+    if overlay_dir and not os.path.exists(overlay_dir):
+        os.makedirs(overlay_dir)
+    with open(overlay_file, 'w') as f:
+        json.dump(dict(inputs_dir=inputs_dir, patches=patches), f, indent=4)
+        f.write('\n')
+
+def patched_value(patch, value):
+    if patch['operation'] == 'set':
+        return patch['set']
+    elif patch['operation'] == 'add':
+        return value + patch['add']
+    else:
+        return value * patch['scale']
+
+def inputs_dir(inputs):
+    """
+    Return the base directory for `inputs`, which can be either an inputs
+    directory or an overlay file.
+    """
+    if inputs.endswith('.json'):
+        return read_overlay(inputs)['inputs_dir']
+    else:
+        return inputs
+
+def read_csv(inputs, filename, **kwargs):
+    """
+    Read filename from `inputs` (an inputs directory or an overlay file) into a
+    pandas DataFrame, with any patches from the overlay applied. Additional
+    arguments are passed to pandas.read_csv().
+    """
+    if inputs.endswith('.json'):
+        overlay = read_overlay(inputs)
+    else:
+        overlay = dict(inputs_dir=inputs, patches=[])
+    df = pd.read_csv(os.path.join(overlay['inputs_dir'], filename), **kwargs)
+    for p in overlay['patches']:
+        if p['file'] == filename:
+            # missing values are left as they are
+            rows = df[p['column']].notnull()
+            for col, vals in p['where'].items():
+                rows &= df[col].isin(vals)
+            df.loc[rows, p['column']] = df.loc[rows, p['column']].map(
+                lambda v: patched_value(p, v)
+            )
+    return df
+
+def patch_data_portal(m, switch_data, path, params, patches):
+    """
+    Apply patches to the data that load_aug() just read from path into
+    switch_data for the specified params.
+    """
+    # get names of params loaded from this file (may be a Param, a tuple or a
+    # list; load_aug() drops optional params that are missing from the file)
+    if not isinstance(params, (list, tuple)):
+        params = [params]
+    data = switch_data.data()
+    param_names = [p if isinstance(p, str) else p.name for p in params]
+    param_names = [p for p in param_names if p in data]
+
+    # optional files may be missing, in which case there is nothing to patch
+    if not os.path.exists(input_file_path(m, path)):
+        return
+
+    # identify the index columns, which come before the first param column
+    with open(input_file_path(m, path)) as f:
+        headers = f.readline().strip().split(',')
+    index_cols = []
+    for h in headers:
+        if h in param_names:
+            break
+        index_cols.append(h)
+
+    # all rows in the table (rows with '.' for some params are missing from
+    # those params' data)
+    keys = set()
+    for p in param_names:
+        keys.update(data[p].keys())
+
+    def row_value(key, col):
+        if col in index_cols:
+            return (key if isinstance(key, tuple) else (key,))[index_cols.index(col)]
+        else:
+            return data[col].get(key)
+
+    for p in patches:
+        for col in [p['column']] + list(p['where'].keys()):
+            if col not in param_names and not (col in index_cols and col != p['column']):
+                raise ValueError(
+                    'Unable to patch {} in {}: column {} is not a parameter '
+                    'read from this file{}.'.format(
+                        p['column'], path, col,
+                        '' if col == p['column'] else ' or an index column'
+                    )
+                )
+        values = data[p['column']]
+        count = 0
+        for key in keys:
+            # missing values ('.') are left as they are
+            if values.get(key) is None:
+                continue
+            if all(row_value(key, col) in vals for col, vals in p['where'].items()):
+                values[key] = patched_value(p, values[key])
+                count += 1
+        if m.options.verbose:
+            print("Patched {} in {} row(s) of {}.".format(p['column'], count, path))
+
+def input_file_path(m, path):
+    """
+    Return the path of the file that will actually be read for path, taking
+    account of any --input-alias settings.
+    """
+    dir, file = os.path.split(path)
+    for alias in getattr(m.options, 'input_aliases', None) or []:
+        standard, alternative = alias.split('=')
+        if standard == file:
+            return os.path.join(dir, alternative)
+    return path
@@ -66,39 +66,11 @@ TODO:
   (see long printed note below and treatment of Schofield at the end.)
 """
 
-import os, json, collections, argparse
+import os, sys, copy, json, traceback, collections, argparse, multiprocessing
+import numpy as np
 import pandas as pd
-
-parser = argparse.ArgumentParser()
-parser.add_argument('--heco-plan', action='store_true', default=False,
-    help='Setup for HECO plan instead of Switch-optimized')
-# parser.add_argument('--heco-retirements', action='store_true', default=False,
-#     help='Use data in *_heco_retirements instead of *')
-cmd_line_args = parser.parse_args()
-
-if cmd_line_args.heco_plan:
-    base_input_path = lambda *args: os.path.join('inputs_heco', *args)
-    base_output_path = lambda *args: os.path.join('outputs_heco', *args)
-    new_input_path = lambda *args: os.path.join('inputs_annual_heco', *args)
-    new_output_path = lambda *args: os.path.join('outputs_annual_heco', *args)
-# elif cmd_line_args.heco_retirements:
-#     # untested, needs code in get_scenario_data and scenarios.txt to create
-#     # the input and output dirs
-#     base_input_path = lambda *args: os.path.join('inputs_heco_retirements', *args)
-#     base_output_path = lambda *args: os.path.join('outputs_heco_retirements', *args)
-#     new_input_path = lambda *args: os.path.join('inputs_annual_heco_retirements', *args)
-#     new_output_path = lambda *args: os.path.join('outputs_annual_heco_retirements', *args)
-else:
-    base_input_path = lambda *args: os.path.join('inputs', *args)
-    base_output_path = lambda *args: os.path.join('outputs', *args)
-    new_input_path = lambda *args: os.path.join('inputs_annual', *args)
-    new_output_path = lambda *args: os.path.join('outputs_annual', *args)
-
-
-# new_input_path = lambda *args: os.path.join('inputs_2019_2022', *args)
-# new_output_path = lambda *args: os.path.join('outputs_2019_2022', *args)
-if not os.path.exists(new_output_path()):
-    os.makedirs(new_output_path())
+import input_overlay
+import run_scenarios
 
 study_years = list(range(2020, 2050+1))
 # could use actual years from study like below, but some code would need to be
@@ -106,377 +78,190 @@ study_years = list(range(2020, 2050+1))
 # functions
 # study_years = pd.read_csv(new_input_path('periods.csv'))['INVESTMENT_PERIOD'].to_list()
 
-with open(base_output_path('heco_outlook.json')) as f:
-# with open('/tmp/tagged/heco_outlook.json') as f:
-    # print("\n>>>>>>>>>>>>> WARNING: using {}\n".format(f.name))
-    targets = json.load(f)
-
-tech_group_power_targets = targets['tech_group_power_targets'] # existing projects are added later
-tech_group_energy_targets = targets['tech_group_energy_targets']
-techs_for_tech_group = targets['techs_for_tech_group']
-tech_tech_group = targets['tech_tech_group']
-last_definite_target = targets['last_definite_target']
-
-storage_techs = [t for t in techs_for_tech_group.keys() if 'battery' in t.lower()]
-assert sorted(storage_techs)==['Battery_Bulk', 'Battery_Conting', 'Battery_Reg', 'DistBattery'], \
-    'storage techs are not as expected'
-assert all(techs_for_tech_group[t]==[t] for t in storage_techs), \
-    'Code needs to be updated for grouped storage technologies'
-
-# get build and retirement schedule from outputs dir
-# need to get periods, tech, max age, BuildGen, BuildStorageEnergy
-periods = (
-    pd.read_csv(base_input_path('periods.csv'))
-    .rename({'INVESTMENT_PERIOD': 'period'}, axis=1)
-    .set_index('period')
-)
-# TODO: use periods['period_start'] where needed instead of periods themselves
-assert all(periods.index==periods['period_start']), \
-    'New code is needed to use periods with labels that differ from period_start'
-
-build_gen = (
-    pd.read_csv(base_output_path('BuildGen.csv'))
-    .rename({'GEN_BLD_YRS_1': 'gen_proj', 'GEN_BLD_YRS_2': 'bld_yr'}, axis=1)
-    .set_index(['gen_proj', 'bld_yr'])['BuildGen']
-)
-build_storage = (
-    pd.read_csv(base_output_path('BuildStorageEnergy.csv'))
-    .rename({
-        'STORAGE_GEN_BLD_YRS_1': 'gen_proj',
-        'STORAGE_GEN_BLD_YRS_2': 'bld_yr'
-    }, axis=1)
-    .set_index(['gen_proj', 'bld_yr'])['BuildStorageEnergy']
-)
-gen_info = (
-    pd.read_csv(base_input_path('generation_projects_info.csv'))
-    .rename({'GENERATION_PROJECT': 'gen_proj'}, axis=1)
-).set_index('gen_proj')
-gen_info['tech_group'] = gen_info['gen_tech'].map(tech_tech_group)
-gen_info = gen_info[gen_info['tech_group'].notna()]
-existing_techs = (
-    pd.read_csv(base_input_path('gen_build_predetermined.csv'), na_values=['.'])
-    .rename({'GENERATION_PROJECT': 'gen_proj'}, axis=1)
-    .set_index('gen_proj')
-    .join(gen_info, how='inner')
-    .groupby(['build_year', 'tech_group'])[['gen_predetermined_cap', 'gen_predetermined_storage_energy_mwh']].sum()
-    .reset_index()
-)
+# module that selects the HECO plan in scenarios.txt
+heco_plan_module = 'switch_model.hawaii.heco_plan_2020_08'
 
-gen_max_age = gen_info['gen_max_age']
-gen_tech_group = gen_info['tech_group']
-tech_group_max_age = (
-    gen_info.loc[:, ['tech_group', 'gen_max_age']]
-    .drop_duplicates().set_index('tech_group')
-    .iloc[:, 0]
-)
-assert not any(tech_group_max_age.index.duplicated()), \
-    "Some technologies have mixed values for gen_max_age."
-
-gen_min_build_capacity = gen_info['gen_min_build_capacity']
-tech_group_min_build_capacity = (
-    gen_info.loc[:, ['tech_group', 'gen_min_build_capacity']]
-    .drop_duplicates().set_index('tech_group')
-    .iloc[:, 0]
-)
-assert not any(tech_group_min_build_capacity.index.duplicated()), \
-    "Some technologies have mixed values for gen_min_build_capacity."
-
-# append existing techs to targets
-tech_group_power_targets = [
-    [y, t, mw, 'existing']
-    for i, y, t, mw, mwh in existing_techs.itertuples()
-] + tech_group_power_targets
-
-tech_group_energy_targets = [
-    [y, t, mwh, 'existing']
-    for i, y, t, mw, mwh in existing_techs.itertuples()
-    if mwh > 0.0
-] + tech_group_energy_targets
-
-
-# 1. fill in all scheduled builds
-# 2. check for extended retirements and slide forward
-# 3. when to make the outer envelope?
-# **** problem: if generation is expected to retire late and we move it to the
-# correct year (which we must do, since the annual production cost model will
-# not apply the life-extension), then we may create a capacity shortfall for a
-# few years; for now we just assume there will be enough later builds to fill it.
-
-
-# Calculate the capacity level for each tech_group
-
-# set minimum capacity:
-# early years:
-# - existing capacity + HECO outlook (early build and replacements)
-#   - may be more than Switch plan b/c early builds in HECO outlook get
-#     scheduled into next study period
-# later years:
-# - Switch capacity plan
-
-# HECO planned capacity, including pre-existing (may be a little earlier than
-# Switch because Switch groups individual years into the following investment
-# period)
-heco_power_targets = (
-    pd.DataFrame(index=techs_for_tech_group.keys(), columns=study_years)
-    .fillna(0.0)
-)
-heco_energy_targets = (
-    pd.DataFrame(index=storage_techs, columns=study_years)
-    .fillna(0.0)
-)
-for heco_targets, group_targets in [
-    (heco_power_targets, tech_group_power_targets),
-    (heco_energy_targets, tech_group_energy_targets)
-]:
-    for year, tech_group, target, label in group_targets:
-        # year, tech_group, target = tech_group_power_targets[0]
-        first_year = max(year, study_years[0])
-        last_year = min(
-            year + tech_group_max_age[tech_group] - 1,
-            study_years[-1]
-        )
-        try:
-            heco_targets.loc[tech_group, first_year:last_year] += target
-        except:
-            print("ERROR")
-            import pdb; pdb.set_trace()
+# parsed tables, shared by all the scenarios in a batch (see read_table())
+table_cache = {}
 
+def read_table(read, *args, **kwargs):
+    """
+    Return a copy of the table returned by read(*args, **kwargs), reading it
+    only once per process. interpolate_batch() reads all the tables before
+    starting the worker processes, so the workers share them.
+    """
+    key = repr((read.__module__, read.__name__, args, sorted(kwargs.items())))
+    if key not in table_cache:
+        table_cache[key] = read(*args, **kwargs)
+    return copy.deepcopy(table_cache[key])
 
-# Capacity built in optimization model (includes pre-existing capacity)
-switch_power_targets = (
-    pd.DataFrame(index=techs_for_tech_group.keys(), columns=study_years)
-    .fillna(0.0)
-)
-switch_energy_targets = (
-    pd.DataFrame(index=storage_techs, columns=study_years)
-    .fillna(0.0)
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def read_inputs(base_inputs, base_outputs, new_inputs):
+    """
+    Return a dict of all the tables used by interpolate_plan(). The adjusted
+    tables are read in place of the standard ones when the annual model runs,
+    and any overlay is applied to them at that point. So we read the
+    unpatched tables from the new inputs directory to avoid applying the
+    overlay twice.
+    """
+    base_output_path = lambda *args: os.path.join(base_outputs, *args)
+    new_input_path = lambda *args: os.path.join(input_overlay.inputs_dir(new_inputs), *args)
+    return dict(
+        heco_outlook=read_table(read_json, base_output_path('heco_outlook.json')),
+        build_gen=read_table(pd.read_csv, base_output_path('BuildGen.csv')),
+        build_storage=read_table(pd.read_csv, base_output_path('BuildStorageEnergy.csv')),
+        periods=read_table(input_overlay.read_csv, base_inputs, 'periods.csv'),
+        gen_info=read_table(input_overlay.read_csv, base_inputs, 'generation_projects_info.csv'),
+        gen_build_predetermined=read_table(
+            input_overlay.read_csv, base_inputs, 'gen_build_predetermined.csv', na_values=['.']
+        ),
+        new_periods=read_table(pd.read_csv, new_input_path('periods.csv')),
+        new_gen_build_costs=read_table(pd.read_csv, new_input_path('gen_build_costs.csv')),
+        new_gen_build_predetermined=read_table(
+            pd.read_csv, new_input_path('gen_build_predetermined.csv')
+        ),
+        new_generation_projects_info=read_table(
+            pd.read_csv, new_input_path('generation_projects_info.csv')
+        ),
+    )
+
+year_index = {y: i for i, y in enumerate(study_years)}
+
+def online_window(build_year, max_age):
+    """
+    Return the slice of study_years when capacity built in build_year is
+    online (may be empty).
+    """
+    first = max(build_year - study_years[0], 0)
+    last = min(build_year + max_age - study_years[0], len(study_years))
+    return slice(first, max(first, last))
+
+class CapacityOnline(object):
+    """
+    Capacity online in each of study_years for each project and tech group,
+    kept in step with a build dict so capacity in a particular year can be
+    looked up directly instead of summing over all builds. gen_max_age and
+    gen_tech_group are Series giving the life and tech group of each project.
+    If capacity_limit
+    is given (a Series of limits by project), move_build() will reject moves
+    that would put more than this much capacity online in any project.
+    """
+    def __init__(self, build, gen_max_age, gen_tech_group, capacity_limit=None):
+        self.gen_max_age = gen_max_age
+        self.gen_tech_group = gen_tech_group
+        self.capacity_limit = capacity_limit
+        # accumulate all builds in difference arrays (+cap in the build year,
+        # -cap in the retirement year), then convert to capacity online
+        gen_diff = collections.defaultdict(lambda: np.zeros(len(study_years) + 1))
+        for (tech_group, year), d in build.items():
+            for gen, cap in d.items():
+                window = online_window(year, gen_max_age[gen])
+                gen_diff[gen][window.start] += cap
+                gen_diff[gen][window.stop] -= cap
+        self.gen = {g: diff.cumsum()[:-1] for g, diff in gen_diff.items()}
+        self.tech_group = collections.defaultdict(lambda: np.zeros(len(study_years)))
+        for g, online in self.gen.items():
+            self.tech_group[gen_tech_group[g]] += online
+
+    def add(self, gen, change):
+        """ add an array of changes in capacity online to gen """
+        if gen not in self.gen:
+            self.gen[gen] = np.zeros(len(study_years))
+        self.gen[gen] += change
+        self.tech_group[self.gen_tech_group[gen]] += change
+
+    def total(self, tech_group, year):
+        """ capacity online in tech_group in year """
+        return self.tech_group[tech_group][year_index[year]]
+
+# record of one block of construction moved by move_build(); from_year is None
+# for reconstruction added at the end of the study
+Move = collections.namedtuple(
+    'Move', ['gen_proj', 'cap', 'from_year', 'to_year', 'reason']
 )
-for build_info, switch_targets in [
-    (build_gen, switch_power_targets),
-    (build_storage, switch_energy_targets)
-]:
-    for (gen, year), target in build_info.items():
-        # (gen, year), target = list(build_gen.items())[3]
-        # (gen, year), target = list(build_gen.items())[2]
-        # (gen, year), target = list(build_gen.items())[6]
-        if gen not in gen_info.index:
-            # this gen is not in a tech_group, ignore it
-            continue
-        first_year = max(year, study_years[0])
-        last_year = year + gen_max_age[gen] - 1
-        # extend to next period or end of study, as Switch does
-        if last_year < periods.index[-1]:
-            last_year = periods.index[
-                periods.index.get_loc(last_year + 1, method='backfill')
-            ] - 1
-        else:
-            last_year = study_years[-1]
-        switch_targets.loc[gen_tech_group[gen], first_year:last_year] += target
-
-for tdf in [heco_power_targets, heco_energy_targets, switch_power_targets, switch_energy_targets]:
-    tdf.index.name = 'tech_group'
-    tdf.columns.name = 'year'
-
-# use maximum target from each source as the active target
-power_targets = pd.concat([switch_power_targets, heco_power_targets]).max(level=0)
-energy_targets = pd.concat([switch_energy_targets, heco_energy_targets]).max(level=0)
-# power_targets.loc['Battery_Bulk', :]
-# energy_targets.loc['Battery_Bulk', :]
-# switch_power_targets.loc['Battery_Bulk', :]
-# switch_energy_targets.loc['Battery_Bulk', :]
-
-# now need to smooth LargePV, OnshoreWind, OffshoreWind and Battery_Bulk
-# (leave DistPV and DistBattery on current schedule).
-# Then reschedule construction for these techs to match the power_targets.
-# All other techs: follow construction plan given by Switch (with different
-# construction plans or techs it might be necessary to shift reconstruction
-# earlier for techs built in off-years, i.e., pre-existing or built in 2022,
-# with retirement (and rebuilding) on off year)
-
-# interpolate these targets after 2022 to avoid stairsteps;
-# respect minimum chunk size if specified
-interpolate_tech_groups = ['LargePV', 'OnshoreWind', 'OffshoreWind', 'Battery_Bulk']
-min_increment_size = {'OffshoreWind': 100}
-# meet these targets as-is, without interpolation (but adjust from base model
-# to match HECO outlook, which is already interpolated)
-# (It may be possible to eliminate or be sharper about the distinction between
-# interpolate and shift-only tech groups, because we now avoid interpolation
-# anytime there is a specific plan for a tech, as there is for DistPV and
-# DistBattery.)
-print("""
-    WARNING: it is not clear how to handle new thermal capacity in
-    interpolate_construction_plan.py.
-    We create targets based on the HECO and Switch construction schedules
-    (whichever is greater). This includes the extended dates for life of off-
-    year renewable construction (otherwise there would be holes at the end of
-    these lives). Then we shift blocks earlier to match the targets for
-    individual early years. This works OK for renewables because the targets are
-    ascending (i.e., we always rebuild existing renewables and renewables
-    specified in the HECO plan, and Switch generally has ascending amounts of
-    renewables). But there is a problem if this is applied to IC_Schofield,
-    which is built early but not rebuilt. So then the 5-year Switch model has
-    IC_Schofield in 2048-49, (establishing a target in these years), but the
-    annual model does not (since it's not rebuilt). This gives "WARNING: some
-    power targets were missed". We currently avoid this by leaving CC/IC
-    projects out of the non_interpolate_tech_groups. But then there will be a
-    hole if any of them is built in an off year early enough to need rebuilding
-    before 2050 and then rebuilt on a 5-year mark in the 5-year model (e.g., if
-    IC_Schofield is wanted in 2050+). Another solution might be to include these
-    in non_interpolate_tech_groups, but don't report errors if they have
-    decreasing capacity in later years and don't meet the targets (i.e., let
-    them retire before the 5-year mark, just as we do with Kahe, Waiau, etc.).
-    But this could create infeasibility if some other type of thermal capacity
-    was scheduled to take over when one of these retires in the 5-year model,
-    since the online date of the replacement capacity isn't shifted forward.
-    Maybe we should have a super- class of thermal capacity, and move
-    closest-matching new capacity up to fill in the earlier real-world
-    retirement date for Schofield?
-""")
-non_interpolate_tech_groups = [
-    'DistPV', 'DistBattery', 'Battery_Reg', 'Battery_Conting',
-    'CC_152', 'IC_Barge', 'IC_MCBH', 'IC_Schofield'
-]
-# all others will be built as scheduled by the optimization model
-
-# don't interpolate if using HECO plan (just slide to correct start date)
-if cmd_line_args.heco_plan:
-    non_interpolate_tech_groups += interpolate_tech_groups
-    interpolate_tech_groups = []
-
-# only consider relevant technologies
-power_targets = power_targets.loc[
-    interpolate_tech_groups + non_interpolate_tech_groups, :
-]
-
-print("NOTE: interpolating LargePV from 2030 back to 2026, not 2025; there may be a dip in uptake.")
-# raise NotImplementedError(
-#     "May need to interpolate LargePV from 2030 back to 2025, not 2026."
-# )
-# May be able to put the following code at the top of the prev, current loop
-# below, but first check if it's needed (may be easiest just to allow a dip in
-# 2025).
-# # Interpolate 2030 LargePV back to 2025 instead of 2026, to fill in a
-# # dip in the 2025 forecast.
-# if prev==2025 and current==2030:
-#     prev = 2024
-
-for targets in [power_targets, energy_targets]:
-    # make sure targets are increasing (possibly with rounding error)
-    if targets.diff(axis=1).min(axis=1).min() < -1e9:
-        raise ValueError(
-            'This script requires that all targets are increasing from year '
-            'to year. This requirement is not met for {}.'
-            .format(targets.diff(axis=1).min(axis=1).argmin())
-        )
 
-    # drop targets between investment periods after the last fixed target,
-    # then interpolate to create smoothly increasing targets
-    interp_groups = [g for g in interpolate_tech_groups if g in targets.index]
-    for tech_group in interp_groups:
-        for prev, current in zip(periods.index[:-1], periods.index[1:]):
-            # delay interpolation until after any fixed targets, but not beyond
-            # current year
-            prev = min(current - 1, max(prev, last_definite_target.get(tech_group, prev)))
-            # enforce min_increment_size if needed
-            if tech_group in min_increment_size:
-                max_steps = (
-                    targets.loc[tech_group, current]
-                    - targets.loc[tech_group, prev]
-                ) // min_increment_size[tech_group]
-                prev = max(current - max_steps, prev)
-            if current - prev < 2:  # number of steps
-                continue # nothing to interpolate
-
-            # blank out the years that will get interpolated (between prev and
-            # current)
-            targets.loc[tech_group, prev+1:current-1] = float('nan')
-
-            # This is where the interpolation happens:
-            # capacity targets have been set for years where applicable, with
-            # nans in between. Now we interpolate intermediate capacity targets to
-            # replace those nans. Later, construction each year will be adjusted to
-            # meet these target annual capacity levels.
-            targets.loc[tech_group, :] = targets.loc[tech_group, :].interpolate()
-
-# adjust construction plans to meet targets
-# To increase construction in early year:
-# - go through net capacity increases in next period (capacity built minus capacity retired > 0)
-#   - move some or all of the new build up to the current year
-#   - cascade to retirement year, moving up to the same amount of (re)build forward to close gap
-#   - keep cascading (with possibly diminishing block size) until end of study
-#   - this can only decrease, not increase, capacity online in a particular project
-#     in any future year
-# - repeat until interim year is filled
-
-# Find additions and retirements in Switch in each period, taking account of the
-# life-extensions used in the optimization model.
-# Then slide the end points forward to eliminate the life extensions (because
-# those won't be used in the production cost model).
-# Then slide excess capacity forward as needed to meet the targets.
-
-def move_build(build, gen_proj, cap, from_year, to_year):
-    """
-    Move construction of cap MW of gen_proj from from_year to to_year,
-    also moving any reconstructions of the same or less capacity currently
-    scheduled for the retirement year.
+def plan_cascade(build, online, gen_proj, cap, from_year, to_year, reason):
+    """
+    Return a list of Move records needed to move construction of cap MW of
+    gen_proj from from_year to to_year, also moving any reconstructions of the
+    same or less capacity currently scheduled for the retirement year, and so
+    on until the end of the study. build is not changed.
+
+    Each step only reads build in its own from_year, which is not changed by
+    earlier steps, so the whole cascade can be planned before applying it.
+    """
+    tech_group = online.gen_tech_group[gen_proj]
+    shift = to_year - from_year
+    age = online.gen_max_age[gen_proj]
+    moves = []
+    while cap > 0:
+        moves.append(Move(gen_proj, cap, from_year, to_year, reason))
+        retire_year = from_year + age
+        new_retire_year = retire_year + shift
+        if retire_year <= study_years[-1]:
+            # how much of this was scheduled to be rebuilt in the original
+            # retirement year? (move that amount up to the new retirement year)
+            cap = min(cap, build.get((tech_group, retire_year), {}).get(gen_proj, 0.0))
+            from_year, to_year, reason = retire_year, new_retire_year, 'cascade'
+        else:
+            if new_retire_year <= study_years[-1]:
+                # reconstruct projects that have been moved earlier, creating
+                # gaps at the end of the study
+                moves.append(Move(gen_proj, cap, None, new_retire_year, 'rebuild'))
+            break
+    return moves
+
+def move_build(build, online, requests, reason):
+    """
+    Move blocks of construction in build, updating online (a CapacityOnline
+    object) to match. requests is a list of (gen_proj, cap, from_year,
+    to_year) tuples, which are applied in order, each with its cascade of
+    reconstructions (see plan_cascade()). Raises ValueError if any move would
+    exceed the capacity limit for the project. Returns a list of Move records
+    for all the changes made.
 
-    gen_proj = 'Oahu_Battery_Bulk'
     tech_group = 'Battery_Bulk'
-    cap = 75
-    from_year = 2020
-    to_year = from_year - 3
+    gen_proj = 'Oahu_Battery_Bulk'
     build = collections.defaultdict(lambda: collections.defaultdict(float))
-    build[tech_group, from_year][gen_proj] = 100
-    build[tech_group, from_year+gen_max_age[gen_proj]][gen_proj] = 50
-
-    move_build(build, gen_proj, cap, from_year, to_year)
-
-    defaultdict(<function __main__.<lambda>()>,
-            {('Battery_Bulk', 2020): defaultdict(float,
-                         {'Oahu_Battery_Bulk': 25}),
-             ('Battery_Bulk', 2035): defaultdict(float,
-                         {'Oahu_Battery_Bulk': 0}),
-             ('Battery_Bulk', 2017): defaultdict(float,
-                         {'Oahu_Battery_Bulk': 75.0}),
-             ('Battery_Bulk', 2032): defaultdict(float,
-                         {'Oahu_Battery_Bulk': 50.0})})
-
-    # 2032 capacity will retire in 2047; shift to 2030 and get some rebuild
-    move_build(build, gen_proj, 30, 2032, 2030)
-    defaultdict(<function __main__.<lambda>()>,
-                {('Battery_Bulk', 2020): defaultdict(float,
-                             {'Oahu_Battery_Bulk': 25}),
-                 ('Battery_Bulk', 2035): defaultdict(float,
-                             {'Oahu_Battery_Bulk': 0}),
-                 ('Battery_Bulk', 2017): defaultdict(float,
-                             {'Oahu_Battery_Bulk': 75.0}),
-                 ('Battery_Bulk', 2032): defaultdict(float,
-                             {'Oahu_Battery_Bulk': 20.0}),
-                 ('Battery_Bulk', 2030): defaultdict(float,
-                             {'Oahu_Battery_Bulk': 30.0}),
-                 ('Battery_Bulk', 2045): defaultdict(float,
-                             {'Oahu_Battery_Bulk': 30.0})})
-    """
-    tech_group = gen_tech_group[gen_proj]
-    retire_year = from_year + gen_max_age[gen_proj]
-    new_retire_year = retire_year + (to_year - from_year)
-    build[tech_group, from_year][gen_proj] -= cap
-    build[tech_group, to_year][gen_proj] += cap
-    if retire_year <= study_years[-1]:
-        # how much of this was scheduled to be rebuilt in the original
-        # retirement year?
-        cascade_cap = min(cap, build[tech_group, retire_year][gen_proj])
-        # move that amount up to the new retirement year
-        move_build(build, gen_proj, cascade_cap, retire_year, new_retire_year)
-    elif new_retire_year <= study_years[-1]:
-        # reconstruct projects that have been moved earlier, creating gaps at
-        # the end of the study
-        build[tech_group, new_retire_year][gen_proj] += cap
-    print(
-        "Moved {} units of {} from {} to {}."
-        .format(cap, gen_proj, from_year, to_year)
-    )
-    return build
+    build[tech_group, 2020][gen_proj] = 100
+    build[tech_group, 2020+gen_max_age[gen_proj]][gen_proj] = 50
+    online = CapacityOnline(build, gen_max_age, gen_tech_group)
+    move_build(build, online, [(gen_proj, 75, 2020, 2017)], 'test')
+
+    [Move(gen_proj='Oahu_Battery_Bulk', cap=75, from_year=2020, to_year=2017, reason='test'),
+     Move(gen_proj='Oahu_Battery_Bulk', cap=50, from_year=2035, to_year=2032, reason='cascade')]
+    """
+    log = []
+    for gen_proj, cap, from_year, to_year in requests:
+        moves = plan_cascade(build, online, gen_proj, cap, from_year, to_year, reason)
+        age = online.gen_max_age[gen_proj]
+        change = np.zeros(len(study_years))
+        for m in moves:
+            if m.from_year is not None:
+                change[online_window(m.from_year, age)] -= m.cap
+            change[online_window(m.to_year, age)] += m.cap
+        if online.capacity_limit is not None:
+            limit = online.capacity_limit[gen_proj]
+            current = online.gen.get(gen_proj, 0.0)
+            if not pd.isnull(limit) and (
+                (change > 0) & (current + change > limit + 0.00001)
+            ).any():
+                raise ValueError(
+                    'Moving {} units of {} from {} to {} would exceed its '
+                    'capacity limit of {}.'
+                    .format(cap, gen_proj, from_year, to_year, limit)
+                )
+        tech_group = online.gen_tech_group[gen_proj]
+        for m in moves:
+            if m.from_year is not None:
+                build[tech_group, m.from_year][gen_proj] -= m.cap
+            build[tech_group, m.to_year][gen_proj] += m.cap
+        online.add(gen_proj, change)
+        log.extend(moves)
+    return log
 
 def clean_build_dict(build):
     """ strip out zero-value records from the build dict """
@@ -487,226 +272,67 @@ def clean_build_dict(build):
         if not d:
             del build[k]
 
-# store by proj, but later need to find all projects in a particular
-# tech_group that have capacity available in a particular year, so structure
-# should be
-# build = {(tech_group, year): {gen1: amt, gen2: amt, ...}, ...}
-# retire = check build[tech_group, year-max_age][gen1]
-# To update: set build[tech_group, year][gen1]
-build_gen_dict = collections.defaultdict(lambda: collections.defaultdict(float))
-build_storage_dict = collections.defaultdict(lambda: collections.defaultdict(float))
-for (gen, year), cap in build_gen.items():
-    if gen in gen_info.index and cap > 0:
-        build_gen_dict[gen_tech_group[gen], year][gen] += cap
-for (gen, year), cap in build_storage.items():
-    if gen in gen_info.index and cap > 0:
-        build_storage_dict[gen_tech_group[gen], year][gen] += cap
-
-for build, build_targets in [
-    (build_gen_dict, power_targets),
-    (build_storage_dict, energy_targets)
-]:
-    # Find mid-period retirements and shift the subsequent reconstruction earlier
-    to_fix = []  # tuple of gen_proj, capacity, old build date, new build date
-    for prev_period, cur_period in zip(periods.index[:-1], periods.index[1:]):
-        for gen in gen_info.index:
-            # prev_period = 2040; cur_period = 2045; gen = 'Oahu_OnshoreWind_OnWind_Kahuku'; y = 2011
-            age = gen_max_age[gen]
-            tech_group = gen_tech_group[gen]
-            # build years that could have had service extended to this period
-            ext_build_years = list(range(prev_period - age + 1, cur_period - age))
-            shiftable_cap = build[tech_group, cur_period][gen]
-            for y in ext_build_years:
-                if shiftable_cap == 0:
-                    break # no possibility of shifting any more
-                shift_cap = min(build[tech_group, y][gen], shiftable_cap)
-                if shift_cap > 0:
-                    # shift this much capacity from current period to correct rebuild year
-                    to_fix.append((gen, shift_cap, cur_period, y+age))
-                    # update tally of remaining shiftable capacity
-                    shiftable_cap -= shift_cap
-    clean_build_dict(build)
-
-    # update build plan as needed (must start at latest build date so those get
-    # attached to the previous build and then move earlier when that gets moved up)
-    for gen, cap, from_year, to_year in sorted(to_fix, key=lambda x: x[2], reverse=True):
-        move_build(build, gen, cap, from_year, to_year)
-
-    # update to meet target...
-    # tech_group = 'LargePV'; target_year = 2020; target_cap = 175.69; age = 30
-
-    for tech_group, targets in build_targets.iterrows():
-        age = tech_group_max_age[tech_group]
-        for target_year, target_cap in targets.items():
-            actual_cap = sum(
-                sum(d.values())
-                for (tg, y), d in build.items()
-                if tg == tech_group and y <= target_year < y + age
-            )
-            if actual_cap > target_cap + 1e-9:
-                print(
-                    "WARNING: installed {} capacity in {} is "
-                    "{}, which exceeds target of {}."
-                    .format(tech_group, target_year, actual_cap, target_cap)
-                )
-            # elif actual_cap == target_cap:
-            #     print(
-            #         "installed {} capacity in {} is {}, which equals the target."
-            #         .format(tech_group, target_year, actual_cap)
-            #     )
-            elif actual_cap < target_cap - 1e9:
-                print(
-                    "installed {} capacity in {} is "
-                    "{}, which is below target of {}."
-                    .format(tech_group, target_year, actual_cap, target_cap)
-                )
-
-            # find later installations (not reconstructions) in this tech_group
-            # and shift them earlier
-            for year in range(target_year+1, study_years[-1]+1):
-                for gen, cap in build[tech_group, year].items():
-                    if actual_cap >= target_cap:
-                        break  # finished adjusting
-                    cap_added = cap - build[tech_group, year-gen_max_age[gen]][gen]
-                    if cap_added > 0:
-                        shift_cap = min(cap_added, target_cap-actual_cap)
-                        move_build(build, gen, shift_cap, year, target_year)
-                        actual_cap += shift_cap
-    clean_build_dict(build)
-
-# export as predetermined build schedule for an extensive model (could instead
-# be done for multiple one-year models)
-# set a predetermined value for all possible build years
-build_costs = (
-    pd.read_csv(new_input_path('gen_build_costs.csv'))
-    .set_index(['GENERATION_PROJECT', 'build_year'])
-)
-gen_build_predetermined = (
-    pd.read_csv(new_input_path('gen_build_predetermined.csv'))
-    .set_index(['GENERATION_PROJECT', 'build_year'])
-    .reindex(build_costs.index)  # set a value for every possible build year
-    .fillna(0.0)
-)
-gen_build_predetermined['gen_predetermined_storage_energy_mwh'] = float('nan')
-
-# start with original construction plan
-for (gen, year), cap in build_gen.items():
-    gen_build_predetermined.loc[(gen, year), 'gen_predetermined_cap'] = cap
-for (gen, year), cap in build_storage.items():
-    gen_build_predetermined.loc[(gen, year), 'gen_predetermined_storage_energy_mwh'] = cap
-# update interpolated projects
-for gen, tech_group in gen_tech_group.items():
-    for year in study_years:
-        cap = build_gen_dict[tech_group, year][gen]
-        gen_build_predetermined.loc[(gen, year), 'gen_predetermined_cap'] = cap
-        if tech_group in storage_techs:
-            gen_build_predetermined.loc[(gen, year), 'gen_predetermined_storage_energy_mwh'] \
-            = build_storage_dict[tech_group, year][gen]
-
-# gen_build_predetermined.loc['Oahu_Battery_Bulk', :]
-# build_storage['Oahu_Battery_Bulk']
-# build_gen['Oahu_Battery_Bulk']
-# sorted([(y, b) for ((t, y), b) in build_gen_dict.items() if t == 'LargePV' and y <= 2020])
-# sorted([(y, c) for (p, y), c in build_gen.iteritems() if 'TrackingPV' in p and y <= 2020])
-# sorted((year, power_cap) for (gen, year), (power_cap, energy_cap) in gen_build_predetermined.iterrows() if 'TrackingPV' in gen and year <= 2020)
-
-# check that we're actually hitting the targets
-power_online = power_targets.copy()
-power_online.loc[:, :] = 0.0
-energy_online = energy_targets.copy()
-energy_online.loc[:, :] = 0.0
-for (gen, year), (power_cap, energy_cap) in gen_build_predetermined.iterrows():
-    tech_group = gen_tech_group.get(gen, None)
-    if tech_group in power_online.index:
-        power_online.loc[tech_group, year:year+gen_max_age[gen]-1] += power_cap
-    if tech_group in energy_online.index:
-        energy_online.loc[tech_group, year:year+gen_max_age[gen]-1] += energy_cap
-if (power_online - power_targets).abs().max().max() > 0.001:
-    print("\nWARNING: some power targets were missed\n")
-if (energy_online - energy_targets).abs().max().max() > 0.001:
-    print("\nWARNING: some energy targets were missed\n")
-
-# pd.DataFrame({'online': power_online.loc['LargePV', :], 'target': power_targets.loc['LargePV', :]})
-# gen_build_predetermined
-
-# # check that there's never excess development
-# gen_cap_online = pd.DataFrame(index=gen_info.index, columns=study_years).fillna(0.0)
-# for (gen, year), (power_cap, energy_cap) in gen_build_predetermined.iterrows():
-#     if gen in gen_cap_online.index:
-#         gen_cap_online.loc[gen, year:year+gen_max_age[gen]-1] += power_cap
-# assert gen_cap_online.sub(gen_info['gen_capacity_limit_mw'], axis=0).max().max() < 0.000000001, "some capacity limits were exceeded"
-# max is 5.6e-14, which should be within rounding error
-
-# trim any minor excess development; report major errors
-for (gen, year), (power_cap, energy_cap) in gen_build_predetermined.iterrows():
-    if gen in gen_max_age:
-        cap_online = (
-            gen_build_predetermined
-            .sort_index()
-            .loc[(gen, slice(year-gen_max_age[gen]+1, year)), 'gen_predetermined_cap']
-            .sum()
-        )
-        max_cap = gen_info.loc[gen, 'gen_capacity_limit_mw']
-        excess_cap = cap_online - max_cap
-        if excess_cap > 0.00001:
-            raise ValueError(
-                'Excess capacity scheduled for {} in {}: {} > {}.'
-                .format(gen, year, cap_online, max_cap)
-            )
-        elif excess_cap > 0:
-            # make a small adjustment
-            gen_build_predetermined.loc[(gen, year), 'gen_predetermined_cap'] \
-                -= excess_cap
-            print(
-                'Reduced construction of {} in {} from {} to {}.'
-                .format(gen, year, power_cap, power_cap-excess_cap)
-            )
+def build_series(build):
+    """ convert a build dict into a Series of capacity indexed by (gen, year) """
+    return pd.Series(
+        [cap for d in build.values() for cap in d.values()],
+        index=pd.MultiIndex.from_tuples(
+            [(gen, year) for (tech_group, year), d in build.items() for gen in d]
+        ),
+        dtype=float
+    )
 
-# zero out any tiny values (positive or negative)
-for c in ['gen_predetermined_cap', 'gen_predetermined_storage_energy_mwh']:
-    gen_build_predetermined.loc[
-        gen_build_predetermined[c].abs() < 1e-9,
-        'gen_predetermined_cap'
-    ] = 0
-
-
-####################
-# create capacity_additions_table.csv, showing all additions in
-# an easy-to-read form
-
-plans = pd.DataFrame()
-for col, cap_type, targets in [
-    (0, 'power', tech_group_power_targets),
-    (1, 'energy', tech_group_energy_targets)
-]:
-    built_dict = collections.defaultdict(float)
-    for (gen, year), build_cols in gen_build_predetermined.iterrows():
-        tech_group = gen_tech_group.get(gen, gen[5:] if gen.startswith('Oahu_') else gen)
-        built_dict[year, tech_group] += build_cols[col]
-    built = pd.Series(built_dict)
-    built.index.names = ['year', 'tech_group']
-    plan = pd.DataFrame.from_records(
-        targets, columns=['year', 'tech_group', 'capacity', 'label']
-    ).groupby(['year', 'tech_group', 'label']).sum()
-    planned_built = (
-        plan.groupby(['year', 'tech_group'])['capacity'].sum()
-        .reindex(built.index)
-        .fillna(0.0)
+def window_totals(keys, start_years, end_years, amounts, years):
+    """
+    Return a DataFrame with a row for each distinct value in keys and a column
+    for each of years (consecutive), showing the total of the amounts for that
+    key that are in service from start_years up to (but not including)
+    end_years. This is a convolution of the amounts added each year with
+    their service windows, done with difference arrays.
+    """
+    rows, labels = pd.factorize(keys)
+    amounts = np.asarray(amounts, dtype=float)
+    # add each amount in its start year and remove it in its end year, then
+    # accumulate over years
+    first = np.clip(np.asarray(start_years) - years[0], 0, len(years))
+    last = np.clip(np.asarray(end_years) - years[0], first, len(years))
+    diff = np.zeros((len(labels), len(years) + 1))
+    np.add.at(diff, (rows, first), amounts)
+    np.add.at(diff, (rows, last), -amounts)
+    return pd.DataFrame(diff.cumsum(axis=1)[:, :-1], index=labels, columns=years)
+
+def capacity_online(builds, years, gen_max_age):
+    """
+    Return a DataFrame of capacity online in each of years (consecutive) for
+    each project, given a Series of construction indexed by (gen, build_year)
+    and a Series of project lives. Projects without a gen_max_age are ignored.
+    """
+    builds = builds[builds.index.get_level_values(0).isin(gen_max_age.index)]
+    gens = builds.index.get_level_values(0)
+    build_years = builds.index.get_level_values(1).values
+    return window_totals(
+        gens, build_years, build_years + gen_max_age[gens].values, builds.values, years
     )
-    switch_built = built - planned_built
-    planned_built[(2030, 'OnshoreWind')]
-    switch_built[switch_built.abs() < 1e-9] = 0.0
-    switch_plan = switch_built.to_frame(name='capacity')
-    # switch_plan.loc[(2029, 'OnshoreWind'), :]
-    switch_plan['label'] = 'Switch'
-    switch_plan = switch_plan.set_index('label', append=True)
-    # switch_plan.loc[(2029, 'OnshoreWind', 'Switch'), :]
-    plan = plan.append(switch_plan)
-    # plan.loc[(2029, 'OnshoreWind', 'Switch'), :]
-    plans[cap_type] = plan['capacity']
-    # plans.loc[(2029, 'OnshoreWind', 'Switch'), :]
 
-# plans.loc[(2029, 'OnshoreWind', 'Switch'), :]
+def extended_retirement_years(retire_years, period_starts):
+    """
+    Return the year when capacity scheduled to retire in each of retire_years
+    actually retires in the optimization model, which extends service to the
+    start of the next period or the end of the study.
+    """
+    retire_years = np.asarray(retire_years)
+    if len(retire_years) == 0:
+        return retire_years
+    # lookup table covering all the retirement years
+    lookup_years = np.arange(retire_years.min(), retire_years.max() + 1)
+    period_starts = np.asarray(period_starts)
+    next_period = period_starts[
+        np.minimum(np.searchsorted(period_starts, lookup_years), len(period_starts) - 1)
+    ]
+    extended = np.where(
+        lookup_years <= period_starts[-1], next_period, study_years[-1] + 1
+    )
+    return extended[retire_years - lookup_years[0]]
 
 def capacity_str(r):
     out = '{:.1f}'.format(r['power'])
@@ -719,76 +345,897 @@ def capacity_str(r):
     out += '\n({})'.format(r['label'])
     return out
 
-# TODO:
-# existing thermal capacity is labeled as Switch additions
-# may want to show retirements in addition to construction? (not for now, would
-# require first approach below to fit in all the thermal plants)
+# expected storage tech groups (each with a single technology)
+expected_storage_techs = ['Battery_Bulk', 'Battery_Conting', 'Battery_Reg', 'DistBattery']
+check_file = 'plan_checks.csv'
+check_columns = ['check', 'severity', 'item', 'year', 'value', 'limit']
 
-plan_tab = plans.reset_index().query(
-    'year >= 2020 and (power > 0 or energy > 0) '
-    'and not label.str.startswith("rebuild")'
-)
-plan_tab['capacity'] = plan_tab.apply(capacity_str, axis=1)
-# plan_tab.loc[(2029, 'OnshoreWind'), :]
-plan_tab = plan_tab.groupby(['year', 'tech_group'])['capacity'].agg(lambda x: '\n'.join(x))
-# plan_tab.loc[(2029, 'OnshoreWind'), :]
-plan_tab = plan_tab.unstack(['tech_group']).fillna('').sort_index(axis=0).sort_index(axis=1)
-# plan_tab.loc[2029, 'OnshoreWind']
-plan_tab = plan_tab.reindex(['LargePV', 'Battery_Bulk', 'DistPV', 'DistBattery', 'OnshoreWind', 'OffshoreWind'], axis=1)
-plan_tab.columns = ['Large PV', 'Large Battery', 'Dist PV', 'Dist Battery', 'Onshore Wind', 'Offshore Wind']
-plan_tab.to_csv(new_output_path('capacity_additions_table.csv'))
-
-print("\n\nNeed to add pumped storage to capacity_additions_table.csv manually.")
-print("Need to remove rebuilds of Switch-selected assets from capacity_additions_table.csv manually. (should really fix this in code)\n")
-
-# from IPython.display import display, HTML
-# display(HTML(plan_tab.to_html().replace("\\n","<br>")))
-
-# done with capacity_additions_table.csv
-###################
-
-# if annual study is short, we don't want to create extra rows
-last_period = pd.read_csv(new_input_path('periods.csv'))['INVESTMENT_PERIOD'].max()
-
-# Save "adjusted" version of input file; we don't save on top of the original
-# in case we need to run this again, re-reading from the original.
-gen_build_predetermined.query('build_year <= {}'.format(last_period)).to_csv(
-    new_input_path('gen_build_predetermined_adjusted.csv'),
-    na_rep='.'
-)
+def check_rows(check, severity, failed, value, limit=float('nan')):
+    """
+    Return a DataFrame of check report rows for the entries where failed is
+    True. failed, value and limit can be DataFrames with items as rows and
+    years as columns, or Series indexed by item; limit can also be a scalar.
+    """
+    if isinstance(failed, pd.DataFrame):
+        failed, value = failed.stack(), value.stack()
+        if isinstance(limit, pd.DataFrame):
+            limit = limit.stack()
+    failed = failed[failed.astype(bool)]
+    index = failed.index
+    return pd.DataFrame(collections.OrderedDict([
+        ('check', check),
+        ('severity', severity),
+        ('item', index.get_level_values(0)),
+        ('year', index.get_level_values(1) if index.nlevels > 1 else None),
+        ('value', value.reindex(index).values),
+        ('limit', limit.reindex(index).values if isinstance(limit, pd.Series) else limit),
+    ]), columns=check_columns)
+
+def check_inputs(gen_info, techs_for_tech_group, storage_techs, periods):
+    """
+    Return a report of any problems with the inputs that the interpolation
+    code doesn't support.
+    """
+    tech_groups = gen_info.groupby('tech_group')
+    storage_groups = pd.Series({t: techs_for_tech_group[t] for t in storage_techs}, dtype=object)
+    return pd.concat([
+        check_rows(
+            'storage_techs', 'error',
+            pd.Series({'storage techs': sorted(storage_techs) != expected_storage_techs}),
+            pd.Series({'storage techs': ' '.join(sorted(storage_techs))}),
+            ' '.join(expected_storage_techs)
+        ),
+        check_rows(
+            'grouped_storage_techs', 'error',
+            storage_groups.index.to_series() != storage_groups.map(' '.join),
+            storage_groups.map(' '.join)
+        ),
+        check_rows(
+            'period_labels', 'error',
+            pd.Series(periods.index != periods['period_start'], index=periods.index),
+            periods['period_start']
+        ),
+        check_rows(
+            'mixed_gen_max_age', 'error',
+            tech_groups['gen_max_age'].nunique(dropna=False) > 1,
+            tech_groups['gen_max_age'].nunique(dropna=False), 1
+        ),
+        check_rows(
+            'mixed_gen_min_build_capacity', 'error',
+            tech_groups['gen_min_build_capacity'].nunique(dropna=False) > 1,
+            tech_groups['gen_min_build_capacity'].nunique(dropna=False), 1
+        ),
+    ], ignore_index=True)
+
+def check_plan(
+    gen_build_predetermined, power_targets, energy_targets,
+    gen_max_age, gen_tech_group, capacity_limit, storage_gens
+):
+    """
+    Return a report of any problems with the final construction plan, checking
+    every tech group, project and year at once.
+    """
+    power_cap = gen_build_predetermined['gen_predetermined_cap']
+    energy_cap = gen_build_predetermined['gen_predetermined_storage_energy_mwh']
+    report = []
+    for cap_type, cap, targets in [
+        ('power', power_cap, power_targets), ('energy', energy_cap.fillna(0.0), energy_targets)
+    ]:
+        online = (
+            capacity_online(cap, study_years, gen_max_age)
+            .groupby(gen_tech_group).sum()
+            .reindex(targets.index, fill_value=0.0)
+        )
+        previous = targets.shift(axis=1)
+        report.extend([
+            check_rows(
+                cap_type + '_target_decreases', 'warning',
+                targets < previous - 1e-9, targets, previous
+            ),
+            check_rows(
+                cap_type + '_target_missed', 'warning',
+                online < targets - 0.001, online, targets
+            ),
+            check_rows(
+                cap_type + '_target_exceeded', 'warning',
+                online > targets + 0.001, online, targets
+            ),
+        ])
+
+    # capacity online for each project in every year of the plan, compared to
+    # its limit
+    plan_years = gen_build_predetermined.index.get_level_values(1)
+    gen_cap_online = capacity_online(
+        power_cap, list(range(plan_years.min(), plan_years.max() + 1)), gen_max_age
+    )
+    gen_limit = pd.DataFrame(
+        np.repeat(
+            capacity_limit.reindex(gen_cap_online.index).values[:, np.newaxis],
+            gen_cap_online.shape[1], axis=1
+        ),
+        index=gen_cap_online.index, columns=gen_cap_online.columns
+    )
+    report.append(check_rows(
+        'excess_capacity', 'error',
+        gen_cap_online > gen_limit + 0.00001, gen_cap_online, gen_limit
+    ))
+
+    # storage energy is only built for storage projects, no construction is
+    # negative and storage projects never have energy online without power
+    # capacity to use it
+    report.extend([
+        check_rows(
+            'negative_power', 'error', power_cap < -1e-9, power_cap, 0.0
+        ),
+        check_rows(
+            'negative_energy', 'error', energy_cap < -1e-9, energy_cap, 0.0
+        ),
+        check_rows(
+            'energy_for_non_storage', 'error',
+            energy_cap.notnull() & ~energy_cap.index.get_level_values(0).isin(storage_gens),
+            energy_cap
+        ),
+    ])
+    storage_power_online = (
+        capacity_online(power_cap, study_years, gen_max_age)
+        .reindex(storage_gens, fill_value=0.0)
+    )
+    storage_energy_online = (
+        capacity_online(energy_cap.fillna(0.0), study_years, gen_max_age)
+        .reindex(storage_gens, fill_value=0.0)
+    )
+    report.append(check_rows(
+        'energy_without_power', 'error',
+        (storage_energy_online > 1e-6) & (storage_power_online <= 1e-6),
+        storage_energy_online, storage_power_online
+    ))
+    return pd.concat(report, ignore_index=True)
+
+def report_checks(report, path):
+    """
+    Save the check report in path and print a summary. Raises ValueError if
+    there are any errors.
+    """
+    report.to_csv(path, index=False)
+    counts = report.groupby(['severity', 'check']).size()
+    if len(report):
+        print("Construction plan checks found problems (see {}):".format(path))
+        for (severity, check), n in counts.items():
+            print("    {}: {} ({} cases)".format(severity, check, n))
+    errors = report[report['severity'] == 'error']
+    if len(errors):
+        raise ValueError(
+            'Construction plan failed checks: {}. See {} for details.'
+            .format(', '.join(errors['check'].unique()), path)
+        )
 
-# Save generation_project_info_adjusted.csv with gen_min_build_capacity
-# set to min_increment_size or '.' for interpolated projects. This allows
-# interpolation of projects with large minimum size per period into smaller
-# chunks over a few years.
-generation_projects_info = (
-    pd.read_csv(new_input_path('generation_projects_info.csv'))
-    .set_index('gen_tech', drop=False)
-)
-# this previously only considered techs in interpolate_tech_groups, but that
-# creates some inconsistency between the HECO plan (where no techs are
-# interpolated) and the Switch plan. But it's possible the HECO plan includes
-# subblocks in adjacent years that add up to match a normal block size when
-# the 5-year model is run, but would fail when the annual model is run. So we
-# now adjust the minimum size whether a tech can be interpolated or not.
-for tg, min_size in min_increment_size.items():
-    if tg in techs_for_tech_group:
-        for tech in techs_for_tech_group[tg]:
-            if tech in generation_projects_info.index:
-                generation_projects_info.loc[tech, 'gen_min_build_capacity'] = min_size
-# Also extend the life of Schofield when using the standard plan. This was built
-# in 2018 and has a 30 year life, so Switch assumes it will last until a 5-year
-# mark during the optimization phase and doesn't add capacity to fill the gap in
-# the last 2 years. This can cause infeasibility.
-# TODO: generalize this, i.e., extend all thermal plants to the even-year mark
-# (it may be better to slide subsequent rebuilds forward if they exist).
-# TODO: also apply this to the HECO Plan (not as urgent because it has excess
-# thermal capacity).
-if not cmd_line_args.heco_plan:
-    print("Updating IC_Schofield life to 32 years.")
-    generation_projects_info.loc['IC_Schofield', 'gen_max_age'] = 32
-
-generation_projects_info.to_csv(
-    new_input_path('generation_projects_info_adjusted.csv'),
-    na_rep='.', index=False
-)
+def interpolate_plan(
+    base_inputs='inputs', base_outputs='outputs',
+    new_inputs='inputs_annual', new_outputs='outputs_annual',
+    adjusted_suffix='_adjusted', heco_plan=False
+):
+    """
+    Interpolate the construction plan from the model solved with inputs from
+    base_inputs and results in base_outputs, for use with the annual inputs in
+    new_inputs. Tables and reports are saved in new_outputs, and the adjusted
+    gen_build_predetermined and generation_projects_info tables are saved in
+    the new inputs directory with adjusted_suffix added to their names.
+    base_inputs and new_inputs can be inputs directories or overlay files (see
+    input_overlay.py). Use heco_plan=True to slide the HECO plan to the correct
+    start dates without interpolating it.
+
+    Returns the adjusted gen_build_predetermined table.
+    """
+    new_input_path = lambda *args: os.path.join(input_overlay.inputs_dir(new_inputs), *args)
+    new_output_path = lambda *args: os.path.join(new_outputs, *args)
+    if not os.path.exists(new_output_path()):
+        os.makedirs(new_output_path())
+
+    tables = read_inputs(base_inputs, base_outputs, new_inputs)
+    targets = tables['heco_outlook']
+
+    tech_group_power_targets = targets['tech_group_power_targets'] # existing projects are added later
+    tech_group_energy_targets = targets['tech_group_energy_targets']
+    techs_for_tech_group = targets['techs_for_tech_group']
+    tech_tech_group = targets['tech_tech_group']
+    last_definite_target = targets['last_definite_target']
+
+    storage_techs = [t for t in techs_for_tech_group.keys() if 'battery' in t.lower()]
+
+    # get build and retirement schedule from outputs dir
+    # need to get periods, tech, max age, BuildGen, BuildStorageEnergy
+    periods = (
+        tables['periods']
+        .rename({'INVESTMENT_PERIOD': 'period'}, axis=1)
+        .set_index('period')
+    )
+    # TODO: use periods['period_start'] where needed instead of periods themselves
+    # (check_inputs() verifies that these are the same)
+
+    build_gen = (
+        tables['build_gen']
+        .rename({'GEN_BLD_YRS_1': 'gen_proj', 'GEN_BLD_YRS_2': 'bld_yr'}, axis=1)
+        .set_index(['gen_proj', 'bld_yr'])['BuildGen']
+    )
+    build_storage = (
+        tables['build_storage']
+        .rename({
+            'STORAGE_GEN_BLD_YRS_1': 'gen_proj',
+            'STORAGE_GEN_BLD_YRS_2': 'bld_yr'
+        }, axis=1)
+        .set_index(['gen_proj', 'bld_yr'])['BuildStorageEnergy']
+    )
+    gen_info = (
+        tables['gen_info']
+        .rename({'GENERATION_PROJECT': 'gen_proj'}, axis=1)
+    ).set_index('gen_proj')
+    gen_info['tech_group'] = gen_info['gen_tech'].map(tech_tech_group)
+    gen_info = gen_info[gen_info['tech_group'].notna()]
+    existing_techs = (
+        tables['gen_build_predetermined']
+        .rename({'GENERATION_PROJECT': 'gen_proj'}, axis=1)
+        .set_index('gen_proj')
+        .join(gen_info, how='inner')
+        .groupby(['build_year', 'tech_group'])[['gen_predetermined_cap', 'gen_predetermined_storage_energy_mwh']].sum()
+        .reset_index()
+    )
+
+    # stop now if the inputs have features this code can't handle
+    check_report = check_inputs(gen_info, techs_for_tech_group, storage_techs, periods)
+    if len(check_report):
+        report_checks(check_report, new_output_path(check_file))
+
+    gen_max_age = gen_info['gen_max_age']
+    gen_tech_group = gen_info['tech_group']
+    tech_group_max_age = (
+        gen_info.loc[:, ['tech_group', 'gen_max_age']]
+        .drop_duplicates().set_index('tech_group')
+        .iloc[:, 0]
+    )
+
+    gen_min_build_capacity = gen_info['gen_min_build_capacity']
+    tech_group_min_build_capacity = (
+        gen_info.loc[:, ['tech_group', 'gen_min_build_capacity']]
+        .drop_duplicates().set_index('tech_group')
+        .iloc[:, 0]
+    )
+
+    # append existing techs to targets
+    tech_group_power_targets = [
+        [y, t, mw, 'existing']
+        for i, y, t, mw, mwh in existing_techs.itertuples()
+    ] + tech_group_power_targets
+
+    tech_group_energy_targets = [
+        [y, t, mwh, 'existing']
+        for i, y, t, mw, mwh in existing_techs.itertuples()
+        if mwh > 0.0
+    ] + tech_group_energy_targets
+
+
+    # 1. fill in all scheduled builds
+    # 2. check for extended retirements and slide forward
+    # 3. when to make the outer envelope?
+    # **** problem: if generation is expected to retire late and we move it to the
+    # correct year (which we must do, since the annual production cost model will
+    # not apply the life-extension), then we may create a capacity shortfall for a
+    # few years; for now we just assume there will be enough later builds to fill it.
+
+
+    # Calculate the capacity level for each tech_group
+
+    # set minimum capacity:
+    # early years:
+    # - existing capacity + HECO outlook (early build and replacements)
+    #   - may be more than Switch plan b/c early builds in HECO outlook get
+    #     scheduled into next study period
+    # later years:
+    # - Switch capacity plan
+
+    # HECO planned capacity, including pre-existing (may be a little earlier than
+    # Switch because Switch groups individual years into the following investment
+    # period)
+    def heco_targets(group_targets, tech_groups):
+        """ capacity online each year from a list of HECO targets """
+        targets = pd.DataFrame.from_records(
+            group_targets, columns=['year', 'tech_group', 'capacity', 'label']
+        )
+        unknown = set(targets['tech_group']) - set(tech_groups)
+        if unknown:
+            raise ValueError(
+                'HECO targets were specified for unrecognized tech groups: {}.'
+                .format(', '.join(sorted(unknown)))
+            )
+        return window_totals(
+            targets['tech_group'].values, targets['year'].values,
+            targets['year'].values + tech_group_max_age[targets['tech_group']].values,
+            targets['capacity'].values, study_years
+        ).reindex(tech_groups, fill_value=0.0)
+
+    heco_power_targets = heco_targets(
+        tech_group_power_targets, list(techs_for_tech_group.keys())
+    )
+    heco_energy_targets = heco_targets(tech_group_energy_targets, storage_techs)
+
+    # Capacity built in optimization model (includes pre-existing capacity)
+    def switch_targets(build_info, tech_groups):
+        """ capacity online each year from the optimization model """
+        # ignore gens that are not in a tech_group
+        build_info = build_info[build_info.index.get_level_values(0).isin(gen_info.index)]
+        gens = build_info.index.get_level_values(0)
+        build_years = build_info.index.get_level_values(1).values
+        # extend to next period or end of study, as Switch does
+        retire_years = extended_retirement_years(
+            build_years + gen_max_age[gens].values, periods.index
+        )
+        return window_totals(
+            gen_tech_group[gens].values, build_years, retire_years,
+            build_info.values, study_years
+        ).reindex(tech_groups, fill_value=0.0)
+
+    switch_power_targets = switch_targets(build_gen, list(techs_for_tech_group.keys()))
+    switch_energy_targets = switch_targets(build_storage, storage_techs)
+
+    for tdf in [heco_power_targets, heco_energy_targets, switch_power_targets, switch_energy_targets]:
+        tdf.index.name = 'tech_group'
+        tdf.columns.name = 'year'
+
+    # use maximum target from each source as the active target
+    power_targets = pd.concat([switch_power_targets, heco_power_targets]).max(level=0)
+    energy_targets = pd.concat([switch_energy_targets, heco_energy_targets]).max(level=0)
+    # power_targets.loc['Battery_Bulk', :]
+    # energy_targets.loc['Battery_Bulk', :]
+    # switch_power_targets.loc['Battery_Bulk', :]
+    # switch_energy_targets.loc['Battery_Bulk', :]
+
+    # now need to smooth LargePV, OnshoreWind, OffshoreWind and Battery_Bulk
+    # (leave DistPV and DistBattery on current schedule).
+    # Then reschedule construction for these techs to match the power_targets.
+    # All other techs: follow construction plan given by Switch (with different
+    # construction plans or techs it might be necessary to shift reconstruction
+    # earlier for techs built in off-years, i.e., pre-existing or built in 2022,
+    # with retirement (and rebuilding) on off year)
+
+    # interpolate these targets after 2022 to avoid stairsteps;
+    # respect minimum chunk size if specified
+    interpolate_tech_groups = ['LargePV', 'OnshoreWind', 'OffshoreWind', 'Battery_Bulk']
+    min_increment_size = {'OffshoreWind': 100}
+    # meet these targets as-is, without interpolation (but adjust from base model
+    # to match HECO outlook, which is already interpolated)
+    # (It may be possible to eliminate or be sharper about the distinction between
+    # interpolate and shift-only tech groups, because we now avoid interpolation
+    # anytime there is a specific plan for a tech, as there is for DistPV and
+    # DistBattery.)
+    print("""
+        WARNING: it is not clear how to handle new thermal capacity in
+        interpolate_construction_plan.py.
+        We create targets based on the HECO and Switch construction schedules
+        (whichever is greater). This includes the extended dates for life of off-
+        year renewable construction (otherwise there would be holes at the end of
+        these lives). Then we shift blocks earlier to match the targets for
+        individual early years. This works OK for renewables because the targets are
+        ascending (i.e., we always rebuild existing renewables and renewables
+        specified in the HECO plan, and Switch generally has ascending amounts of
+        renewables). But there is a problem if this is applied to IC_Schofield,
+        which is built early but not rebuilt. So then the 5-year Switch model has
+        IC_Schofield in 2048-49, (establishing a target in these years), but the
+        annual model does not (since it's not rebuilt). This gives "WARNING: some
+        power targets were missed". We currently avoid this by leaving CC/IC
+        projects out of the non_interpolate_tech_groups. But then there will be a
+        hole if any of them is built in an off year early enough to need rebuilding
+        before 2050 and then rebuilt on a 5-year mark in the 5-year model (e.g., if
+        IC_Schofield is wanted in 2050+). Another solution might be to include these
+        in non_interpolate_tech_groups, but don't report errors if they have
+        decreasing capacity in later years and don't meet the targets (i.e., let
+        them retire before the 5-year mark, just as we do with Kahe, Waiau, etc.).
+        But this could create infeasibility if some other type of thermal capacity
+        was scheduled to take over when one of these retires in the 5-year model,
+        since the online date of the replacement capacity isn't shifted forward.
+        Maybe we should have a super- class of thermal capacity, and move
+        closest-matching new capacity up to fill in the earlier real-world
+        retirement date for Schofield?
+    """)
+    non_interpolate_tech_groups = [
+        'DistPV', 'DistBattery', 'Battery_Reg', 'Battery_Conting',
+        'CC_152', 'IC_Barge', 'IC_MCBH', 'IC_Schofield'
+    ]
+    # all others will be built as scheduled by the optimization model
+
+    # don't interpolate if using HECO plan (just slide to correct start date)
+    if heco_plan:
+        non_interpolate_tech_groups += interpolate_tech_groups
+        interpolate_tech_groups = []
+
+    # only consider relevant technologies
+    power_targets = power_targets.loc[
+        interpolate_tech_groups + non_interpolate_tech_groups, :
+    ]
+
+    print("NOTE: interpolating LargePV from 2030 back to 2026, not 2025; there may be a dip in uptake.")
+    # raise NotImplementedError(
+    #     "May need to interpolate LargePV from 2030 back to 2025, not 2026."
+    # )
+    # May be able to put the following code at the top of the prev, current loop
+    # below, but first check if it's needed (may be easiest just to allow a dip in
+    # 2025).
+    # # Interpolate 2030 LargePV back to 2025 instead of 2026, to fill in a
+    # # dip in the 2025 forecast.
+    # if prev==2025 and current==2030:
+    #     prev = 2024
+
+    for targets in [power_targets, energy_targets]:
+        # targets should be increasing from year to year; this is verified
+        # by check_plan()
+
+        # drop targets between investment periods after the last fixed target,
+        # then interpolate to create smoothly increasing targets
+        interp_groups = [g for g in interpolate_tech_groups if g in targets.index]
+        for tech_group in interp_groups:
+            for prev, current in zip(periods.index[:-1], periods.index[1:]):
+                # delay interpolation until after any fixed targets, but not beyond
+                # current year
+                prev = min(current - 1, max(prev, last_definite_target.get(tech_group, prev)))
+                # enforce min_increment_size if needed
+                if tech_group in min_increment_size:
+                    max_steps = (
+                        targets.loc[tech_group, current]
+                        - targets.loc[tech_group, prev]
+                    ) // min_increment_size[tech_group]
+                    prev = max(current - max_steps, prev)
+                if current - prev < 2:  # number of steps
+                    continue # nothing to interpolate
+
+                # blank out the years that will get interpolated (between prev and
+                # current)
+                targets.loc[tech_group, prev+1:current-1] = float('nan')
+
+                # This is where the interpolation happens:
+                # capacity targets have been set for years where applicable, with
+                # nans in between. Now we interpolate intermediate capacity targets to
+                # replace those nans. Later, construction each year will be adjusted to
+                # meet these target annual capacity levels.
+                targets.loc[tech_group, :] = targets.loc[tech_group, :].interpolate()
+
+    # adjust construction plans to meet targets
+    # To increase construction in early year:
+    # - go through net capacity increases in next period (capacity built minus capacity retired > 0)
+    #   - move some or all of the new build up to the current year
+    #   - cascade to retirement year, moving up to the same amount of (re)build forward to close gap
+    #   - keep cascading (with possibly diminishing block size) until end of study
+    #   - this can only decrease, not increase, capacity online in a particular project
+    #     in any future year
+    # - repeat until interim year is filled
+
+    # Find additions and retirements in Switch in each period, taking account of the
+    # life-extensions used in the optimization model.
+    # Then slide the end points forward to eliminate the life extensions (because
+    # those won't be used in the production cost model).
+    # Then slide excess capacity forward as needed to meet the targets.
+
+    # store by proj, but later need to find all projects in a particular
+    # tech_group that have capacity available in a particular year, so structure
+    # should be
+    # build = {(tech_group, year): {gen1: amt, gen2: amt, ...}, ...}
+    # retire = check build[tech_group, year-max_age][gen1]
+    # To update: set build[tech_group, year][gen1]
+    build_gen_dict = collections.defaultdict(lambda: collections.defaultdict(float))
+    build_storage_dict = collections.defaultdict(lambda: collections.defaultdict(float))
+    for (gen, year), cap in build_gen.items():
+        if gen in gen_info.index and cap > 0:
+            build_gen_dict[gen_tech_group[gen], year][gen] += cap
+    for (gen, year), cap in build_storage.items():
+        if gen in gen_info.index and cap > 0:
+            build_storage_dict[gen_tech_group[gen], year][gen] += cap
+
+    move_log = []
+    for cap_type, build, build_targets, capacity_limit in [
+        ('power', build_gen_dict, power_targets, gen_info['gen_capacity_limit_mw']),
+        ('energy', build_storage_dict, energy_targets, None)
+    ]:
+        # Find mid-period retirements and shift the subsequent reconstruction earlier
+        to_fix = []  # tuple of gen_proj, capacity, old build date, new build date
+        for prev_period, cur_period in zip(periods.index[:-1], periods.index[1:]):
+            for gen in gen_info.index:
+                # prev_period = 2040; cur_period = 2045; gen = 'Oahu_OnshoreWind_OnWind_Kahuku'; y = 2011
+                age = gen_max_age[gen]
+                tech_group = gen_tech_group[gen]
+                shiftable_cap = build.get((tech_group, cur_period), {}).get(gen, 0.0)
+                if shiftable_cap == 0:
+                    continue # nothing built in this period that could be shifted
+                # build years that could have had service extended to this period
+                ext_build_years = list(range(prev_period - age + 1, cur_period - age))
+                for y in ext_build_years:
+                    if shiftable_cap == 0:
+                        break # no possibility of shifting any more
+                    shift_cap = min(build.get((tech_group, y), {}).get(gen, 0.0), shiftable_cap)
+                    if shift_cap > 0:
+                        # shift this much capacity from current period to correct rebuild year
+                        to_fix.append((gen, shift_cap, cur_period, y+age))
+                        # update tally of remaining shiftable capacity
+                        shiftable_cap -= shift_cap
+        clean_build_dict(build)
+
+        # track capacity online in each year as builds are moved
+        online = CapacityOnline(build, gen_max_age, gen_tech_group, capacity_limit)
+
+        # update build plan as needed (must start at latest build date so those get
+        # attached to the previous build and then move earlier when that gets moved up)
+        moves = move_build(
+            build, online, sorted(to_fix, key=lambda x: x[2], reverse=True), 'retirement'
+        )
+
+        # update to meet target...
+        # tech_group = 'LargePV'; target_year = 2020; target_cap = 175.69
+        for tech_group, targets in build_targets.iterrows():
+            for target_year, target_cap in targets.items():
+                # (excess capacity and missed targets are reported by
+                # check_plan())
+                actual_cap = online.total(tech_group, target_year)
+                if actual_cap >= target_cap - 1e-9:
+                    continue  # no adjustment needed (ignoring rounding error)
+
+                # find later installations (not reconstructions) in this tech_group
+                # and shift them earlier
+                for year in range(target_year+1, study_years[-1]+1):
+                    if actual_cap >= target_cap - 1e-9:
+                        break  # finished adjusting
+                    for gen, cap in build.get((tech_group, year), {}).items():
+                        if actual_cap >= target_cap - 1e-9:
+                            break  # finished adjusting
+                        retiring_cap = build.get((tech_group, year-gen_max_age[gen]), {}).get(gen, 0.0)
+                        cap_added = cap - retiring_cap
+                        if cap_added > 0:
+                            shift_cap = min(cap_added, target_cap-actual_cap)
+                            moves.extend(move_build(
+                                build, online, [(gen, shift_cap, year, target_year)], 'target'
+                            ))
+                            actual_cap = online.total(tech_group, target_year)
+        clean_build_dict(build)
+        move_log.extend((cap_type,) + tuple(m) for m in moves)
+
+    # save a record of all the construction that was moved
+    move_log = pd.DataFrame(move_log, columns=['capacity_type'] + list(Move._fields))
+    move_log.to_csv(new_output_path('construction_moves.csv'), index=False, na_rep='.')
+    print(
+        "Moved {} blocks of construction; see {}."
+        .format(len(move_log), new_output_path('construction_moves.csv'))
+    )
+
+    # export as predetermined build schedule for an extensive model (also used
+    # for multiple one-year models by run_annual_by_year.py)
+
+    # set a predetermined value for all possible build years
+    build_costs = (
+        tables['new_gen_build_costs']
+        .set_index(['GENERATION_PROJECT', 'build_year'])
+    )
+    # start with original construction plan, then use the new plan for all study
+    # years for the interpolated projects (zero when not built)
+    interpolated_power = build_series(build_gen_dict).reindex(
+        pd.MultiIndex.from_product([gen_tech_group.index, study_years]), fill_value=0.0
+    )
+    interpolated_energy = build_series(build_storage_dict).reindex(
+        pd.MultiIndex.from_product(
+            [gen_tech_group.index[gen_tech_group.isin(storage_techs)], study_years]
+        ),
+        fill_value=0.0
+    )
+    power_plan = pd.concat([build_gen, interpolated_power])
+    power_plan = power_plan[~power_plan.index.duplicated(keep='last')]
+    energy_plan = pd.concat([build_storage, interpolated_energy])
+    energy_plan = energy_plan[~energy_plan.index.duplicated(keep='last')]
+
+    plan_index = build_costs.index
+    plan_index = plan_index.append(
+        power_plan.index.append(energy_plan.index).unique().difference(plan_index)
+    )
+    gen_build_predetermined = (
+        tables['new_gen_build_predetermined']
+        .set_index(['GENERATION_PROJECT', 'build_year'])
+        .reindex(plan_index)  # set a value for every possible build year
+        .fillna(0.0)
+    )
+    gen_build_predetermined['gen_predetermined_cap'] = (
+        power_plan.reindex(plan_index)
+        .fillna(gen_build_predetermined['gen_predetermined_cap'])
+    )
+    gen_build_predetermined['gen_predetermined_storage_energy_mwh'] = \
+        energy_plan.reindex(plan_index)
+
+    # gen_build_predetermined.loc['Oahu_Battery_Bulk', :]
+    # build_storage['Oahu_Battery_Bulk']
+    # build_gen['Oahu_Battery_Bulk']
+    # sorted([(y, b) for ((t, y), b) in build_gen_dict.items() if t == 'LargePV' and y <= 2020])
+    # sorted([(y, c) for (p, y), c in build_gen.iteritems() if 'TrackingPV' in p and y <= 2020])
+
+    # pd.DataFrame({'online': power_online.loc['LargePV', :], 'target': power_targets.loc['LargePV', :]})
+    # gen_build_predetermined
+
+    # trim any minor excess development (major errors are reported by
+    # check_plan()); capacity online in each build year for each project is
+    # compared to its limit
+    plan_years = gen_build_predetermined.index.get_level_values(1)
+    gen_cap_online = capacity_online(
+        gen_build_predetermined['gen_predetermined_cap'],
+        list(range(plan_years.min(), plan_years.max() + 1)), gen_max_age
+    ).stack()
+    gen_cap_online = gen_cap_online.reindex(gen_build_predetermined.index)
+    excess = gen_cap_online - gen_info['gen_capacity_limit_mw'].reindex(
+        gen_build_predetermined.index.get_level_values(0)
+    ).values
+    # small adjustments are made in order, since each one reduces capacity online
+    # in later years
+    for gen in excess.index[(excess > 0).values].get_level_values(0).unique():
+        max_cap = gen_info.loc[gen, 'gen_capacity_limit_mw']
+        years = gen_build_predetermined.loc[gen].index.values
+        caps = gen_build_predetermined.loc[gen, 'gen_predetermined_cap'].values.copy()
+        for i, year in enumerate(years):
+            excess_cap = caps[(years > year - gen_max_age[gen]) & (years <= year)].sum() - max_cap
+            # larger excesses are left for check_plan() to report as errors
+            if 0 < excess_cap <= 0.00001:
+                print(
+                    'Reduced construction of {} in {} from {} to {}.'
+                    .format(gen, year, caps[i], caps[i]-excess_cap)
+                )
+                caps[i] -= excess_cap
+        gen_build_predetermined.loc[gen, 'gen_predetermined_cap'] = caps
+
+    # zero out any tiny values (positive or negative)
+    for c in ['gen_predetermined_cap', 'gen_predetermined_storage_energy_mwh']:
+        gen_build_predetermined.loc[
+            gen_build_predetermined[c].abs() < 1e-9,
+            'gen_predetermined_cap'
+        ] = 0
+
+    # check the final plan
+    check_report = pd.concat([check_report, check_plan(
+        gen_build_predetermined, power_targets, energy_targets, gen_max_age,
+        gen_tech_group, gen_info['gen_capacity_limit_mw'],
+        build_storage.index.get_level_values(0).unique()
+    )], ignore_index=True)
+    report_checks(check_report, new_output_path(check_file))
+
+    ####################
+    # create capacity_additions_table.csv, showing all additions in
+    # an easy-to-read form
+
+    plans = pd.DataFrame()
+    for col, cap_type, targets in [
+        (0, 'power', tech_group_power_targets),
+        (1, 'energy', tech_group_energy_targets)
+    ]:
+        # total construction by year and tech group (nan if any part is nan)
+        build_col = gen_build_predetermined.iloc[:, col]
+        groups = [
+            gen_build_predetermined.index.get_level_values(1).rename('year'),
+            gen_build_predetermined.index.get_level_values(0).map(
+                lambda g: gen_tech_group.get(g, g[5:] if g.startswith('Oahu_') else g)
+            ).rename('tech_group')
+        ]
+        built = build_col.groupby(groups).sum()
+        built[build_col.isnull().groupby(groups).any()] = float('nan')
+        plan = pd.DataFrame.from_records(
+            targets, columns=['year', 'tech_group', 'capacity', 'label']
+        ).groupby(['year', 'tech_group', 'label']).sum()
+        planned_built = (
+            plan.groupby(['year', 'tech_group'])['capacity'].sum()
+            .reindex(built.index)
+            .fillna(0.0)
+        )
+        switch_built = built - planned_built
+        planned_built[(2030, 'OnshoreWind')]
+        switch_built[switch_built.abs() < 1e-9] = 0.0
+        switch_plan = switch_built.to_frame(name='capacity')
+        # switch_plan.loc[(2029, 'OnshoreWind'), :]
+        switch_plan['label'] = 'Switch'
+        switch_plan = switch_plan.set_index('label', append=True)
+        # switch_plan.loc[(2029, 'OnshoreWind', 'Switch'), :]
+        plan = plan.append(switch_plan)
+        # plan.loc[(2029, 'OnshoreWind', 'Switch'), :]
+        plans[cap_type] = plan['capacity']
+        # plans.loc[(2029, 'OnshoreWind', 'Switch'), :]
+
+    # plans.loc[(2029, 'OnshoreWind', 'Switch'), :]
+
+    # TODO:
+    # existing thermal capacity is labeled as Switch additions
+    # may want to show retirements in addition to construction? (not for now, would
+    # require first approach below to fit in all the thermal plants)
+
+    plan_tab = plans.reset_index().query(
+        'year >= 2020 and (power > 0 or energy > 0) '
+        'and not label.str.startswith("rebuild")'
+    )
+    plan_tab['capacity'] = plan_tab.apply(capacity_str, axis=1)
+    # plan_tab.loc[(2029, 'OnshoreWind'), :]
+    plan_tab = plan_tab.groupby(['year', 'tech_group'])['capacity'].agg(lambda x: '\n'.join(x))
+    # plan_tab.loc[(2029, 'OnshoreWind'), :]
+    plan_tab = plan_tab.unstack(['tech_group']).fillna('').sort_index(axis=0).sort_index(axis=1)
+    # plan_tab.loc[2029, 'OnshoreWind']
+    plan_tab = plan_tab.reindex(['LargePV', 'Battery_Bulk', 'DistPV', 'DistBattery', 'OnshoreWind', 'OffshoreWind'], axis=1)
+    plan_tab.columns = ['Large PV', 'Large Battery', 'Dist PV', 'Dist Battery', 'Onshore Wind', 'Offshore Wind']
+    plan_tab.to_csv(new_output_path('capacity_additions_table.csv'))
+
+    print("\n\nNeed to add pumped storage to capacity_additions_table.csv manually.")
+    print("Need to remove rebuilds of Switch-selected assets from capacity_additions_table.csv manually. (should really fix this in code)\n")
+
+    # from IPython.display import display, HTML
+    # display(HTML(plan_tab.to_html().replace("\\n","<br>")))
+
+    # done with capacity_additions_table.csv
+    ###################
+
+    # if annual study is short, we don't want to create extra rows
+    last_period = tables['new_periods']['INVESTMENT_PERIOD'].max()
+
+    # Save "adjusted" version of input file; we don't save on top of the original
+    # in case we need to run this again, re-reading from the original.
+    gen_build_predetermined.query('build_year <= {}'.format(last_period)).to_csv(
+        new_input_path('gen_build_predetermined' + adjusted_suffix + '.csv'),
+        na_rep='.'
+    )
+
+    # Save generation_project_info_adjusted.csv with gen_min_build_capacity
+    # set to min_increment_size or '.' for interpolated projects. This allows
+    # interpolation of projects with large minimum size per period into smaller
+    # chunks over a few years.
+    generation_projects_info = (
+        tables['new_generation_projects_info']
+        .set_index('gen_tech', drop=False)
+    )
+    # this previously only considered techs in interpolate_tech_groups, but that
+    # creates some inconsistency between the HECO plan (where no techs are
+    # interpolated) and the Switch plan. But it's possible the HECO plan includes
+    # subblocks in adjacent years that add up to match a normal block size when
+    # the 5-year model is run, but would fail when the annual model is run. So we
+    # now adjust the minimum size whether a tech can be interpolated or not.
+    for tg, min_size in min_increment_size.items():
+        if tg in techs_for_tech_group:
+            for tech in techs_for_tech_group[tg]:
+                if tech in generation_projects_info.index:
+                    generation_projects_info.loc[tech, 'gen_min_build_capacity'] = min_size
+    # Also extend the life of Schofield when using the standard plan. This was built
+    # in 2018 and has a 30 year life, so Switch assumes it will last until a 5-year
+    # mark during the optimization phase and doesn't add capacity to fill the gap in
+    # the last 2 years. This can cause infeasibility.
+    # TODO: generalize this, i.e., extend all thermal plants to the even-year mark
+    # (it may be better to slide subsequent rebuilds forward if they exist).
+    # TODO: also apply this to the HECO Plan (not as urgent because it has excess
+    # thermal capacity).
+    if not heco_plan:
+        print("Updating IC_Schofield life to 32 years.")
+        generation_projects_info.loc['IC_Schofield', 'gen_max_age'] = 32
+
+    generation_projects_info.to_csv(
+        new_input_path('generation_projects_info' + adjusted_suffix + '.csv'),
+        na_rep='.', index=False
+    )
+
+    return gen_build_predetermined
+
+def plan_settings(base_outputs, base_inputs='inputs', heco_plan=False):
+    """
+    Return arguments for interpolate_plan() for the scenario with results in
+    base_outputs and inputs in base_inputs (an inputs directory or overlay
+    file). The other names are based on these, e.g., outputs_heco ->
+    outputs_annual_heco and *_adjusted_heco.csv, and overlays/inputs_heco.json
+    -> overlays/inputs_annual_heco.json if that exists (otherwise
+    inputs_annual).
+    """
+    name = os.path.basename(os.path.normpath(base_outputs))
+    suffix = name[len('outputs'):] if name.startswith('outputs') else '_' + name
+    new_inputs = 'inputs_annual'
+    if base_inputs.endswith('.json'):
+        overlay_dir, overlay_file = os.path.split(base_inputs)
+        annual_overlay = os.path.join(overlay_dir, overlay_file.replace('inputs', 'inputs_annual', 1))
+        if os.path.exists(annual_overlay):
+            new_inputs = annual_overlay
+    return dict(
+        base_inputs=base_inputs,
+        base_outputs=base_outputs,
+        new_inputs=new_inputs,
+        new_outputs=os.path.join(
+            os.path.dirname(os.path.normpath(base_outputs)), 'outputs_annual' + suffix
+        ),
+        adjusted_suffix='_adjusted' + suffix,
+        heco_plan=heco_plan,
+    )
+
+def scenario_plan_settings(base_outputs, scenario_file='scenarios.txt', option_file='options.txt'):
+    """
+    Return arguments for interpolate_plan() for the scenario in scenario_file
+    that saved its results in base_outputs, using its --input-overlay or
+    --inputs-dir setting and treating it as the HECO plan if it uses
+    heco_plan_module.
+    """
+    args = [a for line in run_scenarios.read_arg_file(option_file) for a in line]
+    for s in run_scenarios.get_scenarios(scenario_file, option_file):
+        if s['outputs_dir'] == os.path.normpath(base_outputs):
+            args = args + s['args']
+    base_inputs = (
+        run_scenarios.arg_value(args, '--input-overlay')
+        or run_scenarios.arg_value(args, '--inputs-dir', 'inputs')
+    )
+    return plan_settings(base_outputs, base_inputs, heco_plan=heco_plan_module in args)
+
+def interpolate_logged(settings):
+    """
+    Call interpolate_plan(**settings), sending messages to
+    interpolate_construction_plan.log in the new outputs directory.
+    """
+    if not os.path.exists(settings['new_outputs']):
+        os.makedirs(settings['new_outputs'])
+    log_file = os.path.join(settings['new_outputs'], 'interpolate_construction_plan.log')
+    stdout = sys.stdout
+    with open(log_file, 'w') as f:
+        sys.stdout = f
+        try:
+            plan = interpolate_plan(**settings)
+        except Exception as e:
+            traceback.print_exc(file=f)
+            # report the failure with a message that can be returned to the
+            # parent process
+            raise RuntimeError(
+                'Interpolation failed for {}: {} (see {}).'
+                .format(settings['base_outputs'], e, log_file)
+            )
+        finally:
+            sys.stdout = stdout
+    return settings['base_outputs'], log_file, plan
+
+def interpolate_batch(outputs_dirs, processes=None, scenario_file='scenarios.txt', option_file='options.txt'):
+    """
+    Interpolate the construction plans for several solved scenarios, in
+    parallel worker processes. Settings for each outputs directory are found
+    in scenario_file (see scenario_plan_settings()). Returns a dict with the
+    adjusted gen_build_predetermined table for each outputs directory. If any
+    scenario fails (including failing the checks in check_plan()), the other
+    workers are stopped and the error is raised immediately.
+    """
+    settings = [scenario_plan_settings(d, scenario_file, option_file) for d in outputs_dirs]
+    # read all the tables once, to be shared by the worker processes
+    for s in settings:
+        read_inputs(s['base_inputs'], s['base_outputs'], s['new_inputs'])
+    plans = collections.OrderedDict()
+    pool = multiprocessing.Pool(processes)
+    try:
+        for base_outputs, log_file, plan in pool.imap_unordered(interpolate_logged, settings):
+            print("Interpolated construction plan from {}; see {}.".format(base_outputs, log_file))
+            plans[base_outputs] = plan
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return plans
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Interpolate the construction plan for the annual model '
+        '(see interpolate_construction_plan.py).'
+    )
+    parser.add_argument('--heco-plan', action='store_true', default=False,
+        help='Setup for HECO plan instead of Switch-optimized')
+    parser.add_argument('--batch', nargs='+', default=None, metavar='OUTPUTS_DIR',
+        help='Interpolate the plans from several outputs directories in '
+        'parallel, using the settings for each one from scenarios.txt.')
+    parser.add_argument('--processes', type=int, default=None,
+        help='Number of worker processes to use with --batch (default is one '
+        'per core).')
+    parser.add_argument('--scenario-list', default='scenarios.txt',
+        help='File with scenario definitions for --batch (default is %(default)s).')
+    args = parser.parse_args(args)
+
+    if args.batch:
+        interpolate_batch(args.batch, args.processes, args.scenario_list)
+    elif args.heco_plan:
+        interpolate_plan(**plan_settings(
+            'outputs_heco', os.path.join('overlays', 'inputs_heco.json'), heco_plan=True
+        ))
+    else:
+        interpolate_plan(**plan_settings('outputs'))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
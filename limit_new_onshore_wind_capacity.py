@@ -1,4 +1,14 @@
-from pyomo.environ import Constraint
+"""
+Limit the total capacity of onshore wind (--onshore-wind-limit) and,
+optionally, other technologies in individual load zones.
+
+Limits for other technologies can be given in tech_capacity_limits.csv in the
+inputs directory, with columns gen_tech, load_zone and tech_capacity_limit_mw.
+Each row limits the total capacity of that technology that can be operational
+in that zone in any period.
+"""
+import os
+from pyomo.environ import Set, Param, Constraint, NonNegativeReals
 
 def define_arguments(argparser):
     argparser.add_argument('--onshore-wind-limit', type=float, default=323.0,
@@ -10,12 +20,65 @@ def define_arguments(argparser):
     )
 
 def define_components(m):
+    define_tech_sets(m)
+    # mutable, so the limit can be changed without rebuilding the constraint
+    m.onshore_wind_limit_mw = Param(
+        within=NonNegativeReals, mutable=True,
+        initialize=lambda m: m.options.onshore_wind_limit
+    )
     m.Limit_New_Wind = Constraint(
         m.PERIODS,
         rule=lambda m, p: sum(
             m.GenCapacity[g, p]
-            for g in m.GENS_IN_PERIOD[p]
-            if m.gen_tech[g] == 'OnshoreWind'
-        ) <= m.options.onshore_wind_limit
+            for z in m.LOAD_ZONES
+            if ('OnshoreWind', z, p) in m.TECH_ZONE_PERIODS
+            for g in m.GENS_BY_TECH_ZONE_PERIOD['OnshoreWind', z, p]
+        ) <= m.onshore_wind_limit_mw
     )
     print('Restricting onshore wind to total of {} MW'.format(m.options.onshore_wind_limit))
+
+def define_tech_sets(m):
+    # generation projects of each technology in each zone that are active in
+    # each period (tabulated once and reused for all the limits)
+    def TECH_ZONE_PERIODS_init(m):
+        m.GENS_BY_TECH_ZONE_PERIOD_dict = d = dict()
+        for p in m.PERIODS:
+            for g in m.GENS_IN_PERIOD[p]:
+                d.setdefault((m.gen_tech[g], m.gen_load_zone[g], p), []).append(g)
+        return sorted(d.keys())
+    m.TECH_ZONE_PERIODS = Set(dimen=3, initialize=TECH_ZONE_PERIODS_init)
+    m.GENS_BY_TECH_ZONE_PERIOD = Set(
+        m.TECH_ZONE_PERIODS,
+        initialize=lambda m, t, z, p: m.GENS_BY_TECH_ZONE_PERIOD_dict.pop((t, z, p))
+    )
+
+    # optional limits on the total capacity of each technology in each zone
+    m.TECH_CAPACITY_LIMITS = Set(dimen=2)
+    m.tech_capacity_limit_mw = Param(m.TECH_CAPACITY_LIMITS, within=NonNegativeReals)
+    m.Limit_Tech_Capacity = Constraint(
+        m.TECH_CAPACITY_LIMITS, m.PERIODS,
+        rule=lambda m, t, z, p:
+            (
+                sum(m.GenCapacity[g, p] for g in m.GENS_BY_TECH_ZONE_PERIOD[t, z, p])
+                <= m.tech_capacity_limit_mw[t, z]
+            )
+            if (t, z, p) in m.TECH_ZONE_PERIODS
+            else Constraint.Skip
+    )
+
+def load_inputs(m, switch_data, inputs_dir):
+    switch_data.load_aug(
+        optional=True,
+        filename=os.path.join(inputs_dir, 'tech_capacity_limits.csv'),
+        auto_select=True,
+        index=m.TECH_CAPACITY_LIMITS,
+        param=(m.tech_capacity_limit_mw,)
+    )
+
+def set_onshore_wind_limit(m, limit):
+    """
+    Change the onshore wind limit on a model that has already been constructed.
+    """
+    m.options.onshore_wind_limit = limit
+    m.onshore_wind_limit_mw.value = limit
+    print('Restricting onshore wind to total of {} MW'.format(limit))
@@ -0,0 +1,131 @@
+from __future__ import print_function, division
+"""
+Replace the period-level constraints that link the timeseries in each period
+with prices, so each timeseries can be solved as a separate model. This is
+used by parallel_dispatch.py to evaluate dispatch of a fixed construction
+plan one timeseries at a time.
+
+With --linking-prices-file <file>, prices are read from <file>, which has
+columns constraint, market, period and price:
+
+- rps rows (market left blank) give a price ($/MWh) for each MWh by which
+  RPS-eligible power falls short of the RPS target (or a credit for each MWh
+  above it). RPS_Enforce is deactivated and the price is charged through
+  RPS_Linking_Cost instead.
+- fuel rows give a price ($/MMBtu) for all fuel bought in a regional fuel
+  market. FuelCostsPerPeriod is replaced by LinkedFuelCostsPerPeriod, which
+  charges this price instead of the cost of each tier of the supply curve.
+  Tier limits and tier activation still apply. Markets and periods with no
+  price use the supply curve as usual.
+
+post_solve() then saves the quantities that are linked across timeseries
+(RPS-eligible and total power and fuel consumption in each market, for each
+period) in linking_quantities.csv and the net present value of each cost
+component in each period in linking_costs.csv, for parallel_dispatch.py to
+combine.
+
+Other period-level constraints (e.g., RPS_Fuel_Cap) are left in place, so they
+apply to each timeseries separately.
+"""
+
+import os, csv
+
+from pyomo.environ import Expression, BuildAction, value
+
+quantities_file = 'linking_quantities.csv'
+costs_file = 'linking_costs.csv'
+
+def define_arguments(argparser):
+    argparser.add_argument('--linking-prices-file', default=None,
+        help='File with prices to use instead of the RPS and fuel market '
+        'constraints that link timeseries (see linking_prices.py).')
+
+def read_prices(path):
+    """
+    Return a dict of {constraint: {(market, period): price}} from a prices
+    file. RPS prices use '' as the market.
+    """
+    prices = {}
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            prices.setdefault(row['constraint'], {})[
+                (row['market'], int(row['period']))
+            ] = float(row['price'])
+    return prices
+
+def define_components(m):
+    if m.options.linking_prices_file is None:
+        return
+    m.linking_prices = read_prices(m.options.linking_prices_file)
+    print("Using linking prices from {}.".format(m.options.linking_prices_file))
+
+    if hasattr(m, 'RPS_Enforce'):
+        # annual cost of any shortfall from the RPS target
+        m.RPS_Linking_Cost = Expression(m.PERIODS, rule=lambda m, p:
+            m.linking_prices.get('rps', {}).get(('', p), 0.0)
+            * (m.rps_target_for_period[p] * m.RPSTotalPower[p] - m.RPSEligiblePower[p])
+            / m.period_length_years[p]
+        )
+        m.Cost_Components_Per_Period.append('RPS_Linking_Cost')
+        m.Release_RPS_Enforce = BuildAction(rule=lambda m: m.RPS_Enforce.deactivate())
+
+    if hasattr(m, 'FuelCostsPerPeriod') and 'fuel' in m.linking_prices:
+        m.LinkedFuelCostsPerPeriod = Expression(m.PERIODS, rule=lambda m, p: sum(
+            m.linking_prices['fuel'][rfm, p] * m.FuelConsumptionInMarket[rfm, p]
+            if (rfm, p) in m.linking_prices['fuel']
+            else sum(
+                m.ConsumeFuelTier[rfm_st] * m.rfm_supply_tier_cost[rfm_st]
+                for rfm_st in m.SUPPLY_TIERS_FOR_RFM_PERIOD[rfm, p]
+            )
+            for rfm in m.REGIONAL_FUEL_MARKETS
+        ))
+        components = m.Cost_Components_Per_Period
+        components[components.index('FuelCostsPerPeriod')] = 'LinkedFuelCostsPerPeriod'
+
+def post_solve(m, outputs_dir):
+    if m.options.linking_prices_file is not None:
+        save_quantities(m, os.path.join(outputs_dir, quantities_file))
+        save_costs(m, os.path.join(outputs_dir, costs_file))
+
+def save_quantities(m, path):
+    rows = []
+    for p in m.PERIODS:
+        if hasattr(m, 'RPS_Linking_Cost'):
+            rows.append(('rps_target', '', p, value(m.rps_target_for_period[p])))
+            rows.append(('RPSEligiblePower', '', p, value(m.RPSEligiblePower[p])))
+            rows.append(('RPSTotalPower', '', p, value(m.RPSTotalPower[p])))
+        if hasattr(m, 'FuelConsumptionInMarket'):
+            rows.extend(
+                ('FuelConsumptionInMarket', rfm, p, value(m.FuelConsumptionInMarket[rfm, p]))
+                for rfm in m.REGIONAL_FUEL_MARKETS
+            )
+        rows.append((
+            'bring_annual_costs_to_base_year', '', p,
+            value(m.bring_annual_costs_to_base_year[p])
+        ))
+    with open(path, 'w') as f:
+        w = csv.writer(f, lineterminator='\n')
+        w.writerow(['quantity', 'market', 'period', 'value'])
+        w.writerows(rows)
+
+def save_costs(m, path):
+    # same terms as SystemCostPerPeriod in switch_model.financials
+    rows = []
+    for p in m.PERIODS:
+        rows.extend(
+            (c, p, 'annual',
+                value(getattr(m, c)[p]) * value(m.bring_annual_costs_to_base_year[p]))
+            for c in m.Cost_Components_Per_Period
+        )
+        rows.extend(
+            (c, p, 'timepoint',
+                sum(
+                    value(getattr(m, c)[t]) * value(m.tp_weight_in_year[t])
+                    for t in m.TPS_IN_PERIOD[p]
+                ) * value(m.bring_annual_costs_to_base_year[p]))
+            for c in m.Cost_Components_Per_TP
+        )
+    with open(path, 'w') as f:
+        w = csv.writer(f, lineterminator='\n')
+        w.writerow(['component', 'period', 'component_type', 'npv_cost'])
+        w.writerows(rows)
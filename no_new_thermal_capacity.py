@@ -1,10 +1,50 @@
-from pyomo.environ import Constraint
+from __future__ import print_function
+from pyomo.environ import Set, Constraint, BuildAction
 
-def define_components(m):
-    m.No_New_Thermal = Constraint(
-        m.FUEL_BASED_GENS, m.PERIODS,
-        rule=lambda m, g, p:
-             (m.BuildGen[g, p] == 0)
-             if (g, p) in m.BuildGen
-             else Constraint.Skip
+def define_arguments(argparser):
+    argparser.add_argument('--no-new-thermal-method', choices=['fix', 'constraint'],
+        default='fix',
+        help="""
+            How to prevent construction of new thermal capacity. 'fix' (default)
+            fixes BuildGen (and BuildUnits and BuildMinGenCap if used) at zero
+            for new thermal projects, so these variables are removed before the
+            model is sent to the solver. 'constraint' adds a BuildGen == 0
+            constraint for each of them instead.
+        """
     )
+
+def define_components(m):
+    # only consider optional construction during the study periods (not
+    # predetermined builds, which may also fall in a study period)
+    m.NEW_THERMAL_BLD_YRS = Set(dimen=2, initialize=lambda m: [
+        (g, p) for (g, p) in m.GEN_BLD_YRS
+        if g in m.FUEL_BASED_GENS and p in m.PERIODS
+        and (g, p) not in m.PREDETERMINED_GEN_BLD_YRS
+    ])
+    if m.options.no_new_thermal_method == 'constraint':
+        m.No_New_Thermal = Constraint(
+            m.NEW_THERMAL_BLD_YRS,
+            rule=lambda m, g, p: m.BuildGen[g, p] == 0
+        )
+    else:
+        def rule(m):
+            m.No_New_Thermal_Fixed = []
+            for (g, p) in m.NEW_THERMAL_BLD_YRS:
+                for var in [m.BuildGen, getattr(m, 'BuildUnits', {}), getattr(m, 'BuildMinGenCap', {})]:
+                    if (g, p) in var:
+                        var[g, p].fix(0)
+                        m.No_New_Thermal_Fixed.append(var[g, p])
+            print("Fixed {} variables at zero to prevent new thermal capacity.".format(
+                len(m.No_New_Thermal_Fixed)
+            ))
+        m.Fix_No_New_Thermal = BuildAction(rule=rule)
+
+def release(m):
+    """
+    Allow construction of new thermal capacity on a model that has already been
+    constructed (equivalent to excluding this module).
+    """
+    if hasattr(m, 'No_New_Thermal'):
+        m.No_New_Thermal.deactivate()
+    for var in getattr(m, 'No_New_Thermal_Fixed', []):
+        var.unfix()
@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+"""
+Evaluate dispatch of a fixed construction plan by solving each timeseries as
+a separate model, in parallel, with prices for the period-level constraints
+that link the timeseries (the RPS and the fuel market supply tiers), then
+combine the results.
+
+Once all construction is predetermined (e.g., with
+gen_build_predetermined_adjusted.csv from interpolate_construction_plan.py),
+the timeseries in each period are only linked through the RPS target and
+the fuel supply curves. This creates a separate inputs directory for each
+timeseries in the annual inputs, with that timeseries scaled up to fill its
+whole period (see run_annual_by_year.write_year_inputs()), then solves all of
+them with `switch solve` in a pool of worker processes, using
+linking_prices.py to replace the linking constraints with prices:
+
+- the RPS price for each period starts at zero and is raised or lowered in
+  proportion to the RPS shortfall for all timeseries together, divided by the
+  square root of the iteration number (subgradient steps of the Lagrangian
+  dual)
+- the fuel price for each market and period moves --fuel-price-damping of the
+  way toward the cost of the marginal supply tier for the total fuel
+  consumption in all timeseries
+
+This is repeated until all RPS targets are met (within --tolerance) and the
+gap between the cost of the combined dispatch and the Lagrangian lower bound
+is below --tolerance, or until --max-iterations. The lower bound is only
+valid if the timeseries models are solved to optimality (i.e., it is only
+approximate with a non-zero mipgap). Progress for each iteration is shown
+and saved in linking_convergence.csv.
+
+Arguments are the same as for run_annual_by_year.py, e.g.,
+
+    python parallel_dispatch.py --inputs-dir inputs_annual --outputs-dir outputs_annual_dispatch --ph-mw 150 --ph-year 2030 --input-alias gen_build_predetermined.csv=gen_build_predetermined_adjusted.csv generation_projects_info.csv=generation_projects_info_adjusted.csv --exclude-module switch_model.hawaii.heco_outlook_2020_08 --processes 8
+
+Inputs, outputs and solver logs for each timeseries are in
+<outputs_dir>_by_timeseries/<timeseries>, and the prices used in each
+iteration are in <outputs_dir>_by_timeseries/iteration_NNN_linking_prices.csv.
+When the iterations finish, timepoint-level results from the last iteration
+(e.g., gen_dispatch.csv, load_balance.csv, StateOfCharge.csv) are combined in
+<outputs_dir>, along with cost_components.csv and total_cost.txt, which use
+the fuel supply curves instead of the prices and leave out the RPS price, and
+the final linking_prices.csv. Other period-level results depend on the
+scaling of each timeseries, so they are not combined.
+
+Other period-level constraints (e.g., RPS_Fuel_Cap) apply to each timeseries
+separately, and each timeseries chooses its own fuel market tiers, so this
+should only be used with tiers that are forced on or off (e.g., with
+--force-lng-tier none, as in options.txt).
+"""
+
+import os, sys, time, shutil, argparse, subprocess, multiprocessing
+import pandas as pd
+
+import input_overlay, linking_prices
+from run_annual_by_year import (
+    base_tables, parse_aliases, read_base_tables, write_year_inputs,
+    timeseries_weights, pumped_hydro_args, read_text_table,
+)
+
+timeseries_suffix = '_by_timeseries'
+convergence_file = 'linking_convergence.csv'
+prices_file = 'linking_prices.csv'
+
+def timeseries_path(outputs_dir, ts):
+    return os.path.join(outputs_dir + timeseries_suffix, str(ts))
+
+def unfixed_builds():
+    """
+    Return the rows of gen_build_costs.csv whose capacity (or storage energy)
+    is not set in gen_build_predetermined.csv.
+    """
+    keys = ['GENERATION_PROJECT', 'build_year']
+    builds = base_tables['gen_build_costs.csv'].merge(
+        base_tables['gen_build_predetermined.csv'], on=keys, how='left'
+    )
+    unfixed = builds['gen_predetermined_cap'].isnull()
+    if 'gen_storage_energy_overnight_cost' in builds.columns:
+        unfixed |= (
+            builds['gen_storage_energy_overnight_cost'].notnull()
+            & builds['gen_predetermined_storage_energy_mwh'].isnull()
+        )
+    return builds.loc[unfixed, keys]
+
+def timeseries_shares():
+    """
+    Return a Series showing the share of its period represented by each
+    timeseries in the base inputs.
+    """
+    timeseries = base_tables['timeseries.csv']
+    weights = timeseries_weights(timeseries)
+    period_weights = weights.groupby(timeseries['ts_period']).transform('sum')
+    return pd.Series((weights / period_weights).values, index=timeseries['TIMESERIES'])
+
+def supply_curve(tiers, quantity):
+    """
+    Return the marginal price and total cost of buying `quantity` from the
+    supply tiers of one fuel market in one period (rows of
+    fuel_supply_curves.csv), using the cheapest tiers first.
+    """
+    cost = 0.0
+    remaining = quantity
+    for unit_cost, limit in tiers[['unit_cost', 'max_avail_at_cost']].itertuples(index=False):
+        used = remaining if pd.isnull(limit) else min(remaining, limit)
+        cost += used * unit_cost
+        remaining -= used
+        if remaining <= 1e-9 * max(quantity, 1.0):
+            return unit_cost, cost
+    # more than the tiers can supply; charge the last tier for the rest
+    return unit_cost, cost + remaining * unit_cost
+
+def supply_curve_offset(tiers, price):
+    """
+    Return the lowest value of (cost - price * quantity) for purchases from
+    the supply tiers of one fuel market in one period at a fixed price (the
+    supply curve's term in the Lagrangian lower bound).
+    """
+    best = cost = quantity = 0.0
+    for unit_cost, limit in tiers[['unit_cost', 'max_avail_at_cost']].itertuples(index=False):
+        if pd.isnull(limit):
+            # unlimited tier; price is never above the most expensive tier
+            break
+        cost += limit * unit_cost
+        quantity += limit
+        best = min(best, cost - price * quantity)
+    return best
+
+def solve_timeseries(job):
+    """
+    Create the inputs for one timeseries if needed, then solve it with
+    `switch solve`, using the linking prices in settings['prices_file'].
+    Returns the timeseries, the return code from `switch solve` and the log
+    file.
+    """
+    year, ts, settings = job
+    path = timeseries_path(settings['outputs_dir'], ts)
+    inputs_dir = os.path.join(path, 'inputs')
+    outputs_dir = os.path.join(path, 'outputs')
+    log_file = os.path.join(path, 'solve.log')
+    if not os.path.exists(inputs_dir):
+        write_year_inputs(year, settings['base_dir'], settings['files'], inputs_dir, [ts])
+    cmd = (
+        [
+            'switch', 'solve', '--inputs-dir', inputs_dir, '--outputs-dir', outputs_dir,
+            '--linking-prices-file', settings['prices_file']
+        ]
+        + pumped_hydro_args(year, settings['ph_mw'], settings['ph_year'])
+        + settings['switch_args']
+    )
+    with open(log_file, 'w') as f:
+        f.write(' '.join(cmd) + '\n\n')
+        f.flush()
+        returncode = subprocess.call(cmd, stdout=f, stderr=subprocess.STDOUT)
+    return ts, returncode, log_file
+
+def solve_all_timeseries(pool, jobs):
+    """
+    Solve all the timeseries in `jobs` using `pool`. Returns a list of the
+    timeseries that failed.
+    """
+    start = time.time()
+    failed = []
+    for i, (ts, returncode, log_file) in enumerate(pool.imap_unordered(solve_timeseries, jobs)):
+        if returncode != 0:
+            print("ERROR: {} failed with return code {}; see {}.".format(
+                ts, returncode, log_file
+            ))
+            failed.append(ts)
+        elif (i + 1) % 10 == 0 or i + 1 == len(jobs):
+            print("Finished {}/{} timeseries; elapsed time: {:.0f}s".format(
+                i+1, len(jobs), time.time()-start
+            ))
+        sys.stdout.flush()
+    return failed
+
+def read_linking_results(file, ts_list, settings, shares):
+    """
+    Read `file` (linking_quantities.csv or linking_costs.csv) for all the
+    timeseries in ts_list and return it with each value weighted by the share
+    of its period represented by the timeseries. Summing the weighted values
+    gives the total for the period, since each timeseries model is scaled up
+    to fill the whole period.
+    """
+    frames = []
+    for ts in ts_list:
+        df = pd.read_csv(
+            os.path.join(timeseries_path(settings['outputs_dir'], ts), 'outputs', file),
+            keep_default_na=False, float_precision='round_trip'
+        )
+        df[df.columns[-1]] *= shares[ts]
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+def write_prices(prices, path):
+    rows = [('rps', '', p, price) for p, price in sorted(prices['rps'].items())]
+    rows.extend(
+        ('fuel', rfm, p, price) for (rfm, p), price in sorted(prices['fuel'].items())
+    )
+    pd.DataFrame(rows, columns=['constraint', 'market', 'period', 'price']).to_csv(
+        path, index=False
+    )
+
+def evaluate_iteration(ts_list, settings, shares, prices, tiers):
+    """
+    Combine the linking quantities and costs from all timeseries. Returns a
+    dict of convergence measures, the cost components for the combined
+    dispatch, and the next prices.
+    """
+    quantities = read_linking_results(
+        linking_prices.quantities_file, ts_list, settings, shares
+    ).groupby(['quantity', 'market', 'period'])['value'].sum()
+    costs = read_linking_results(
+        linking_prices.costs_file, ts_list, settings, shares
+    ).groupby(['component', 'period'], sort=False)['npv_cost'].sum()
+    discount = quantities.loc['bring_annual_costs_to_base_year', '']
+
+    # RPS shortfall as a fraction of total power, and a subgradient step for
+    # the RPS prices
+    next_prices = dict(rps={}, fuel={})
+    rps_shortfall = 0.0
+    for p in prices['rps']:
+        if ('RPSTotalPower', '', p) not in quantities.index:
+            # no RPS in the model
+            next_prices['rps'][p] = prices['rps'][p]
+            continue
+        total = quantities.loc['RPSTotalPower', '', p]
+        shortfall = (
+            quantities.loc['rps_target', '', p] * total
+            - quantities.loc['RPSEligiblePower', '', p]
+        ) / total if total > 0 else 0.0
+        rps_shortfall = max(rps_shortfall, shortfall)
+        next_prices['rps'][p] = max(
+            0.0,
+            prices['rps'][p]
+            + settings['rps_price_step'] * shortfall / settings['iteration'] ** 0.5
+        )
+
+    # fuel costs from the supply curves, and prices moved toward the
+    # marginal tier
+    fuel_cost = bound_offset = 0.0
+    fuel_price_change = 0.0
+    for (rfm, p), price in prices['fuel'].items():
+        marginal, cost = supply_curve(
+            tiers[rfm, p], quantities.loc['FuelConsumptionInMarket', rfm, p]
+        )
+        fuel_cost += cost * discount[p]
+        bound_offset += supply_curve_offset(tiers[rfm, p], price) * discount[p]
+        next_prices['fuel'][rfm, p] = price + settings['fuel_price_damping'] * (marginal - price)
+        fuel_price_change = max(fuel_price_change, abs(marginal - price))
+
+    # the Lagrangian bound is the total cost of the priced models plus the
+    # lowest net cost of buying fuel from the supply curves at those prices
+    lagrangian_bound = costs.sum() + bound_offset
+    components = costs.groupby(level='component', sort=False).sum()
+    components = components.drop(['RPS_Linking_Cost'], errors='ignore')
+    if 'LinkedFuelCostsPerPeriod' in components:
+        components = components.rename({'LinkedFuelCostsPerPeriod': 'FuelCostsPerPeriod'})
+        components['FuelCostsPerPeriod'] = fuel_cost
+    total_cost = components.sum()
+    measures = dict(
+        iteration=settings['iteration'],
+        max_rps_shortfall=rps_shortfall,
+        max_fuel_price_change=fuel_price_change,
+        total_cost=total_cost,
+        lagrangian_bound=lagrangian_bound,
+        gap=(total_cost - lagrangian_bound) / total_cost,
+    )
+    return measures, components, next_prices
+
+def combine_outputs(jobs, settings):
+    """
+    Combine the timepoint-level results from all timeseries in
+    settings['outputs_dir'].
+    """
+    start = time.time()
+    outputs_dir = settings['outputs_dir']
+    tables = {}
+    skipped = set()
+    for year, ts, _ in jobs:
+        path = timeseries_path(outputs_dir, ts)
+        timepoints = read_text_table(os.path.join(path, 'inputs', 'timepoints.csv'))
+        labels = set(timepoints['timepoint_id']) | set(timepoints['timestamp'])
+        for file in sorted(os.listdir(os.path.join(path, 'outputs'))):
+            if not file.endswith('.csv'):
+                continue
+            df = read_text_table(os.path.join(path, 'outputs', file))
+            if any(len(df) and df[c].isin(labels).all() for c in df.columns):
+                tables.setdefault(file, []).append(df)
+            else:
+                skipped.add(file)
+    for file, frames in tables.items():
+        pd.concat(frames, ignore_index=True, sort=False).to_csv(
+            os.path.join(outputs_dir, file), index=False
+        )
+    skipped -= set(tables) | {linking_prices.quantities_file, linking_prices.costs_file}
+    print("Combined {} files from {} timeseries in {} in {:.1f}s.".format(
+        len(tables), len(jobs), outputs_dir, time.time()-start
+    ))
+    if skipped:
+        print("Did not combine period-level results: {}.".format(', '.join(sorted(skipped))))
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Solve each timeseries of the annual evaluation as a '
+        'separate model with prices for the RPS and fuel markets, and combine '
+        'the results (see parallel_dispatch.py). Other arguments are passed '
+        'to `switch solve` for each timeseries.'
+    )
+    parser.add_argument('--inputs-dir', default='inputs_annual',
+        help='Annual inputs directory (default is %(default)s).')
+    parser.add_argument('--input-overlay', default=None,
+        help='Overlay file to apply to the annual inputs (overrides --inputs-dir).')
+    parser.add_argument('--outputs-dir', default='outputs_annual_dispatch',
+        help='Directory for the combined results (default is %(default)s).')
+    parser.add_argument('--input-aliases', '--input-alias', nargs='+', default=[],
+        help='Input file aliases to use when creating the timeseries inputs, '
+        'as for `switch solve`.')
+    parser.add_argument('--ph-mw', type=float, default=None,
+        help='Total capacity of pumped storage hydro, as for `switch solve`.')
+    parser.add_argument('--ph-year', type=int, default=None,
+        help='Year when pumped storage hydro is built, as for `switch solve`.')
+    parser.add_argument('--max-iterations', type=int, default=20,
+        help='Maximum number of price updates (default is %(default)s).')
+    parser.add_argument('--tolerance', type=float, default=0.005,
+        help='Largest RPS shortfall (as a fraction of total power) and gap '
+        'between cost and lower bound allowed at convergence (default is %(default)s).')
+    parser.add_argument('--rps-price-step', type=float, default=1000.0,
+        help='Change in the RPS price ($/MWh) per unit of RPS shortfall in '
+        'the first iteration (default is %(default)s).')
+    parser.add_argument('--fuel-price-damping', type=float, default=0.5,
+        help='Fraction of the way to move fuel prices toward the marginal '
+        'supply tier each iteration (default is %(default)s).')
+    parser.add_argument('--initial-prices', default=None,
+        help='{} file from an earlier run to start from (default is no RPS '
+        'price and the cheapest fuel tiers).'.format(prices_file))
+    parser.add_argument('--processes', type=int, default=None,
+        help='Number of timeseries to solve at the same time (default is one per core).')
+    if args is None:
+        args = sys.argv[1:]
+    run_args, switch_args = parser.parse_known_args(args)
+
+    inputs = run_args.input_overlay or run_args.inputs_dir
+    base_dir = input_overlay.inputs_dir(inputs)
+    if (
+        os.path.exists(os.path.join(base_dir, 'pumped_hydro.csv'))
+        and (run_args.ph_mw is None or run_args.ph_year is None)
+    ):
+        parser.error(
+            'The timeseries models need a fixed pumped hydro plan: specify both '
+            '--ph-mw and --ph-year (use --ph-mw 0 for no pumped hydro).'
+        )
+    files = read_base_tables(inputs, parse_aliases(run_args.input_aliases))
+    unfixed = unfixed_builds()
+    if len(unfixed):
+        parser.error(
+            'The construction plan must be fixed, but {} build(s) in '
+            'gen_build_costs.csv have no predetermined capacity, e.g., {} in {}.'
+            .format(len(unfixed), *unfixed.iloc[0])
+        )
+
+    # linking prices for every period with an RPS target and every fuel
+    # market and period
+    tiers = {
+        key: df.sort_values('unit_cost')
+        for key, df in base_tables['fuel_supply_curves.csv'].groupby(
+            ['regional_fuel_market', 'period']
+        )
+    }
+    prices = dict(
+        rps={int(p): 0.0 for p in base_tables['periods.csv']['INVESTMENT_PERIOD']},
+        fuel={(rfm, int(p)): df['unit_cost'].iloc[0] for (rfm, p), df in tiers.items()},
+    )
+    if run_args.initial_prices is not None:
+        initial = linking_prices.read_prices(run_args.initial_prices)
+        prices['rps'].update(
+            (p, price) for (_, p), price in initial.get('rps', {}).items() if p in prices['rps']
+        )
+        prices['fuel'].update(
+            (key, price) for key, price in initial.get('fuel', {}).items() if key in prices['fuel']
+        )
+
+    work_dir = run_args.outputs_dir + timeseries_suffix
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+    if not os.path.exists(run_args.outputs_dir):
+        os.makedirs(run_args.outputs_dir)
+    timeseries = base_tables['timeseries.csv']
+    ts_years = list(zip(timeseries['ts_period'].astype(int), timeseries['TIMESERIES']))
+    shares = timeseries_shares()
+    settings = dict(
+        outputs_dir=run_args.outputs_dir, base_dir=base_dir, files=files,
+        ph_mw=run_args.ph_mw, ph_year=run_args.ph_year, switch_args=switch_args,
+        rps_price_step=run_args.rps_price_step,
+        fuel_price_damping=run_args.fuel_price_damping,
+    )
+    print("Solving {} timeseries in up to {} iterations.".format(
+        len(ts_years), run_args.max_iterations
+    ))
+
+    history = []
+    converged = False
+    pool = multiprocessing.Pool(processes=run_args.processes)
+    try:
+        for iteration in range(1, run_args.max_iterations + 1):
+            settings['iteration'] = iteration
+            settings['prices_file'] = os.path.join(
+                work_dir, 'iteration_{:03d}_{}'.format(iteration, prices_file)
+            )
+            write_prices(prices, settings['prices_file'])
+            jobs = [(y, ts, dict(settings)) for y, ts in ts_years]
+            failed = solve_all_timeseries(pool, jobs)
+            if failed:
+                print("ERROR: {} timeseries failed in iteration {}.".format(
+                    len(failed), iteration
+                ))
+                return 1
+            measures, components, next_prices = evaluate_iteration(
+                [ts for y, ts in ts_years], settings, shares, prices, tiers
+            )
+            history.append(measures)
+            pd.DataFrame(history).to_csv(
+                os.path.join(run_args.outputs_dir, convergence_file), index=False
+            )
+            print(
+                "Iteration {iteration}: RPS shortfall {max_rps_shortfall:.3%}, "
+                "fuel price change {max_fuel_price_change:.3f}, "
+                "cost {total_cost:,.0f}, lower bound {lagrangian_bound:,.0f}, "
+                "gap {gap:.3%}".format(**measures)
+            )
+            sys.stdout.flush()
+            if (
+                measures['max_rps_shortfall'] <= run_args.tolerance
+                and measures['gap'] <= run_args.tolerance
+            ):
+                converged = True
+                break
+            prices = next_prices
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    if not converged:
+        print(
+            "WARNING: prices did not converge in {} iterations; results are "
+            "from the last iteration.".format(run_args.max_iterations)
+        )
+    shutil.copy2(settings['prices_file'], os.path.join(run_args.outputs_dir, prices_file))
+    components.to_frame('npv_cost').to_csv(
+        os.path.join(run_args.outputs_dir, 'cost_components.csv'), index_label='component'
+    )
+    with open(os.path.join(run_args.outputs_dir, 'total_cost.txt'), 'w') as f:
+        f.write('{}\n'.format(components.sum()))
+    combine_outputs(jobs, settings)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
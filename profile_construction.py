@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+"""
+Show how much time and memory each module in modules.txt uses to construct
+the model, and the size of the parts of the model that each module creates.
+
+Run this with the same arguments you would use for `switch solve`, e.g.,
+
+    python profile_construction.py --inputs-dir inputs_annual --exclude-module no_new_thermal_capacity
+
+This defines the model, reads the inputs and constructs the model (without
+solving it). It times each module's define_components() (and related)
+functions and load_inputs() function, and the construction of each component
+(Set, Param, Var, Constraint, etc.), which is attributed to the module that
+defined it. Memory is the increase in the size of this process during
+construction. Nonzeros are the number of variables that appear in each
+constraint.
+
+A summary by module is printed and saved in construction_profile.csv, and the
+details for each component are saved in construction_profile_components.csv.
+The slowest components are also printed.
+"""
+
+import os, sys, time, argparse
+from collections import OrderedDict
+
+from pyomo.environ import Var, Constraint
+try:
+    from pyomo.core.expr.current import identify_variables
+except ImportError:
+    from pyomo.core.expr import identify_variables
+
+module_file = 'construction_profile.csv'
+component_file = 'construction_profile_components.csv'
+# functions that define components for each module
+define_functions = ['define_dynamic_lists', 'define_components', 'define_dynamic_components']
+
+def memory_mb():
+    """ Return the current resident memory of this process in MB (Linux only). """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024**2
+    except (IOError, ValueError, OSError):
+        return 0.0
+
+class Profile(object):
+    def __init__(self):
+        self.modules = OrderedDict()      # module name -> stats
+        self.component_module = {}        # component name -> module name
+        self.components = OrderedDict()   # component name -> stats
+        self.stack = []                   # components being constructed
+
+    def module_stats(self, module):
+        return self.modules.setdefault(module, dict(
+            define_time=0.0, load_time=0.0, construct_time=0.0, memory_mb=0.0,
+            components=0, variables=0, constraints=0, nonzeros=0
+        ))
+
+    def wrap_module(self, module):
+        """
+        Wrap the component-definition and input functions of a module so they
+        are timed and the components they add are attributed to this module.
+        """
+        name = module.__name__
+        self.module_stats(name)
+        for func_name in define_functions:
+            if hasattr(module, func_name):
+                setattr(module, func_name, self.timed_define(name, getattr(module, func_name)))
+        if hasattr(module, 'load_inputs'):
+            setattr(module, 'load_inputs', self.timed_load(name, module.load_inputs))
+
+    def timed_define(self, module, func):
+        def wrapper(m, *args, **kwargs):
+            before = set(m.component_map())
+            start = time.time()
+            result = func(m, *args, **kwargs)
+            self.modules[module]['define_time'] += time.time() - start
+            for c in m.component_map():
+                if c not in before:
+                    self.component_module[c] = module
+            return result
+        return wrapper
+
+    def timed_load(self, module, func):
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            result = func(*args, **kwargs)
+            self.modules[module]['load_time'] += time.time() - start
+            return result
+        return wrapper
+
+    def wrap_construct(self, model):
+        """
+        Time the construct() method of all the classes of components used in
+        model. Nested construction (e.g., of index sets) is counted separately
+        for each component.
+        """
+        patched = set()
+        for c in model.component_objects():
+            # find the class that actually defines construct() for this component
+            owner = next(cls for cls in type(c).__mro__ if 'construct' in cls.__dict__)
+            if owner not in patched:
+                patched.add(owner)
+                owner.construct = self.timed_construct(owner.construct)
+
+    def timed_construct(self, construct):
+        profile = self
+        def wrapper(self, *args, **kwargs):
+            frame = dict(start=time.time(), memory=memory_mb(), child_time=0.0, child_memory=0.0)
+            profile.stack.append(frame)
+            try:
+                return construct(self, *args, **kwargs)
+            finally:
+                profile.stack.pop()
+                elapsed = time.time() - frame['start']
+                memory = memory_mb() - frame['memory']
+                stats = profile.components.setdefault(
+                    self.name, dict(construct_time=0.0, memory_mb=0.0)
+                )
+                stats['construct_time'] += elapsed - frame['child_time']
+                stats['memory_mb'] += memory - frame['child_memory']
+                if profile.stack:
+                    profile.stack[-1]['child_time'] += elapsed
+                    profile.stack[-1]['child_memory'] += memory
+        return wrapper
+
+    def count_components(self, instance):
+        """
+        Count variables, constraints and nonzeros in each component of the
+        constructed instance, and total everything by module.
+        """
+        for c in instance.component_objects():
+            stats = self.components.setdefault(c.name, dict(construct_time=0.0, memory_mb=0.0))
+            stats.update(variables=0, constraints=0, nonzeros=0)
+            if component_type(c) is Var:
+                stats['variables'] = len(c)
+            elif component_type(c) is Constraint:
+                for cd in c.values():
+                    if cd.active:
+                        stats['constraints'] += 1
+                        stats['nonzeros'] += sum(1 for v in identify_variables(cd.body, include_fixed=False))
+        for name, stats in self.components.items():
+            # implicit index sets belong to the same module as their component
+            base_name = name[:-len('_index')] if name.endswith('_index') else name
+            module = self.component_module.get(
+                name, self.component_module.get(base_name, '(other)')
+            )
+            stats['module'] = module
+            m = self.module_stats(module)
+            m['components'] += 1
+            for k in ['construct_time', 'memory_mb', 'variables', 'constraints', 'nonzeros']:
+                m[k] += stats.get(k, 0)
+
+    def report(self, top=20):
+        cols = [
+            'define_time', 'load_time', 'construct_time', 'memory_mb',
+            'components', 'variables', 'constraints', 'nonzeros'
+        ]
+        with open(module_file, 'w') as f:
+            f.write(','.join(['module'] + cols) + '\n')
+            for module, stats in self.modules.items():
+                f.write(','.join([module] + [format_value(stats[c]) for c in cols]) + '\n')
+        with open(component_file, 'w') as f:
+            ccols = ['construct_time', 'memory_mb', 'variables', 'constraints', 'nonzeros']
+            f.write(','.join(['component', 'module'] + ccols) + '\n')
+            for name, stats in self.components.items():
+                f.write(','.join(
+                    [name, stats.get('module', '')]
+                    + [format_value(stats.get(c, 0)) for c in ccols]
+                ) + '\n')
+
+        print("\n{:<55} {:>8} {:>8} {:>10} {:>9} {:>10} {:>11} {:>11}".format(
+            'module', 'define_s', 'load_s', 'construct_s', 'memory_mb',
+            'variables', 'constraints', 'nonzeros'
+        ))
+        totals = dict((c, 0) for c in cols)
+        for module, s in self.modules.items():
+            print("{:<55} {:>8.2f} {:>8.2f} {:>10.2f} {:>9.1f} {:>10} {:>11} {:>11}".format(
+                module, s['define_time'], s['load_time'], s['construct_time'],
+                s['memory_mb'], s['variables'], s['constraints'], s['nonzeros']
+            ))
+            for c in cols:
+                totals[c] += s[c]
+        print("{:<55} {:>8.2f} {:>8.2f} {:>10.2f} {:>9.1f} {:>10} {:>11} {:>11}".format(
+            'total', totals['define_time'], totals['load_time'], totals['construct_time'],
+            totals['memory_mb'], totals['variables'], totals['constraints'], totals['nonzeros']
+        ))
+
+        print("\nSlowest components to construct:")
+        slowest = sorted(
+            self.components.items(), key=lambda x: x[1]['construct_time'], reverse=True
+        )[:top]
+        for name, s in slowest:
+            print("    {:>8.2f}s {:>8.1f} MB  {} ({})".format(
+                s['construct_time'], s['memory_mb'], name, s.get('module', '')
+            ))
+        print("\nSaved profile in {} and {}.".format(module_file, component_file))
+
+def component_type(c):
+    # older versions of Pyomo use c.type() instead of c.ctype
+    return c.ctype if hasattr(c, 'ctype') else c.type()
+
+def format_value(v):
+    return '{:.3f}'.format(v) if isinstance(v, float) else str(v)
+
+def main(args=None):
+    from switch_model import solve
+    from switch_model.utilities import create_model
+    import importlib
+
+    parser = argparse.ArgumentParser(
+        description='Profile model construction by module (see profile_construction.py). '
+        'Other arguments are passed to Switch as for `switch solve`.'
+    )
+    parser.add_argument('--top', type=int, default=20,
+        help='Number of slowest components to show (default is %(default)s).')
+    if args is None:
+        args = sys.argv[1:]
+    profile_args, switch_args = parser.parse_known_args(args)
+    switch_args = solve.get_option_file_args(extra_args=switch_args)
+
+    profile = Profile()
+    start = time.time()
+    module_list = solve.get_module_list(switch_args)
+    for name in module_list:
+        profile.wrap_module(importlib.import_module(name))
+    solve.patch_pyomo()
+    model = create_model(module_list, args=switch_args)
+    profile.wrap_construct(model)
+    instance = model.load_inputs()
+    print("Constructed model in {:.2f}s; counting variables and constraints...".format(
+        time.time() - start
+    ))
+    profile.count_components(instance)
+    profile.report(top=profile_args.top)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+"""
+Evaluate dispatch of a fixed construction plan over a long run of consecutive
+days, by solving overlapping windows of days in sequence and carrying the
+storage, pumped hydro and commitment state from each window to the next.
+
+The days are the single-day slices from slices.py, which each use one
+historical day (2007-08) to represent every period of inputs_annual, in date
+order. Each window combines several consecutive slices into one multi-day
+timeseries per period (with each day given an equal share of the period's
+weight) and is solved with `switch solve`. The state after the last kept day
+of each window is saved by carry_over_state.py and used as the starting state
+for the next window, which starts on the following day. The extra overlap
+days at the end of each window let it look ahead, so storage and commitment
+at the end of the kept days are not distorted by the end of the window; their
+results are discarded. Only one window is in memory at a time for each chain
+(below), so memory use depends on the window size, not the number of days.
+
+Since each window's timeseries are weighted to represent the whole period,
+period-level constraints such as RPS_Enforce and the fuel supply tier limits
+apply to every window separately, which is tighter than the annual
+evaluation, where they only need to be met over the whole year. To relax
+them, pass --linking-prices-file with prices for these constraints (see
+linking_prices.py), e.g., the linking_prices.csv file saved by
+parallel_dispatch.py.
+
+With --chains <n>, the windows are divided into n blocks of consecutive
+windows (chains) that are solved at the same time, each starting from the
+standard cyclic state. Then each chain after the first is solved again in a
+reconciliation pass, starting from the final state of the chain before it,
+until the end state of one of its windows matches the first pass (within
+--tolerance), after which the rest of the chain is unchanged. This is repeated
+as needed if the final state of a chain changes.
+
+Arguments other than the ones below are passed to `switch solve` for each
+window, e.g., the --ph-mw, --ph-year and --input-alias settings from the
+annual `switch solve` command in the README:
+
+    python rolling_horizon.py --window-days 7 --overlap-days 2 --chains 8 --ph-mw 150 --ph-year 2030 --input-alias gen_build_predetermined.csv=gen_build_predetermined_adjusted.csv generation_projects_info.csv=generation_projects_info_adjusted.csv --exclude-module switch_model.hawaii.heco_outlook_2020_08
+
+Inputs, outputs and the solver log for each window are in
+<outputs_dir>_windows/window_NNNN. Timepoint-level results for the kept days
+of every window (e.g., gen_dispatch.csv, load_balance.csv, StateOfCharge.csv)
+are combined in <outputs_dir> (default outputs_rolling). Period-level results
+include the overlap days, so they are not combined.
+"""
+
+import os, sys, time, shutil, argparse, subprocess, multiprocessing
+import pandas as pd
+
+import slices, carry_over_state
+from run_annual_by_year import timepoint_tables, read_text_table
+
+windows_suffix = '_windows'
+
+def window_path(outputs_dir, window_id):
+    return os.path.join(outputs_dir + windows_suffix, 'window_{:04d}'.format(window_id))
+
+def plan_windows(n_days, window_days, overlap_days):
+    """
+    Return a list of windows, each a tuple of (first day, first day after the
+    kept days, first day after the window), covering n_days days.
+    """
+    return [
+        (start, min(start + window_days, n_days), min(start + window_days + overlap_days, n_days))
+        for start in range(0, n_days, window_days)
+    ]
+
+def split_chains(window_ids, n_chains):
+    """ Divide window_ids into n_chains blocks of nearly equal length. """
+    n_chains = max(min(n_chains, len(window_ids)), 1)
+    size, extra = divmod(len(window_ids), n_chains)
+    chains, start = [], 0
+    for c in range(n_chains):
+        end = start + size + (1 if c < extra else 0)
+        chains.append(window_ids[start:end])
+        start = end
+    return chains
+
+def write_window_inputs(day_dirs, path):
+    """
+    Create an inputs directory in `path` that combines the single-day inputs
+    in day_dirs into one multi-day timeseries for each period. Files are
+    written to a temporary directory first, then moved into place when
+    complete, so partial inputs are never used.
+    """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    timeseries = pd.concat(
+        [pd.read_csv(os.path.join(d, 'timeseries.csv')) for d in day_dirs],
+        ignore_index=True
+    )
+    # use the first day's id for the timeseries for each period
+    window_ts = timeseries.groupby('ts_period', sort=False).agg(
+        TIMESERIES=('TIMESERIES', 'first'),
+        ts_duration_of_tp=('ts_duration_of_tp', 'first'),
+        ts_num_tps=('ts_num_tps', 'sum'),
+        ts_scale_to_period=('ts_scale_to_period', 'first'),
+    ).reset_index()
+    window_ts['ts_scale_to_period'] /= len(day_dirs)
+    window_ts[timeseries.columns].to_csv(os.path.join(tmp_path, 'timeseries.csv'), index=False)
+    ts_map = (
+        timeseries[['TIMESERIES', 'ts_period']]
+        .merge(window_ts[['TIMESERIES', 'ts_period']], on='ts_period', suffixes=('', '_window'))
+        .set_index('TIMESERIES')['TIMESERIES_window']
+    )
+    timepoints = pd.concat(
+        [pd.read_csv(os.path.join(d, 'timepoints.csv')) for d in day_dirs],
+        ignore_index=True
+    )
+    timepoints['timeseries'] = timepoints['timeseries'].map(ts_map)
+    # group the timepoints by timeseries, keeping the days in order
+    ts_order = {ts: i for i, ts in enumerate(window_ts['TIMESERIES'])}
+    timepoints = timepoints.iloc[
+        timepoints['timeseries'].map(ts_order).argsort(kind='mergesort')
+    ]
+    timepoints.to_csv(os.path.join(tmp_path, 'timepoints.csv'), index=False)
+
+    for file in sorted(os.listdir(day_dirs[0])):
+        if file in {'timeseries.csv', 'timepoints.csv'}:
+            continue
+        elif file in timepoint_tables:
+            pd.concat(
+                [read_text_table(os.path.join(d, file)) for d in day_dirs],
+                ignore_index=True
+            ).to_csv(os.path.join(tmp_path, file), index=False)
+        else:
+            shutil.copy2(os.path.join(day_dirs[0], file), os.path.join(tmp_path, file))
+    os.rename(tmp_path, path)
+
+def kept_timepoints(inputs_dir, n_tps):
+    """
+    Return the ids and timestamps (as strings) of all timepoints in inputs_dir
+    and of the first n_tps timepoints of each timeseries.
+    """
+    timepoints = read_text_table(os.path.join(inputs_dir, 'timepoints.csv'))
+    kept = timepoints.groupby('timeseries', sort=False).head(n_tps)
+    def labels(df):
+        return set(df['timepoint_id']) | set(df['timestamp'])
+    return labels(timepoints), labels(kept)
+
+def solve_window(window_id, settings, initial_state=None):
+    """
+    Create the inputs for one window if needed, then solve it with `switch
+    solve`, starting from the state in initial_state if specified. Returns
+    the path to the end state saved for the next window.
+    """
+    start_day, keep_end, end_day = settings['windows'][window_id]
+    path = window_path(settings['outputs_dir'], window_id)
+    inputs_dir = os.path.join(path, 'inputs')
+    outputs_dir = os.path.join(path, 'outputs')
+    log_file = os.path.join(path, 'solve.log')
+    if not os.path.exists(inputs_dir):
+        write_window_inputs(
+            [slices.slice_path(d) for d in settings['slice_ids'][start_day:end_day]],
+            inputs_dir
+        )
+    cmd = [
+        'switch', 'solve', '--inputs-dir', inputs_dir, '--outputs-dir', outputs_dir,
+        '--save-state-after-tps', str((keep_end - start_day) * settings['tps_per_day'])
+    ]
+    if initial_state is not None:
+        cmd += ['--initial-state-file', initial_state]
+    cmd += settings['switch_args']
+    with open(log_file, 'w') as f:
+        f.write(' '.join(cmd) + '\n\n')
+        f.flush()
+        returncode = subprocess.call(cmd, stdout=f, stderr=subprocess.STDOUT)
+    if returncode != 0:
+        raise RuntimeError(
+            'Window {} failed with return code {}; see {}.'
+            .format(window_id, returncode, log_file)
+        )
+    return os.path.join(outputs_dir, carry_over_state.state_file)
+
+def states_match(old, new, tolerance):
+    """ Return True if two states (see carry_over_state.read_state()) match within tolerance. """
+    if set(old) != set(new):
+        return False
+    for var in old:
+        if set(old[var]) != set(new[var]):
+            return False
+        if any(abs(old[var][k] - new[var][k]) > tolerance for k in old[var]):
+            return False
+    return True
+
+def solve_chain(job):
+    """
+    Solve the windows in a chain in order, carrying the state from each to
+    the next, starting from initial_state. If reconcile is True, stop as soon
+    as a window's end state matches its previous solution. Returns the chain
+    number, the number of windows solved and whether the final state of the
+    chain may have changed.
+    """
+    chain_id, window_ids, initial_state, settings, reconcile = job
+    state = initial_state
+    for i, window_id in enumerate(window_ids):
+        old_state = None
+        if reconcile:
+            old_path = os.path.join(
+                window_path(settings['outputs_dir'], window_id), 'outputs',
+                carry_over_state.state_file
+            )
+            old_state = carry_over_state.read_state(old_path)
+        state = solve_window(window_id, settings, state)
+        if reconcile and states_match(
+            old_state, carry_over_state.read_state(state), settings['tolerance']
+        ):
+            return chain_id, i+1, False
+    return chain_id, len(window_ids), True
+
+def solve_chains(chain_jobs, processes=None):
+    """
+    Solve several chains at the same time, in a pool of `processes` workers
+    (default is one per chain). Returns a list of the chains whose final state
+    may have changed. If any window fails, the other workers are stopped and
+    the error is raised immediately.
+    """
+    start = time.time()
+    changed = []
+    pool = multiprocessing.Pool(processes or len(chain_jobs))
+    try:
+        for chain_id, n_solved, final_changed in pool.imap_unordered(solve_chain, chain_jobs):
+            print("Finished chain {} ({} window(s) solved{}); elapsed time: {:.0f}s".format(
+                chain_id, n_solved, '' if final_changed else ', converged',
+                time.time() - start
+            ))
+            sys.stdout.flush()
+            if final_changed:
+                changed.append(chain_id)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return sorted(changed)
+
+def combine_outputs(window_ids, settings):
+    """
+    Combine the timepoint-level results for the kept days of each window in
+    settings['outputs_dir'].
+    """
+    start = time.time()
+    outputs_dir = settings['outputs_dir']
+    if not os.path.exists(outputs_dir):
+        os.makedirs(outputs_dir)
+    tables = {}
+    skipped = set()
+    for window_id in window_ids:
+        start_day, keep_end, end_day = settings['windows'][window_id]
+        path = window_path(outputs_dir, window_id)
+        all_tps, kept_tps = kept_timepoints(
+            os.path.join(path, 'inputs'), (keep_end - start_day) * settings['tps_per_day']
+        )
+        for file in sorted(os.listdir(os.path.join(path, 'outputs'))):
+            if not file.endswith('.csv') or file == carry_over_state.state_file:
+                continue
+            df = read_text_table(os.path.join(path, 'outputs', file))
+            tp_col = next(
+                (c for c in df.columns if len(df) and df[c].isin(all_tps).all()), None
+            )
+            if tp_col is None:
+                skipped.add(file)
+            else:
+                tables.setdefault(file, []).append(df[df[tp_col].isin(kept_tps)])
+    for file, frames in tables.items():
+        pd.concat(frames, ignore_index=True, sort=False).to_csv(
+            os.path.join(outputs_dir, file), index=False
+        )
+    print("Combined {} files from {} windows in {} in {:.1f}s.".format(
+        len(tables), len(window_ids), outputs_dir, time.time()-start
+    ))
+    if skipped:
+        print("Did not combine period-level results: {}.".format(', '.join(sorted(skipped))))
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Solve consecutive days in overlapping windows, carrying '
+        'storage and commitment state forward (see rolling_horizon.py). Other '
+        'arguments are passed to `switch solve` for each window.'
+    )
+    parser.add_argument('--slices', type=int, nargs=2, default=None, metavar=('FIRST', 'LAST'),
+        help='First and last slice to evaluate (default is all slices in {}).'
+        .format(slices.index_file))
+    parser.add_argument('--window-days', type=int, default=7,
+        help='Number of days kept from each window (default is %(default)s).')
+    parser.add_argument('--overlap-days', type=int, default=2,
+        help='Number of extra days at the end of each window, which are solved '
+        'again in the next window (default is %(default)s).')
+    parser.add_argument('--chains', type=int, default=1,
+        help='Number of blocks of windows to solve at the same time, followed '
+        'by a reconciliation pass (default is %(default)s).')
+    parser.add_argument('--processes', type=int, default=None,
+        help='Number of worker processes (default is one per chain).')
+    parser.add_argument('--tolerance', type=float, default=0.01,
+        help='Largest change in the end state of a window (MWh or MW) that '
+        'counts as a match during reconciliation (default is %(default)s).')
+    parser.add_argument('--outputs-dir', default='outputs_rolling',
+        help='Directory for the combined results (default is %(default)s).')
+    if args is None:
+        args = sys.argv[1:]
+    run_args, switch_args = parser.parse_known_args(args)
+
+    slice_ids = list(slices.read_index().index)
+    if run_args.slices is not None:
+        first, last = run_args.slices
+        slice_ids = [s for s in slice_ids if first <= s <= last]
+    if not slice_ids:
+        parser.error('No slices selected.')
+    slices.write_slices(slice_ids, processes=run_args.processes)
+    day_timeseries = pd.read_csv(os.path.join(slices.slice_path(slice_ids[0]), 'timeseries.csv'))
+
+    windows = plan_windows(len(slice_ids), run_args.window_days, run_args.overlap_days)
+    settings = dict(
+        outputs_dir=run_args.outputs_dir, slice_ids=slice_ids, windows=windows,
+        tps_per_day=int(day_timeseries['ts_num_tps'].iloc[0]),
+        tolerance=run_args.tolerance, switch_args=switch_args,
+    )
+    if os.path.exists(run_args.outputs_dir + windows_suffix):
+        shutil.rmtree(run_args.outputs_dir + windows_suffix)
+    os.makedirs(run_args.outputs_dir + windows_suffix)
+    chains = split_chains(list(range(len(windows))), run_args.chains)
+    print("Solving {} days in {} windows of up to {} days, in {} chain(s).".format(
+        len(slice_ids), len(windows), run_args.window_days + run_args.overlap_days,
+        len(chains)
+    ))
+    solve_chains(
+        [(c, chain, None, settings, False) for c, chain in enumerate(chains)],
+        run_args.processes
+    )
+
+    # reconcile each chain with the final state of the chain before it
+    stale = list(range(1, len(chains)))
+    reconcile_round = 0
+    while stale:
+        reconcile_round += 1
+        print("Reconciliation pass {} for {} chain(s).".format(reconcile_round, len(stale)))
+        jobs = []
+        for c in stale:
+            # copy the starting state, since the previous chain may be
+            # solved again at the same time
+            initial_state = os.path.join(
+                run_args.outputs_dir + windows_suffix, 'chain_{:04d}_initial_state.csv'.format(c)
+            )
+            shutil.copy2(
+                os.path.join(
+                    window_path(run_args.outputs_dir, chains[c-1][-1]), 'outputs',
+                    carry_over_state.state_file
+                ),
+                initial_state
+            )
+            jobs.append((c, chains[c], initial_state, settings, True))
+        changed = solve_chains(jobs, run_args.processes)
+        stale = [c + 1 for c in changed if c + 1 < len(chains)]
+
+    combine_outputs(list(range(len(windows))), settings)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
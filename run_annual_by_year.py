@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+"""
+Solve the annual evaluation of a fixed construction plan as separate one-year
+models, in parallel, then combine their results in the standard
+outputs_annual layout.
+
+Once the construction plan is fixed (e.g., by gen_build_predetermined_adjusted.csv
+from interpolate_construction_plan.py), the only links between years in the
+annual model are the predetermined builds and the pumped hydro project, so
+each year can be solved on its own. This creates a one-year inputs directory
+for each period in the annual inputs, with the timeseries, timepoints and
+period-specific data for that year and all builds from that year or earlier,
+then runs `switch solve` for each year in a pool of worker processes. Each
+one-year model is much smaller than the full annual model, so several can be
+solved at once.
+
+Arguments are the same as for the annual `switch solve` command in the
+README, plus a few that control this script, e.g.,
+
+    python run_annual_by_year.py --inputs-dir inputs_annual --outputs-dir outputs_annual --ph-mw 150 --ph-year 2030 --input-alias gen_build_predetermined.csv=gen_build_predetermined_adjusted.csv generation_projects_info.csv=generation_projects_info_adjusted.csv --exclude-module switch_model.hawaii.heco_outlook_2020_08 --processes 8
+
+--inputs-dir, --input-overlay, --input-alias, --ph-mw and --ph-year are
+applied when creating the one-year inputs; other arguments are passed to
+`switch solve` for each year, along with the settings in options.txt.
+
+Inputs, outputs and the solver log for each year are in
+<outputs_dir>_by_year/<year>. <year>.done is created in that directory when a
+year finishes successfully; if this script is interrupted, running it again
+only solves the years that have not finished yet (use --rerun to solve all of
+them again). When all years have finished, their outputs are combined in
+<outputs_dir>:
+
+- most tables are concatenated, dropping rows that are repeated across years
+  (e.g., predetermined builds from earlier years)
+- total_cost.txt and cost_components.csv are summed across years
+- year columns of annual_details_*.csv and compare_eia_switch_production.csv
+  are combined side by side
+- summary.csv is recalculated from the per-year summaries; the all-years
+  renewable and biofuel shares are weighted by each year's demand, which is
+  close to, but not exactly, the generation used as weights in the full model
+
+Pumped hydro is built in each year that is at or after --ph-year, since the
+one-year models can't see earlier periods; its annual cost depends only on
+the capacity in place, so this gives the same costs as the full model, and
+BuildPumpedHydroMW.csv and BuildAnyPumpedHydro.csv are corrected to show
+construction only in --ph-year. Fuel market tiers are also chosen separately
+in each year, so this should only be used with tiers that are forced on or
+off (e.g., with --force-lng-tier none, as in options.txt).
+"""
+
+import os, sys, time, shutil, argparse, subprocess, multiprocessing
+from collections import OrderedDict
+import pandas as pd
+
+import input_overlay
+
+by_year_suffix = '_by_year'
+# tables indexed by timepoint; rows for timepoints in other years are dropped
+timepoint_tables = [
+    'loads.csv', 'variable_capacity_factors.csv', 'gen_timepoint_commit_bounds.csv',
+    'ev_bau_load.csv', 'ev_charging_bids.csv',
+]
+# tables indexed by period, and the column that identifies the period
+period_tables = OrderedDict([
+    ('periods.csv', 'INVESTMENT_PERIOD'),
+    ('timeseries.csv', 'ts_period'),
+    ('fuel_supply_curves.csv', 'period'),
+    ('ev_fleet_info.csv', 'PERIOD'),
+    ('ev_share.csv', 'PERIOD'),
+    ('ev_fleet_info_advanced.csv', 'PERIOD'),
+])
+# tables indexed by build year; builds after each year are dropped
+build_year_tables = ['gen_build_costs.csv', 'gen_build_predetermined.csv']
+# output tables with one column per year: number of key columns and header rows
+wide_outputs = {
+    'annual_details_by_owner.csv': (2, 1),
+    'annual_details_by_tech.csv': (5, 1),
+    'compare_eia_switch_production.csv': (3, 2),
+}
+# outputs that show pumped hydro construction by period
+pumped_hydro_build_outputs = ['BuildPumpedHydroMW.csv', 'BuildAnyPumpedHydro.csv']
+# outputs that describe each run, which are not combined
+run_outputs = ['model_config.json']
+
+# base tables read by read_base_tables(), shared with the worker processes
+base_tables = {}
+
+def year_dir(outputs_dir, year):
+    return os.path.join(outputs_dir + by_year_suffix, str(year))
+
+def done_file(outputs_dir, year):
+    return os.path.join(year_dir(outputs_dir, year), '{}.done'.format(year))
+
+def parse_aliases(aliases):
+    """
+    Return a dict of standard file name -> replacement file name, from a list
+    of --input-alias settings (standard=replacement).
+    """
+    parsed = {}
+    for a in aliases:
+        standard, replacement = a.split('=')
+        parsed[standard] = replacement
+    return parsed
+
+def read_base_tables(inputs, aliases):
+    """
+    Read the tables that are filtered or patched when creating one-year inputs
+    from `inputs` (an inputs directory or an overlay file), with the specified
+    aliases applied. Returns a list of (file, source) pairs for all the input
+    files, where source is the file in the base directory that each one is
+    copied or filtered from.
+    """
+    base_dir = input_overlay.inputs_dir(inputs)
+    patched = set()
+    if inputs.endswith('.json'):
+        patched = set(p['file'] for p in input_overlay.read_overlay(inputs)['patches'])
+    replaced = set(aliases.values()) - set(aliases.keys())
+    files = []
+    for file in sorted(os.listdir(base_dir)):
+        if file in replaced or not os.path.isfile(os.path.join(base_dir, file)):
+            continue
+        source = aliases.get(file, file)
+        files.append((file, source))
+        if (
+            file in timepoint_tables or file in period_tables
+            or file in build_year_tables or file == 'timepoints.csv'
+            or source in patched
+        ):
+            base_tables[file] = input_overlay.read_csv(inputs, source, na_values=['.'])
+    return files
+
+def write_year_inputs(year, base_dir, files, path, timeseries=None):
+    """
+    Create a one-year inputs directory for `year` in `path`, from the tables
+    read by read_base_tables() and the other files in base_dir. If
+    `timeseries` is specified, only those timeseries are included, and they
+    are scaled up to fill the whole year. Files are written to a temporary
+    directory first, then moved into place when complete, so partial inputs
+    are never used.
+    """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    all_timeseries = base_tables['timeseries.csv']
+    all_timeseries = all_timeseries[all_timeseries['ts_period'] == year]
+    if timeseries is not None:
+        selected = all_timeseries['TIMESERIES'].isin(timeseries)
+        weights = timeseries_weights(all_timeseries)
+        all_timeseries = all_timeseries[selected].copy()
+        all_timeseries['ts_scale_to_period'] *= weights.sum() / weights[selected].sum()
+    year_timeseries = all_timeseries['TIMESERIES']
+    timepoints = base_tables['timepoints.csv']
+    year_timepoints = timepoints.loc[
+        timepoints['timeseries'].isin(year_timeseries), 'timepoint_id'
+    ]
+    for file, source in files:
+        if file not in base_tables:
+            shutil.copy2(os.path.join(base_dir, source), os.path.join(tmp_path, file))
+            continue
+        df = base_tables[file]
+        if file == 'timeseries.csv':
+            df = all_timeseries
+        elif file in period_tables:
+            df = df[df[period_tables[file]] == year]
+        elif file in build_year_tables:
+            df = df[df['build_year'] <= year]
+        elif file == 'timepoints.csv':
+            df = df[df['timepoint_id'].isin(year_timepoints)]
+        elif file in timepoint_tables:
+            tp_col = next(c for c in df.columns if c.lower() == 'timepoint')
+            df = df[df[tp_col].isin(year_timepoints)]
+        df.to_csv(os.path.join(tmp_path, file), na_rep='.', index=False)
+    os.rename(tmp_path, path)
+
+def timeseries_weights(timeseries):
+    """ Return the number of hours represented by each row of a timeseries table. """
+    return (
+        timeseries['ts_duration_of_tp'] * timeseries['ts_num_tps']
+        * timeseries['ts_scale_to_period']
+    )
+
+def pumped_hydro_args(year, ph_mw, ph_year):
+    """
+    Return arguments to give the one-year model for `year` the same pumped
+    hydro capacity as the full model.
+    """
+    if ph_mw is None:
+        return []
+    return [
+        '--ph-mw', str(ph_mw if year >= ph_year else 0.0),
+        '--ph-year', str(year)
+    ]
+
+def solve_year(job):
+    """
+    Create the inputs for one year if needed, then solve it with `switch
+    solve`. Returns the year, the return code from `switch solve` and the
+    log file.
+    """
+    year, settings = job
+    path = year_dir(settings['outputs_dir'], year)
+    inputs_dir = os.path.join(path, 'inputs')
+    outputs_dir = os.path.join(path, 'outputs')
+    log_file = os.path.join(path, 'solve.log')
+    if not os.path.exists(inputs_dir):
+        write_year_inputs(year, settings['base_dir'], settings['files'], inputs_dir)
+    cmd = (
+        ['switch', 'solve', '--inputs-dir', inputs_dir, '--outputs-dir', outputs_dir]
+        + pumped_hydro_args(year, settings['ph_mw'], settings['ph_year'])
+        + settings['switch_args']
+    )
+    with open(log_file, 'w') as f:
+        f.write(' '.join(cmd) + '\n\n')
+        f.flush()
+        returncode = subprocess.call(cmd, stdout=f, stderr=subprocess.STDOUT)
+    if returncode == 0:
+        with open(done_file(settings['outputs_dir'], year), 'w') as f:
+            f.write(time.ctime() + '\n')
+    return year, returncode, log_file
+
+def solve_years(years, settings, processes=None):
+    """
+    Solve the one-year models for the specified years in a pool of
+    `processes` workers (default is one per core). Returns a list of the
+    years that failed.
+    """
+    start = time.time()
+    failed = []
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        jobs = [(y, settings) for y in years]
+        for i, (year, returncode, log_file) in enumerate(pool.imap_unordered(solve_year, jobs)):
+            if returncode == 0:
+                print("Finished {} ({}/{}); elapsed time: {:.0f}s".format(
+                    year, i+1, len(years), time.time()-start
+                ))
+            else:
+                print("ERROR: {} failed with return code {}; see {}.".format(
+                    year, returncode, log_file
+                ))
+                failed.append(year)
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+    return sorted(failed)
+
+def read_text_table(path, **kwargs):
+    # keep values exactly as written by the one-year models
+    return pd.read_csv(path, dtype=str, keep_default_na=False, **kwargs)
+
+def stitch_table(paths):
+    df = pd.concat([read_text_table(p) for p in paths], ignore_index=True, sort=False)
+    return df.drop_duplicates()
+
+def stitch_wide_table(paths, key_cols, header_rows):
+    header = list(range(header_rows)) if header_rows > 1 else 0
+    df = pd.concat(
+        [read_text_table(p, header=header, index_col=list(range(key_cols))) for p in paths],
+        axis=1, sort=False
+    )
+    # columns for historical data are repeated in every year
+    return df.loc[:, ~df.columns.duplicated()]
+
+def stitch_summary(years, year_outputs):
+    """
+    Combine the one-row summary.csv files from each year into one row, with
+    totals for all years recalculated from the values for each year.
+    """
+    rows = [
+        pd.read_csv(os.path.join(year_outputs[y], 'summary.csv'), float_precision='round_trip').iloc[0]
+        for y in years
+    ]
+    weights = []
+    for y in years:
+        cost_file = os.path.join(year_outputs[y], 'electricity_cost.csv')
+        if os.path.exists(cost_file):
+            weights.append(pd.read_csv(cost_file)['SystemDemand_MWh'].sum())
+        else:
+            weights.append(1.0)
+    # expand columns for the first year into columns for every year
+    first_year = '_{}'.format(years[0])
+    columns = []
+    for c in rows[0].index:
+        if c.endswith(first_year):
+            columns.extend(c[:-len(first_year)] + '_{}'.format(y) for y in years)
+        else:
+            columns.append(c)
+    summary = {}
+    for r in rows:
+        summary.update(r.to_dict())
+    summary['total_cost'] = sum(r['total_cost'] for r in rows)
+    # cost_per_kwh is total cost / discounted demand, so discounted demand
+    # for each year is total_cost / cost_per_kwh
+    summary['cost_per_kwh'] = summary['total_cost'] / sum(
+        r['total_cost'] / r['cost_per_kwh'] for r in rows
+    )
+    for c in columns:
+        if c.endswith('_all_years'):
+            summary[c] = sum(r[c] * w for r, w in zip(rows, weights)) / sum(weights)
+    return pd.DataFrame([summary], columns=columns)
+
+def stitch_outputs(years, year_outputs, outputs_dir, ph_year=None):
+    """
+    Combine the outputs from the one-year models (year_outputs is a dict of
+    year -> outputs directory) into outputs_dir. Files in outputs_dir that
+    aren't written by the one-year models are left in place.
+    """
+    start = time.time()
+    if not os.path.exists(outputs_dir):
+        os.makedirs(outputs_dir)
+    files = []
+    for y in years:
+        for file in sorted(os.listdir(year_outputs[y])):
+            if file not in files and os.path.isfile(os.path.join(year_outputs[y], file)):
+                files.append(file)
+    skipped = []
+    for file in files:
+        paths = [
+            os.path.join(year_outputs[y], file) for y in years
+            if os.path.exists(os.path.join(year_outputs[y], file))
+        ]
+        out_path = os.path.join(outputs_dir, file)
+        if file == 'total_cost.txt':
+            total = 0.0
+            for p in paths:
+                with open(p) as f:
+                    total += float(f.read())
+            with open(out_path, 'w') as f:
+                f.write('{}\n'.format(total))
+        elif file == 'cost_components.csv':
+            df = pd.concat([pd.read_csv(p, float_precision='round_trip') for p in paths])
+            df.groupby('component', sort=False).sum().to_csv(out_path)
+        elif file == 'summary.csv':
+            stitch_summary(years, year_outputs).to_csv(out_path, index=False)
+        elif file in wide_outputs:
+            stitch_wide_table(paths, *wide_outputs[file]).to_csv(out_path)
+        elif file in pumped_hydro_build_outputs:
+            df = stitch_table(paths)
+            # each one-year model at or after ph_year builds the project
+            df.loc[df.iloc[:, 1] != str(ph_year), df.columns[-1]] = '0.0'
+            df.to_csv(out_path, index=False)
+        elif file.endswith('.csv') and file not in run_outputs:
+            stitch_table(paths).to_csv(out_path, index=False)
+        else:
+            skipped.append(file)
+    print("Combined {} files from {} years in {} in {:.1f}s.".format(
+        len(files) - len(skipped), len(years), outputs_dir, time.time()-start
+    ))
+    if skipped:
+        print("Did not combine {}.".format(', '.join(skipped)))
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Solve the annual evaluation as separate one-year models '
+        'and combine the results (see run_annual_by_year.py). Other arguments '
+        'are passed to `switch solve` for each year.'
+    )
+    parser.add_argument('--inputs-dir', default='inputs_annual',
+        help='Annual inputs directory (default is %(default)s).')
+    parser.add_argument('--input-overlay', default=None,
+        help='Overlay file to apply to the annual inputs (overrides --inputs-dir).')
+    parser.add_argument('--outputs-dir', default='outputs_annual',
+        help='Directory for the combined results (default is %(default)s).')
+    parser.add_argument('--input-aliases', '--input-alias', nargs='+', default=[],
+        help='Input file aliases to use when creating the one-year inputs, '
+        'as for `switch solve`.')
+    parser.add_argument('--ph-mw', type=float, default=None,
+        help='Total capacity of pumped storage hydro, as for `switch solve`.')
+    parser.add_argument('--ph-year', type=int, default=None,
+        help='Year when pumped storage hydro is built, as for `switch solve`.')
+    parser.add_argument('--years', type=int, nargs='+', default=None,
+        help='Only solve these years (results are combined when all years '
+        'have finished).')
+    parser.add_argument('--processes', type=int, default=None,
+        help='Number of years to solve at the same time (default is one per core).')
+    parser.add_argument('--rerun', action='store_true', default=False,
+        help='Solve years again even if they have already finished.')
+    if args is None:
+        args = sys.argv[1:]
+    run_args, switch_args = parser.parse_known_args(args)
+
+    inputs = run_args.input_overlay or run_args.inputs_dir
+    base_dir = input_overlay.inputs_dir(inputs)
+    if (
+        os.path.exists(os.path.join(base_dir, 'pumped_hydro.csv'))
+        and (run_args.ph_mw is None or run_args.ph_year is None)
+    ):
+        parser.error(
+            'The one-year models need a fixed pumped hydro plan: specify both '
+            '--ph-mw and --ph-year (use --ph-mw 0 for no pumped hydro).'
+        )
+
+    files = read_base_tables(inputs, parse_aliases(run_args.input_aliases))
+    all_years = [int(y) for y in base_tables['periods.csv']['INVESTMENT_PERIOD']]
+    years = all_years if run_args.years is None else run_args.years
+    unknown = sorted(set(years) - set(all_years))
+    if unknown:
+        parser.error('{} not found in periods.csv in {}.'.format(
+            ', '.join(str(y) for y in unknown), base_dir
+        ))
+    if run_args.rerun:
+        for y in years:
+            if os.path.exists(year_dir(run_args.outputs_dir, y)):
+                shutil.rmtree(year_dir(run_args.outputs_dir, y))
+    for y in years:
+        if not os.path.exists(year_dir(run_args.outputs_dir, y)):
+            os.makedirs(year_dir(run_args.outputs_dir, y))
+    todo = [y for y in years if not os.path.exists(done_file(run_args.outputs_dir, y))]
+    print("Solving {} one-year models ({} already finished).".format(
+        len(todo), len(years) - len(todo)
+    ))
+    settings = dict(
+        outputs_dir=run_args.outputs_dir, base_dir=base_dir, files=files,
+        ph_mw=run_args.ph_mw, ph_year=run_args.ph_year, switch_args=switch_args,
+    )
+    failed = solve_years(todo, settings, run_args.processes) if todo else []
+    if failed:
+        print("ERROR: {} year(s) failed: {}.".format(
+            len(failed), ', '.join(str(y) for y in failed)
+        ))
+        return 1
+
+    unfinished = [y for y in all_years if not os.path.exists(done_file(run_args.outputs_dir, y))]
+    if unfinished:
+        print("Not combining results until all years have finished ({} remaining).".format(
+            len(unfinished)
+        ))
+        return 0
+    year_outputs = {y: os.path.join(year_dir(run_args.outputs_dir, y), 'outputs') for y in all_years}
+    stitch_outputs(all_years, year_outputs, run_args.outputs_dir, run_args.ph_year)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+"""
+Solve several scenarios from scenarios.txt at the same time, as memory and
+processor cores allow.
+
+Each scenario is solved by running `switch solve` with the arguments from its
+line in scenarios.txt (options.txt is read by `switch solve` as usual). Output
+from each scenario is written to scenario_runs/<scenario>.log instead of the
+terminal.
+
+Before starting each scenario, this script estimates how much memory and how
+many cores it will need (by default about 6 GB for the Python model instance
+plus 1.2 GB per CPLEX thread, and one core per thread, as noted in
+options.txt), and waits until enough are available, considering the other
+scenarios that are running. Scenarios that write to the same outputs
+directory are never run at the same time.
+
+When a scenario finishes successfully, scenario_runs/<scenario>.done is
+created. If this script is interrupted, running it again will only run the
+scenarios that have not finished yet. Use --rerun to solve finished scenarios
+again, or delete their .done files.
+
+Examples:
+
+    python run_scenarios.py
+    python run_scenarios.py --scenarios base resist --max-memory 32
+    python run_scenarios.py --max-cores 8 --extra-args "--inputs-dir inputs_tiny"
+"""
+
+import os, sys, time, shlex, argparse, subprocess
+
+runs_dir = 'scenario_runs'
+# estimated memory (GB) used by each Python model instance and by each solver
+# thread (see notes in options.txt)
+default_model_memory = 6.0
+default_thread_memory = 1.2
+
+def read_arg_file(path):
+    """
+    Return a list of argument lists, one for each non-blank line in path that
+    isn't commented out with #.
+    """
+    with open(path) as f:
+        return [
+            shlex.split(line) for line in f.read().splitlines()
+            if line.strip() and not line.lstrip().startswith('#')
+        ]
+
+def arg_value(args, name, default=None):
+    """
+    Return the value given for option `name` in args (the last one if
+    specified more than once), or default if not specified.
+    """
+    value = default
+    for i, a in enumerate(args):
+        if a == name and i + 1 < len(args):
+            value = args[i+1]
+        elif a.startswith(name + '='):
+            value = a[len(name)+1:]
+    return value
+
+def solver_threads(args):
+    """
+    Return the number of threads the solver will use, based on the threads=N
+    setting in --solver-options-string (1 if not specified).
+    """
+    options = arg_value(args, '--solver-options-string', '')
+    threads = 1
+    for setting in shlex.split(options):
+        if setting.startswith('threads='):
+            threads = max(int(setting[len('threads='):]), 1)
+    return threads
+
+def get_scenarios(scenario_file, option_file, extra_args=[]):
+    """
+    Return a list of dicts describing each scenario in scenario_file, including
+    its name, arguments, outputs directory and number of solver threads.
+    """
+    option_args = [a for line in read_arg_file(option_file) for a in line]
+    scenarios = []
+    for args in read_arg_file(scenario_file):
+        args = args + extra_args
+        all_args = option_args + args
+        name = arg_value(args, '--scenario-name')
+        if name is None:
+            raise ValueError(
+                'No --scenario-name specified for scenario {} in {}.'
+                .format(' '.join(args), scenario_file)
+            )
+        scenarios.append(dict(
+            name=name,
+            args=args,
+            outputs_dir=os.path.normpath(arg_value(all_args, '--outputs-dir', 'outputs')),
+            threads=solver_threads(all_args),
+        ))
+    return scenarios
+
+def available_memory():
+    """
+    Return the memory (GB) currently available for new processes, or None if
+    this can't be determined.
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024**2
+    except IOError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES') / 1024**3
+    except (ValueError, AttributeError, OSError):
+        return None
+
+def done_file(name):
+    return os.path.join(runs_dir, name + '.done')
+
+def log_file(name):
+    return os.path.join(runs_dir, name + '.log')
+
+def start_scenario(s, switch_cmd):
+    cmd = shlex.split(switch_cmd) + s['args']
+    log = open(log_file(s['name']), 'w')
+    log.write(' '.join(shlex.quote(a) for a in cmd) + '\n\n')
+    log.flush()
+    s['log'] = log
+    s['start'] = time.time()
+    s['process'] = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+    print("Started {} (pid {}, {:.1f} GB, {} thread(s)); log in {}.".format(
+        s['name'], s['process'].pid, s['memory'], s['threads'], log_file(s['name'])
+    ))
+
+def finish_scenario(s):
+    s['log'].close()
+    elapsed = (time.time() - s['start']) / 60
+    if s['process'].returncode == 0:
+        with open(done_file(s['name']), 'w') as f:
+            f.write('finished {} after {:.1f} minutes\n'.format(time.ctime(), elapsed))
+        print("Finished {} in {:.1f} minutes.".format(s['name'], elapsed))
+    else:
+        print("Scenario {} failed with exit code {} after {:.1f} minutes; see {}.".format(
+            s['name'], s['process'].returncode, elapsed, log_file(s['name'])
+        ))
+
+def run_scenarios(scenarios, max_memory, max_cores, switch_cmd='switch solve', poll_interval=10):
+    """
+    Run the specified scenarios, starting each one (in order) when the memory
+    and cores it needs are available. Returns a list of the scenarios that
+    failed.
+    """
+    queue = list(scenarios)
+    running = []
+    failed = []
+    for s in queue:
+        if s['memory'] > max_memory or s['threads'] > max_cores:
+            print(
+                "WARNING: scenario {} needs {:.1f} GB and {} core(s), but only "
+                "{:.1f} GB and {} core(s) are allowed; it will be run by itself."
+                .format(s['name'], s['memory'], s['threads'], max_memory, max_cores)
+            )
+    try:
+        while queue or running:
+            # check for finished scenarios
+            for s in list(running):
+                if s['process'].poll() is not None:
+                    running.remove(s)
+                    finish_scenario(s)
+                    if s['process'].returncode != 0:
+                        failed.append(s['name'])
+            # start any scenarios that fit in the remaining capacity
+            for s in list(queue):
+                used_memory = sum(r['memory'] for r in running)
+                used_cores = sum(r['threads'] for r in running)
+                free_memory = available_memory()
+                fits = (
+                    not running or (
+                        used_memory + s['memory'] <= max_memory
+                        and used_cores + s['threads'] <= max_cores
+                        # other users of this computer may be using memory
+                        # that we haven't accounted for
+                        and (free_memory is None or s['memory'] <= free_memory)
+                    )
+                )
+                busy = any(r['outputs_dir'] == s['outputs_dir'] for r in running)
+                if fits and not busy:
+                    queue.remove(s)
+                    start_scenario(s, switch_cmd)
+                    running.append(s)
+                    # give the new process time to allocate memory before
+                    # checking available memory again
+                    break
+            if queue or running:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("\nInterrupted; stopping {} running scenario(s).".format(len(running)))
+        for s in running:
+            s['process'].terminate()
+        for s in running:
+            s['process'].wait()
+            s['log'].close()
+        raise
+    return failed
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Solve scenarios from scenarios.txt in parallel (see run_scenarios.py).'
+    )
+    parser.add_argument('--scenarios', nargs='+', default=None,
+        help='Names of scenarios to run (default is all scenarios in the scenario list).')
+    parser.add_argument('--scenario-list', default='scenarios.txt',
+        help='File with arguments for each scenario, one scenario per line.')
+    parser.add_argument('--options-file', default='options.txt',
+        help='File with default options for all scenarios (used to estimate resource needs).')
+    parser.add_argument('--max-memory', type=float, default=None,
+        help='Maximum total memory (GB) for all running scenarios '
+        '(default is the memory available when this script starts).')
+    parser.add_argument('--max-cores', type=int, default=None,
+        help='Maximum total solver threads for all running scenarios '
+        '(default is the number of cores).')
+    parser.add_argument('--model-memory', type=float, default=default_model_memory,
+        help='Estimated memory (GB) for each model instance (default is %(default)s).')
+    parser.add_argument('--thread-memory', type=float, default=default_thread_memory,
+        help='Estimated memory (GB) per solver thread (default is %(default)s).')
+    parser.add_argument('--extra-args', default='',
+        help='Additional arguments to pass to `switch solve` for all scenarios.')
+    parser.add_argument('--switch-cmd', default='switch solve',
+        help='Command used to solve each scenario (default is "%(default)s").')
+    parser.add_argument('--rerun', action='store_true', default=False,
+        help='Solve scenarios again even if they have finished before.')
+    args = parser.parse_args(args)
+
+    scenarios = get_scenarios(args.scenario_list, args.options_file, shlex.split(args.extra_args))
+    if args.scenarios is not None:
+        unknown = set(args.scenarios) - set(s['name'] for s in scenarios)
+        if unknown:
+            parser.error('Scenario(s) not found in {}: {}'.format(
+                args.scenario_list, ', '.join(sorted(unknown))
+            ))
+        scenarios = [s for s in scenarios if s['name'] in args.scenarios]
+    for s in scenarios:
+        s['memory'] = args.model_memory + args.thread_memory * s['threads']
+
+    if not os.path.exists(runs_dir):
+        os.makedirs(runs_dir)
+    if args.rerun:
+        for s in scenarios:
+            if os.path.exists(done_file(s['name'])):
+                os.remove(done_file(s['name']))
+    finished = [s['name'] for s in scenarios if os.path.exists(done_file(s['name']))]
+    if finished:
+        print("Skipping finished scenario(s): {}".format(', '.join(finished)))
+    scenarios = [s for s in scenarios if s['name'] not in finished]
+
+    max_memory = args.max_memory
+    if max_memory is None:
+        max_memory = available_memory()
+    if max_memory is None:
+        parser.error('Unable to determine available memory; please specify --max-memory.')
+    max_cores = args.max_cores
+    if max_cores is None:
+        max_cores = os.cpu_count() or 1
+    print("Running {} scenario(s) with up to {:.1f} GB of memory and {} core(s).".format(
+        len(scenarios), max_memory, max_cores
+    ))
+    sys.stdout.flush()
+
+    failed = run_scenarios(scenarios, max_memory, max_cores, switch_cmd=args.switch_cmd)
+    if failed:
+        print("The following scenario(s) failed: {}".format(', '.join(failed)))
+        return 1
+    print("All scenarios finished.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
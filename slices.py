@@ -0,0 +1,219 @@
+from __future__ import print_function, division
+"""
+Create inputs for single-day "slices" of the study for post-optimization
+evaluation. Each slice uses one historical day (2007-08) to represent every
+period of a base inputs directory (normally inputs_annual), so the slices
+together cover the full historical record.
+
+Slices are built lazily: get_slice_dir(slice_id) returns the inputs directory
+for one slice, creating it first if needed, and write_slices() creates any
+missing slices from a list using a pool of worker processes. Completed slices
+are cached in inputs_slices/slice_NNNN and are never rebuilt, so only slices
+that are actually requested are created, and each only once.
+
+inputs_slices/index.csv lists the date and inputs directory for each slice id.
+It is created by write_index() (called from get_scenario_data.py), which also
+saves the settings needed to create slices later in
+inputs_slices/slice_settings.json. After that, slices can be created on demand
+without rerunning get_scenario_data.py, e.g.,
+
+    python slices.py 0 1 2 3
+    python slices.py --all --processes 8
+
+Creating slices needs the same database access as get_scenario_data.py.
+"""
+
+import os, sys, json, time, shutil, argparse, multiprocessing
+import pandas as pd
+
+import switch_model.hawaii.scenario_data as scenario_data
+import time_sample_inputs
+
+slices_dir = 'inputs_slices'
+index_file = os.path.join(slices_dir, 'index.csv')
+settings_file = os.path.join(slices_dir, 'slice_settings.json')
+# historical years to use for slices
+slice_years = (2007, 2008)
+# arguments from get_scenario_data.py that are needed to create slices
+slice_arg_names = [
+    'load_zones', 'load_scenario', 'ev_scenario', 'ev_charge_profile',
+    'enable_must_run_before', 'skip_cf', 'skip_ev_bids', 'compact_ev_bids',
+]
+
+def slice_path(slice_id):
+    return os.path.join(slices_dir, 'slice_{:04d}'.format(slice_id))
+
+def write_index(base_inputs_dir, args):
+    """
+    Identify the historical days with complete load data, assign a slice id to
+    each one and save the index and settings needed to create the slices.
+    """
+    args = dict(args, slice_years=slice_years)
+    days = time_sample_inputs.read_sql("""
+        SELECT date_time::date AS date, count(*) AS n_hours
+        FROM system_load
+        WHERE load_zone IN %(load_zones)s
+            AND extract(year from date_time) IN %(slice_years)s
+        GROUP BY 1
+        ORDER BY 1;
+    """, args)
+    days = days[days['n_hours'] == 24 * len(args['load_zones'])]
+    index = pd.DataFrame({
+        'slice_id': range(len(days)),
+        'date': pd.to_datetime(days['date']).dt.strftime('%Y-%m-%d').values,
+    })
+    index['inputs_dir'] = index['slice_id'].map(slice_path)
+
+    # identify variable projects in the base inputs, and their database ids
+    # (needed for capacity factors)
+    gen_info = pd.read_csv(
+        os.path.join(base_inputs_dir, 'generation_projects_info.csv'), na_values=['.']
+    )
+    variable_gens = set(gen_info.loc[gen_info['gen_is_variable'] == 1, 'GENERATION_PROJECT'])
+    projects = time_sample_inputs.read_sql("""
+        SELECT
+            CONCAT_WS('_', load_zone, technology, nullif(site, 'na'), nullif(orientation, 'na'))
+                AS "GENERATION_PROJECT",
+            project_id
+        FROM project
+        WHERE load_zone IN %(load_zones)s;
+    """, args)
+    projects = projects[projects['GENERATION_PROJECT'].isin(variable_gens)]
+
+    if not os.path.exists(slices_dir):
+        os.makedirs(slices_dir)
+    index.to_csv(index_file, index=False)
+    with open(settings_file, 'w') as f:
+        json.dump(
+            dict(
+                base_inputs_dir=base_inputs_dir,
+                args={a: args[a] for a in slice_arg_names if a in args},
+                projects=[list(p) for p in projects.itertuples(index=False, name=None)],
+            ),
+            f, indent=4
+        )
+    print("Saved index of {} slices in {}.".format(len(index), index_file))
+
+def read_index():
+    return pd.read_csv(index_file).set_index('slice_id')
+
+def read_settings():
+    with open(settings_file) as f:
+        settings = json.load(f)
+    # queries need tuples instead of lists
+    settings['args']['load_zones'] = tuple(settings['args']['load_zones'])
+    settings['projects'] = [tuple(p) for p in settings['projects']]
+    return settings
+
+def get_slice_dir(slice_id):
+    """
+    Return the inputs directory for the specified slice, creating it if needed.
+    """
+    path = slice_path(slice_id)
+    if not os.path.exists(path):
+        write_slice(slice_id)
+    return path
+
+def write_slices(slice_ids, processes=None):
+    """
+    Create any of the specified slices that don't exist yet, using a pool of
+    `processes` workers (default is one per core).
+    """
+    missing = [i for i in slice_ids if not os.path.exists(slice_path(i))]
+    print("Creating {} slice(s) ({} already exist).".format(
+        len(missing), len(slice_ids) - len(missing)
+    ))
+    if not missing:
+        return
+    start = time.time()
+    # forked workers can't share the database connection, so they each create
+    # their own
+    if scenario_data.con is not None:
+        scenario_data.con.close()
+        scenario_data.con = None
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        for i, slice_id in enumerate(pool.imap_unordered(write_slice, missing)):
+            print("Finished slice {} ({}/{}); elapsed time: {:.0f}s".format(
+                slice_id, i+1, len(missing), time.time()-start
+            ))
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+def write_slice(slice_id):
+    """
+    Create the inputs directory for one slice. Tables are written to a
+    temporary directory first, then moved into place when complete, so
+    partial slices are never used.
+    """
+    settings = read_settings()
+    base_inputs_dir = settings['base_inputs_dir']
+    date = read_index().loc[slice_id, 'date']
+    path = slice_path(slice_id)
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    # capacity factors are retrieved in this process (no nested worker pools)
+    args = dict(settings['args'], inputs_dir=tmp_path, cf_processes=1)
+    time_sample_inputs.write_tables(
+        base_inputs_dir, args,
+        timepoints=get_timepoints(base_inputs_dir, date, args),
+        projects=settings['projects']
+    )
+    os.rename(tmp_path, path)
+    return slice_id
+
+def get_timepoints(base_inputs_dir, date, args):
+    """
+    Return a timepoints DataFrame (see time_sample_inputs.add_timestamps())
+    that uses the historical day `date` to represent each period in
+    base_inputs_dir, with the same timestep length as the base inputs.
+    """
+    periods = pd.read_csv(os.path.join(base_inputs_dir, 'periods.csv'))
+    timeseries = pd.read_csv(os.path.join(base_inputs_dir, 'timeseries.csv'))
+    duration = timeseries['ts_duration_of_tp'].iloc[0]
+    hours = time_sample_inputs.read_sql("""
+        SELECT DISTINCT date_time
+        FROM system_load
+        WHERE load_zone IN %(load_zones)s AND date_time::date = %(date)s
+        ORDER BY 1;
+    """, dict(args, date=date))
+    hours['hour_of_day'] = pd.to_datetime(hours['date_time']).dt.hour
+    hours = hours[hours['hour_of_day'] % duration == 0]
+    # one day per period, weighted to represent the whole period
+    periods['period'] = periods['INVESTMENT_PERIOD']
+    periods['ts_scale_to_period'] = 365.25 * (periods['period_end'] - periods['period_start'])
+    timepoints = (
+        periods[['period', 'ts_scale_to_period']].assign(key=1)
+        .merge(hours.assign(key=1), on='key').drop('key', axis=1)
+    )
+    # use the same ids as the standard time samples, e.g., 21070112 for the
+    # 2021 timeseries based on 2007-01-12 and 2107011202 for 2 am that day
+    day = pd.Timestamp(date)
+    timepoints['study_date'] = (
+        (timepoints['period'] % 100) * 1000000
+        + (day.year % 100) * 10000 + day.month * 100 + day.day
+    )
+    timepoints['study_hour'] = timepoints['study_date'] * 100 + timepoints['hour_of_day']
+    timepoints['ts_duration_of_tp'] = duration
+    timepoints['ts_num_tps'] = len(hours)
+    return time_sample_inputs.add_timestamps(timepoints)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Create inputs for post-optimization slices (see slices.py).'
+    )
+    parser.add_argument('slice_ids', type=int, nargs='*',
+        help='Slices to create (see {}).'.format(index_file))
+    parser.add_argument('--all', action='store_true', default=False,
+        help='Create all slices listed in {}.'.format(index_file))
+    parser.add_argument('--processes', type=int, default=None,
+        help='Number of worker processes to use (default is one per core).')
+    cmd_line_args = parser.parse_args()
+    if cmd_line_args.all:
+        slice_ids = list(read_index().index)
+    else:
+        slice_ids = cmd_line_args.slice_ids
+    write_slices(slice_ids, processes=cmd_line_args.processes)
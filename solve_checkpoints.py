@@ -0,0 +1,159 @@
+from __future__ import print_function, division
+"""
+Save checkpoints during long solves, and resume solving from a checkpoint
+after a crash or preemption.
+
+cplexamp only reports its solution when it finishes, so with
+--checkpoint-interval <seconds> the solve is split into segments of that
+length: each segment is run with a CPLEX time limit (time=...), then the best
+solution found so far (the incumbent) is saved in <outputs_dir>/checkpoint,
+and the next segment starts from that solution as a MIP start (see
+warm_start.py). This continues until the solver finds a solution within
+mipgap, stops for any reason other than the segment's time limit, or the
+total time limit from the solver options (time=..., e.g., time=216000 in
+options.txt) is used up. If a segment finds no solution at all, the solve
+continues without interruption until the first solution is found. Note that CPLEX starts a new search
+tree for each segment, so intervals should be fairly long (several hours for
+the main model).
+
+Use --resume-from-checkpoint to restart an interrupted solve: the saved
+incumbent is used as a MIP start and the time already used is deducted from
+the total time limit.
+
+The checkpoint directory holds the variable files (as in the outputs
+directory) and checkpoint.json, which records the solver time used so far,
+the objective value and the solver's termination condition.
+"""
+
+import os, re, json, time, shutil
+
+from pyomo.environ import Objective, TerminationCondition, value
+
+import warm_start
+
+checkpoint_file = 'checkpoint.json'
+time_setting = re.compile(r'(^|\s)time=(\S+)')
+
+def define_arguments(argparser):
+    argparser.add_argument('--checkpoint-interval', type=float, default=None,
+        help='Save the best solution found so far every this many seconds '
+        'during the solve (see solve_checkpoints.py).')
+    argparser.add_argument('--resume-from-checkpoint', action='store_true', default=False,
+        help='Start from the solution saved in <outputs_dir>/checkpoint, using '
+        'the remaining time from the total time limit.')
+
+def define_components(m):
+    if m.options.checkpoint_interval is not None or m.options.resume_from_checkpoint:
+        # switch_model.solve.main() calls solve() from that module's namespace,
+        # so this replaces the standard solve function with one that solves in
+        # segments and saves checkpoints
+        from switch_model import solve
+        if not hasattr(solve.solve, 'base_solve'):
+            base_solve = solve.solve
+            def checkpointed_solve(model):
+                return solve_with_checkpoints(model, base_solve)
+            checkpointed_solve.base_solve = base_solve
+            solve.solve = checkpointed_solve
+
+def pre_solve(m):
+    m.checkpoint_time_used = 0.0
+    if m.options.resume_from_checkpoint:
+        path = checkpoint_dir(m)
+        if os.path.exists(os.path.join(path, checkpoint_file)):
+            with open(os.path.join(path, checkpoint_file)) as f:
+                m.checkpoint_time_used = json.load(f)['solver_time_used']
+            warm_start.load_warm_start(m, path)
+            print("Resuming from checkpoint in {} after {:.0f}s of solver time.".format(
+                path, m.checkpoint_time_used
+            ))
+        else:
+            print("No checkpoint found in {}; starting from scratch.".format(path))
+
+def checkpoint_dir(m):
+    return os.path.join(m.options.outputs_dir, 'checkpoint')
+
+def solve_with_checkpoints(m, base_solve):
+    """
+    Solve model m using base_solve() in segments of up to
+    m.options.checkpoint_interval seconds, saving a checkpoint after each
+    segment. Returns the results from the last segment.
+    """
+    options_string = m.options.solver_options_string or ''
+    match = time_setting.search(options_string)
+    time_limit = float(match.group(2)) if match else None
+    interval = m.options.checkpoint_interval
+    used = getattr(m, 'checkpoint_time_used', 0.0)
+    segment_length = interval
+    try:
+        while True:
+            remaining = None if time_limit is None else time_limit - used
+            segment = segment_length
+            if remaining is not None and (segment is None or segment > remaining):
+                segment = remaining
+            if segment is not None:
+                m.options.solver_options_string = (
+                    time_setting.sub('', options_string) + ' time={:.0f}'.format(max(segment, 1))
+                )
+            else:
+                # no time limit at all
+                m.options.solver_options_string = options_string
+            start = time.time()
+            try:
+                results = base_solve(m)
+            except RuntimeError as e:
+                used += time.time() - start
+                if (
+                    str(e) == 'Infeasible model' or segment_length is None
+                    or (time_limit is not None and used >= time_limit)
+                ):
+                    raise
+                # no solution found yet, so there's nothing to save; continue
+                # without interruption until the first solution is found
+                print("No solution found after {:.0f}s; continuing.".format(used))
+                segment_length = None
+                continue
+            used += time.time() - start
+            segment_length = interval
+            condition = results.solver.termination_condition
+            # only a segment that ran out of time is continued; any other
+            # non-optimal stop (e.g., a node or memory limit) would recur
+            finished = (
+                condition != TerminationCondition.maxTimeLimit
+                or interval is None
+                or (time_limit is not None and used >= time_limit)
+            )
+            save_checkpoint(m, used, condition)
+            if finished:
+                return results
+            print(
+                "Saved checkpoint after {:.0f}s of solver time (termination "
+                "condition {}); continuing from this solution.".format(used, condition)
+            )
+    finally:
+        m.options.solver_options_string = options_string
+        m.checkpoint_time_used = used
+
+def save_checkpoint(m, used, condition):
+    """
+    Save the current variable values and solver time in the checkpoint
+    directory. Files are written to a temporary directory first, so an
+    interruption never leaves a partial checkpoint.
+    """
+    from switch_model.reporting import save_generic_results
+    path = checkpoint_dir(m)
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    save_generic_results(m, tmp_path, sorted_output=False)
+    objectives = list(m.component_data_objects(Objective, active=True))
+    with open(os.path.join(tmp_path, checkpoint_file), 'w') as f:
+        json.dump(dict(
+            solver_time_used=used,
+            objective=value(objectives[0]) if objectives else None,
+            termination_condition=str(condition),
+            saved=time.ctime(),
+        ), f, indent=4)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
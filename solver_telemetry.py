@@ -0,0 +1,175 @@
+from __future__ import print_function, division
+"""
+Record the progress of the solver while it runs, by parsing the CPLEX log as
+it is streamed to the terminal (--stream-solver).
+
+Each line of the CPLEX node log (mipdisplay >= 2) is saved as a row in
+solver_progress.csv in the outputs directory, with the wall-clock time since
+CPLEX started, CPLEX's own elapsed time, the node count,
+nodes left, best integer solution (incumbent), best bound, gap and the size
+of the branch-and-bound tree and node file (both in MB, from CPLEX's
+"Elapsed time" and "Nodefile size" reports). The file is written as the
+solver runs, so it can be inspected during long solves.
+
+When the model has been solved, a summary is printed and saved in
+solver_progress_summary.csv, including the time needed to find the first
+incumbent and to reach various gaps. These can be compared across runs to
+choose mipgap, threads, mipemphasis, etc.
+
+This is active whenever --stream-solver is used, unless --no-solver-telemetry
+is specified.
+"""
+
+import os, sys, re, csv, time
+
+# gaps (%) to report the time to reach in the summary
+summary_gaps = [10, 5, 2, 1, 0.5, 0.1]
+progress_columns = [
+    'wall_time', 'cplex_time', 'node', 'nodes_left', 'best_integer',
+    'best_bound', 'gap', 'tree_mb', 'nodefile_mb'
+]
+
+# first line written by cplexamp, e.g., "CPLEX 12.6.0.0: mipgap=0.005 ..."
+cplex_banner = re.compile(r'^CPLEX \d')
+node_line = re.compile(r'^[\s*]*(\d+)\+?\s+(\d+)\+?\s')
+elapsed_line = re.compile(
+    r'Elapsed time = ([\d.]+) sec\..*?tree = ([\d.]+) MB'
+)
+nodefile_line = re.compile(r'Nodefile size = ([\d.]+) MB')
+# notes that CPLEX sometimes shows in the best bound column, e.g., "Cuts: 45"
+bound_note = re.compile(r'\s[A-Za-z][A-Za-z ]*:\s+\d+')
+# objective values and bounds (iteration and infeasibility counts are integers)
+objective_value = re.compile(r'^(-?\d*\.?\d+e[+-]\d+|-?\d*\.\d+|-)$')
+
+def define_arguments(argparser):
+    argparser.add_argument('--no-solver-telemetry', action='store_true', default=False,
+        help='Do not save solver progress in solver_progress.csv when using '
+        '--stream-solver (see solver_telemetry.py).')
+
+def pre_solve(m):
+    if m.options.tee and not m.options.no_solver_telemetry:
+        if not isinstance(sys.stdout, TelemetryStream):
+            sys.stdout = TelemetryStream(sys.stdout, m)
+
+def post_solve(m, outdir=None):
+    if isinstance(sys.stdout, TelemetryStream):
+        sys.stdout.finish_run()
+
+class TelemetryStream(object):
+    """
+    Wrapper for sys.stdout that passes everything through, but also parses
+    each complete line for solver progress information.
+    """
+    def __init__(self, stream, model):
+        self.stream = stream
+        self.model = model
+        self.buffer = ''
+        self.run = None
+
+    def write(self, text):
+        self.stream.write(text)
+        self.buffer += text
+        if '\n' in self.buffer:
+            lines = self.buffer.split('\n')
+            self.buffer = lines.pop()
+            for line in lines:
+                self.parse_line(line)
+
+    def __getattr__(self, name):
+        # pass through flush(), fileno(), etc.
+        return getattr(self.stream, name)
+
+    def start_run(self):
+        outputs_dir = self.model.options.outputs_dir
+        if not os.path.isdir(outputs_dir):
+            os.makedirs(outputs_dir)
+        self.run = dict(
+            outputs_dir=outputs_dir,
+            start=time.time(),
+            file=open(os.path.join(outputs_dir, 'solver_progress.csv'), 'w'),
+            cplex_time=None, tree_mb=None, nodefile_mb=None, rows=[]
+        )
+        self.run['writer'] = csv.writer(self.run['file'])
+        self.run['writer'].writerow(progress_columns)
+
+    def parse_line(self, line):
+        if self.run is None:
+            if cplex_banner.match(line):
+                # first output from a new solve
+                self.start_run()
+            return
+        run = self.run
+        match = elapsed_line.search(line)
+        if match:
+            run['cplex_time'] = float(match.group(1))
+            run['tree_mb'] = float(match.group(2))
+            return
+        match = nodefile_line.search(line)
+        if match:
+            run['nodefile_mb'] = float(match.group(1))
+            return
+        match = node_line.match(line)
+        if match:
+            tokens = bound_note.sub(' -', line).split()[2:]
+            values = [t for t in tokens if objective_value.match(t)]
+            # CPLEX only shows the best integer and gap once there is an
+            # incumbent; the node's own objective may or may not be shown
+            if tokens and tokens[-1].endswith('%') and len(values) >= 2:
+                gap = to_float(tokens[-1][:-1])
+                best_integer, best_bound = to_float(values[-2]), to_float(values[-1])
+            else:
+                gap = best_integer = None
+                best_bound = to_float(values[-1]) if values else None
+            row = [
+                round(time.time() - run['start'], 2), run['cplex_time'],
+                int(match.group(1)), int(match.group(2)), best_integer,
+                best_bound, gap, run['tree_mb'], run['nodefile_mb']
+            ]
+            run['rows'].append(row)
+            run['writer'].writerow(row)
+            run['file'].flush()
+
+    def finish_run(self):
+        """
+        Close the progress file for the current solve and write a summary.
+        """
+        run = self.run
+        if run is None:
+            return
+        self.run = None
+        run['file'].close()
+        rows = [dict(zip(progress_columns, r)) for r in run['rows']]
+        incumbents = [r for r in rows if r['best_integer'] is not None]
+        summary = [
+            ('solver_time', round(time.time() - run['start'], 2)),
+            ('log_rows', len(rows)),
+            ('nodes', rows[-1]['node'] if rows else None),
+            ('first_incumbent_time', incumbents[0]['wall_time'] if incumbents else None),
+            ('final_best_integer', incumbents[-1]['best_integer'] if incumbents else None),
+            ('final_best_bound', rows[-1]['best_bound'] if rows else None),
+            ('final_gap', incumbents[-1]['gap'] if incumbents else None),
+            ('max_tree_mb', max_value(rows, 'tree_mb')),
+            ('max_nodefile_mb', max_value(rows, 'nodefile_mb')),
+        ]
+        for g in summary_gaps:
+            times = [r['wall_time'] for r in incumbents if r['gap'] is not None and r['gap'] <= g]
+            summary.append(('time_to_gap_{:g}'.format(g), times[0] if times else None))
+        with open(os.path.join(run['outputs_dir'], 'solver_progress_summary.csv'), 'w') as f:
+            w = csv.writer(f)
+            w.writerow(['item', 'value'])
+            w.writerows(summary)
+        self.stream.write('Solver progress summary (see {}):\n'.format(
+            os.path.join(run['outputs_dir'], 'solver_progress.csv')
+        ))
+        for item, value in summary:
+            self.stream.write('    {}: {}\n'.format(item, value))
+
+def to_float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def max_value(rows, col):
+    values = [r[col] for r in rows if r[col] is not None]
+    return max(values) if values else None
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+"""
+Solve the model for several values of --onshore-wind-limit, constructing the
+model only once.
+
+The onshore wind limit is held in a mutable parameter
+(onshore_wind_limit_mw in limit_new_onshore_wind_capacity.py), so this script
+constructs the model from options.txt (plus any --extra-args) once, then for
+each limit it changes that parameter, solves the same model again and saves
+the results in a separate outputs directory (outputs_wind_<limit> by
+default). Each solve starts from the previous solution, which remains in the
+model and is sent to the solver as a MIP start (see warm_start.py).
+
+Examples:
+
+    python sweep_wind_limit.py --limits 323 223 123
+    python sweep_wind_limit.py --limits 323 123 --outputs-prefix outputs_accept_wind \\
+        --extra-args "--exclude-module no_new_thermal_capacity"
+"""
+
+import sys, time, shlex, argparse
+
+import limit_new_onshore_wind_capacity
+import warm_start
+import fork_scenarios
+
+def outputs_dir(prefix, limit):
+    return '{}_{:g}'.format(prefix, limit)
+
+def sweep(instance, limits, outputs_prefix):
+    """
+    Solve instance once for each onshore wind limit in limits, saving results
+    in separate outputs directories.
+    """
+    for i, limit in enumerate(limits):
+        start = time.time()
+        limit_new_onshore_wind_capacity.set_onshore_wind_limit(instance, limit)
+        instance.options.outputs_dir = outputs_dir(outputs_prefix, limit)
+        if i > 0:
+            # adjust the previous solution to fit the new limit where possible
+            warm_start.repair_values(instance)
+        fork_scenarios.solve_instance(instance)
+        print("Solved with onshore wind limit of {:g} MW in {:.1f} minutes; results are in {}.".format(
+            limit, (time.time() - start) / 60, instance.options.outputs_dir
+        ))
+        sys.stdout.flush()
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Solve the model for several onshore wind limits (see sweep_wind_limit.py).'
+    )
+    parser.add_argument('--limits', type=float, nargs='+', required=True,
+        help='Onshore wind limits (MW) to solve for, in order.')
+    parser.add_argument('--outputs-prefix', default='outputs_wind',
+        help='Results for each limit are saved in <outputs-prefix>_<limit> '
+        '(default is %(default)s).')
+    parser.add_argument('--extra-args', default='',
+        help='Additional arguments to use when constructing the model.')
+    args = parser.parse_args(args)
+
+    from switch_model import solve
+    start = time.time()
+    instance = solve.main(
+        args=solve.get_option_file_args(extra_args=shlex.split(args.extra_args)),
+        return_instance=True
+    )
+    print("Constructed model in {:.1f} minutes.".format((time.time() - start) / 60))
+    sweep(instance, args.limits, args.outputs_prefix)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
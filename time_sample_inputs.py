@@ -0,0 +1,343 @@
+from __future__ import print_function, division
+"""
+Create inputs for a different time sample (e.g., one-year periods for the
+post-optimization evaluation) from an existing inputs directory, without
+rerunning the whole scenario_data.write_tables() pipeline.
+
+Tables that don't depend on the time sample are copied from the base inputs
+directory. Tables indexed by period (build costs, fuel supply curves and EV
+fleet data) are written by scenario_data.write_tables(), but skipping all other
+tables. Timepoint-indexed tables are assembled with pandas from small queries
+for the sample dates and hours and the underlying hourly data. This avoids the
+joins against study_hour that make the standard queries slow for large time
+samples, e.g., there are only 156 distinct historical hours in the annual time
+sample, so loads only need to be retrieved for those. Capacity factors are
+written in parallel by capacity_factors.py. The same code is used to create
+single-day slices for post-optimization evaluation (see slices.py).
+
+This needs the same database access as get_scenario_data.py.
+"""
+
+import os, shutil, time
+import pandas as pd
+
+import switch_model.hawaii.scenario_data as scenario_data
+import compact_ev_bids
+import capacity_factors
+
+# tables indexed by timepoint or timeseries; these are built by this module
+time_tables = [
+    'periods.csv', 'timeseries.csv', 'timepoints.csv', 'loads.csv',
+    'variable_capacity_factors.csv', 'gen_timepoint_commit_bounds.csv',
+    'ev_bau_load.csv', 'ev_charging_bids.csv', 'ev_charging_bids_compact.csv',
+]
+# tables indexed by period or build year; these are written by
+# scenario_data.write_tables(), but without any of the other tables
+period_tables = [
+    'gen_build_costs.csv', 'fuel_supply_curves.csv', 'ev_fleet_info.csv',
+    'ev_share.csv', 'ev_fleet_info_advanced.csv',
+]
+
+def write_tables(base_inputs_dir, args, timepoints=None, projects=None):
+    """
+    Write inputs for args['time_sample'] in args['inputs_dir'], reusing tables
+    from base_inputs_dir where possible. The base inputs should have been
+    created with the same arguments except time_sample and inputs_dir.
+
+    Alternatively, timepoints can be a DataFrame of timepoints (see
+    add_timestamps()) with the same periods as base_inputs_dir, in which case
+    the period-indexed tables are also copied from base_inputs_dir and
+    args['time_sample'] is not used. In this case, projects should also be
+    provided for capacity factors (see capacity_factors.write_table()).
+    """
+    inputs_dir = args['inputs_dir']
+    if timepoints is None:
+        print("Creating {} from {} for time sample {}.".format(
+            inputs_dir, base_inputs_dir, args['time_sample']
+        ))
+        copy_base_tables(base_inputs_dir, args)
+        # this also creates the study_projects and study_generator_info
+        # temporary tables used for capacity factors
+        write_period_tables(args)
+        timepoints = get_timepoints(args)
+    else:
+        print("Creating {} from {} for {} timepoints.".format(
+            inputs_dir, base_inputs_dir, len(timepoints)
+        ))
+        copy_base_tables(base_inputs_dir, args, include_period_tables=True)
+
+    write_periods(timepoints, args)
+    write_timeseries(timepoints, args)
+    write_timepoints(timepoints, args)
+    write_loads(timepoints, args)
+    write_commit_bounds(timepoints, base_inputs_dir, args)
+    if args.get('ev_scenario', None) is not None:
+        write_ev_bau_load(timepoints, args)
+        if args.get('skip_ev_bids', False):
+            print("SKIPPING ev_charging_bids.csv")
+        else:
+            write_ev_charging_bids(timepoints, args)
+    if args.get('skip_cf', False):
+        print("SKIPPING variable_capacity_factors.csv")
+    else:
+        # note: this closes the database connection, so it must come last
+        capacity_factors.write_table(
+            args, timepoints=timepoints, projects=projects,
+            processes=args.get('cf_processes')
+        )
+
+def copy_base_tables(base_inputs_dir, args, include_period_tables=False):
+    start = time.time()
+    files = [
+        f for f in sorted(os.listdir(base_inputs_dir))
+        if f not in time_tables
+        and (include_period_tables or f not in period_tables)
+        and os.path.isfile(os.path.join(base_inputs_dir, f))
+    ]
+    for f in files:
+        shutil.copy2(
+            os.path.join(base_inputs_dir, f), scenario_data.make_file_path(f, args)
+        )
+    print("Copied {} tables from {}; time taken: {:.2f}s".format(
+        len(files), base_inputs_dir, time.time()-start
+    ))
+
+def write_period_tables(args):
+    """
+    Run scenario_data.write_tables() but only write the tables that depend on
+    the study periods.
+    """
+    base_functions = {
+        name: getattr(scenario_data, name) for name in [
+            'write_table', 'write_csv_file', 'write_simple_csv',
+            'write_dat_file', 'write_indexed_set_dat_file'
+        ]
+    }
+    def write_table(output_file, query, arguments):
+        if output_file in period_tables:
+            base_functions['write_table'](output_file, query, arguments)
+    def skip(*args, **kwargs):
+        pass
+    try:
+        for name in base_functions:
+            setattr(scenario_data, name, skip)
+        scenario_data.write_table = write_table
+        scenario_data.write_tables(args)
+    finally:
+        for name, func in base_functions.items():
+            setattr(scenario_data, name, func)
+
+def read_sql(query, args):
+    """Retrieve results of a query as a pandas DataFrame."""
+    return pd.read_sql(query, scenario_data.db_cursor().connection, params=args)
+
+def write_csv(df, output_file, args, start):
+    """Write df to output_file in args['inputs_dir'] in standard format."""
+    output_file = scenario_data.make_file_path(output_file, args)
+    df.to_csv(output_file, index=False, na_rep='.')
+    print("Writing {file} ... time taken: {dur:.2f}s".format(
+        file=output_file, dur=time.time()-start
+    ))
+
+def get_timepoints(args):
+    """
+    Return a DataFrame with one row per timepoint in the time sample, including
+    the timeseries and period information for each timepoint.
+    """
+    dates = read_sql("""
+        SELECT study_date, period, ts_duration_of_tp, ts_num_tps, ts_scale_to_period
+        FROM study_date
+        WHERE time_sample = %(time_sample)s;
+    """, args)
+    hours = read_sql("""
+        SELECT study_hour, study_date, hour_of_day, date_time
+        FROM study_hour
+        WHERE time_sample = %(time_sample)s;
+    """, args)
+    return add_timestamps(hours.merge(dates, on='study_date'))
+
+def add_timestamps(timepoints):
+    """
+    Add timestamp, year_hist and doy columns to timepoints, which must have
+    study_hour, study_date, hour_of_day, date_time, period, ts_duration_of_tp,
+    ts_num_tps and ts_scale_to_period columns. Returns the timepoints sorted in
+    standard order.
+    """
+    # mimic the timestamps from postgresql, which shifts the historical date to
+    # the same date in the study period (Feb. 29 moves to Feb. 28 in non-leap
+    # years)
+    date_time = pd.to_datetime(timepoints['date_time'])
+    month_day = date_time.dt.strftime('%m-%d')
+    leap_year = (
+        (timepoints['period'] % 4 == 0)
+        & ((timepoints['period'] % 100 != 0) | (timepoints['period'] % 400 == 0))
+    )
+    month_day = month_day.mask((month_day == '02-29') & ~leap_year, '02-28')
+    timepoints['timestamp'] = (
+        timepoints['period'].astype(str) + '-' + month_day + ' '
+        + date_time.dt.strftime('%H:%M')
+    )
+    timepoints['year_hist'] = date_time.dt.year
+    timepoints['doy'] = date_time.dt.dayofyear
+    return timepoints.sort_values(['period', 'doy', 'study_hour']).reset_index(drop=True)
+
+def write_periods(timepoints, args):
+    start = time.time()
+    dates = timepoints.drop_duplicates('study_date')
+    period_length = dates.groupby('period')['ts_scale_to_period'].sum() / 365.25
+    # round to an integer number of years if within 1% (see scenario_data.py)
+    whole_years = (period_length - period_length.round()).abs() <= 0.01
+    period_length = period_length.mask(whole_years, period_length.round())
+    periods = pd.DataFrame({
+        'INVESTMENT_PERIOD': period_length.index,
+        'period_start': period_length.index,
+        'period_end': period_length.index + period_length.values,
+    })
+    write_csv(periods, 'periods.csv', args, start)
+
+def write_timeseries(timepoints, args):
+    start = time.time()
+    timeseries = (
+        timepoints.drop_duplicates('study_date')
+        .sort_values('study_date')
+        .rename(columns={'study_date': 'TIMESERIES', 'period': 'ts_period'})
+        [['TIMESERIES', 'ts_period', 'ts_duration_of_tp', 'ts_num_tps', 'ts_scale_to_period']]
+    )
+    write_csv(timeseries, 'timeseries.csv', args, start)
+
+def write_timepoints(timepoints, args):
+    start = time.time()
+    write_csv(
+        timepoints.rename(columns={'study_hour': 'timepoint_id', 'study_date': 'timeseries'})
+        [['timepoint_id', 'timestamp', 'timeseries']],
+        'timepoints.csv', args, start
+    )
+
+def write_loads(timepoints, args):
+    start = time.time()
+    # get loads only for the historical hours used in the sample, then scale
+    # them to each study period
+    system_load = read_sql("""
+        SELECT load_zone, date_time, system_load
+        FROM system_load
+        WHERE load_zone IN %(load_zones)s
+            AND date_time IN %(date_times)s;
+    """, dict(args, date_times=tuple(timepoints['date_time'].drop_duplicates())))
+    load_scale = read_sql("""
+        SELECT load_zone, year_hist, year_fore AS period, scale, "offset"
+        FROM system_load_scale
+        WHERE load_zone IN %(load_zones)s
+            AND load_scenario = %(load_scenario)s;
+    """, args)
+    loads = (
+        timepoints[['study_hour', 'date_time', 'year_hist', 'period']]
+        .merge(system_load, on='date_time')
+        .merge(load_scale, on=['load_zone', 'year_hist', 'period'])
+    )
+    loads['zone_demand_mw'] = (
+        loads['system_load'] * loads['scale'] + loads['offset']
+    ).clip(lower=0)
+    write_csv(
+        loads.rename(columns={'load_zone': 'LOAD_ZONE', 'study_hour': 'TIMEPOINT'})
+        .sort_values(['LOAD_ZONE', 'TIMEPOINT'])
+        [['LOAD_ZONE', 'TIMEPOINT', 'zone_demand_mw']],
+        'loads.csv', args, start
+    )
+
+def write_commit_bounds(timepoints, base_inputs_dir, args):
+    """
+    Force commitment of must-run plants during periods before
+    args['enable_must_run_before']. The must-run plants are identified from the
+    commitment bounds in the base inputs.
+    """
+    start = time.time()
+    base_bounds = pd.read_csv(
+        os.path.join(base_inputs_dir, 'gen_timepoint_commit_bounds.csv'), na_values=['.']
+    )
+    must_run = base_bounds.loc[
+        base_bounds['gen_min_commit_fraction'] == 1.0, 'GENERATION_PROJECT'
+    ].unique()
+    enable_must_run_before = args.get('enable_must_run_before', 0)
+    must_run_tps = timepoints.loc[
+        timepoints['period'] < enable_must_run_before, 'study_hour'
+    ]
+    bounds = pd.DataFrame({
+        'GENERATION_PROJECT': must_run.repeat(len(must_run_tps)),
+        'TIMEPOINT': list(must_run_tps) * len(must_run),
+        'gen_min_commit_fraction': 1.0,
+        'gen_max_commit_fraction': float('nan'),
+        'gen_min_load_fraction_tp': float('nan'),
+    })
+    write_csv(bounds, 'gen_timepoint_commit_bounds.csv', args, start)
+
+def write_ev_bau_load(timepoints, args):
+    """
+    Calculate business-as-usual EV charging from ev_fleet_info.csv (written by
+    write_period_tables()) and the hourly charging profile.
+    """
+    start = time.time()
+    fleet = pd.read_csv(scenario_data.make_file_path('ev_fleet_info.csv', args))
+    profile = read_sql("""
+        SELECT hour_of_day, charge_weight
+        FROM ev_hourly_charge_profile
+        WHERE ev_charge_profile = %(ev_charge_profile)s;
+    """, args)
+    ev_load = (
+        timepoints[['study_hour', 'hour_of_day', 'period']]
+        .merge(profile, on='hour_of_day')
+        .merge(fleet, left_on='period', right_on='PERIOD')
+    )
+    # note: the charge weights have a mean value of 1.0, but go up and down in
+    # different hours
+    ev_load['ev_bau_mw'] = (
+        ev_load['charge_weight'] * ev_load['ev_share'] * ev_load['n_all_vehicles']
+        * ev_load['vmt_per_vehicle'] / (1000.0 * ev_load['ev_miles_per_kwh']) / 8760
+    )
+    write_csv(
+        ev_load.rename(columns={'study_hour': 'TIMEPOINT'})
+        .sort_values(['LOAD_ZONE', 'TIMEPOINT'])
+        [['LOAD_ZONE', 'TIMEPOINT', 'ev_bau_mw']],
+        'ev_bau_load.csv', args, start
+    )
+
+def write_ev_charging_bids(timepoints, args):
+    """
+    EV charging bids depend only on the hour of day and timestep length, so we
+    retrieve one set of bids per hour and broadcast them to all timepoints, or
+    save them in compact form if args['compact_ev_bids'] is set (see
+    compact_ev_bids.py).
+    """
+    start = time.time()
+    bids = read_sql("""
+        SELECT
+            b.load_zone AS "LOAD_ZONE",
+            CONCAT_WS('_', 'All', "ICE fuel", 'Vehicles') AS "VEHICLE_TYPE",
+            bid_number AS "BID_NUM",
+            b.hour AS hour_of_day,
+            b.hours_per_step AS ts_duration_of_tp,
+            sum(charge_mw) AS ev_bid_by_type
+        FROM ev_charging_bids b
+            JOIN ev_fleet f ON b.vehicle_type=f."vehicle type" AND b.load_zone=f.load_zone
+        WHERE b.load_zone in %(load_zones)s
+        GROUP BY 1, 2, 3, 4, 5;
+    """, args)
+    if args.get('compact_ev_bids', False):
+        bids = bids[bids['ts_duration_of_tp'].isin(timepoints['ts_duration_of_tp'])]
+        compact_ev_bids.write_compact_bids(
+            bids.rename(columns={'hour_of_day': 'hour'}),
+            scenario_data.make_file_path(compact_ev_bids.compact_bid_file, args)
+        )
+        print("Writing {file} ... time taken: {dur:.2f}s".format(
+            file=compact_ev_bids.compact_bid_file, dur=time.time()-start
+        ))
+        return
+    bids = (
+        timepoints[['study_hour', 'hour_of_day', 'ts_duration_of_tp']]
+        .merge(bids, on=['hour_of_day', 'ts_duration_of_tp'])
+        .rename(columns={'study_hour': 'TIMEPOINT'})
+        .sort_values(['LOAD_ZONE', 'VEHICLE_TYPE', 'BID_NUM', 'TIMEPOINT'])
+    )
+    write_csv(
+        bids[['LOAD_ZONE', 'VEHICLE_TYPE', 'BID_NUM', 'TIMEPOINT', 'ev_bid_by_type']],
+        'ev_charging_bids.csv', args, start
+    )
@@ -0,0 +1,124 @@
+from __future__ import print_function, division
+"""
+Use the solution from a related scenario as a starting point (MIP start) for
+the solver.
+
+Use --warm-start-from <outputs_dir> to read the values saved for each
+variable in a previously solved scenario (BuildGen.csv, BuildUnits.csv,
+CommitGenUnits.csv, BuildPumpedHydroMW.csv, etc.) and assign them to the
+matching variables in this model before it is solved. Variables with no saved
+value are left blank and fixed variables are left as they are.
+
+The saved values are repaired where possible, so they are more likely to be
+feasible for this scenario: values are clipped to the variable's bounds,
+values for integer and binary variables are rounded, and variables that are
+set directly by a constraint (e.g., BuildPumpedHydroMW[g, p] == 0 from the
+pumped hydro rules) are moved inside the limits of that constraint. Any
+remaining infeasibility (e.g., from a lower --onshore-wind-limit) is left for
+the solver's own MIP start repair.
+
+Pyomo passes variable values to solvers as initial values when writing .nl
+files, and cplexamp uses these as a MIP start by default (see its
+mipstartvalue option), so this works with the solver settings in options.txt.
+Other solver interfaces may ignore the values.
+"""
+
+import os, csv, time
+
+from pyomo.environ import Var, Constraint, value
+
+def define_arguments(argparser):
+    argparser.add_argument('--warm-start-from', default=None,
+        help='Outputs directory from a previously solved scenario to use as a '
+        'starting point (MIP start) for the solver (see warm_start.py).')
+
+def pre_solve(m):
+    if m.options.warm_start_from is not None:
+        load_warm_start(m, m.options.warm_start_from)
+
+def load_warm_start(m, outputs_dir):
+    """
+    Assign values from the variable files in outputs_dir to the variables in
+    m, then repair them as described above.
+    """
+    start = time.time()
+    if not os.path.isdir(outputs_dir):
+        raise IOError(
+            'Directory {} specified for --warm-start-from does not exist.'
+            .format(outputs_dir)
+        )
+    n_vars = n_values = 0
+    for var in m.component_objects(Var):
+        path = os.path.join(outputs_dir, var.name + '.csv')
+        if os.path.isfile(path):
+            n_values += read_var_values(var, path)
+            n_vars += 1
+    n_repaired = repair_values(m)
+    print(
+        "Loaded {} values for {} variables from {} for warm start ({} repaired); "
+        "time taken: {:.2f}s".format(
+            n_values, n_vars, outputs_dir, n_repaired, time.time()-start
+        )
+    )
+
+def read_var_values(var, path):
+    """
+    Assign values from path to the matching elements of var; return the number
+    of values assigned.
+    """
+    # match rows to variables by the text of their keys, which is how they
+    # are written in the outputs files
+    var_data = {}
+    for key, v in var.items():
+        if not v.fixed:
+            if key is None:
+                key = ()  # scalar variable
+            elif not isinstance(key, tuple):
+                key = (key,)
+            var_data[tuple(str(k) for k in key)] = v
+    count = 0
+    with open(path) as f:
+        reader = csv.reader(f)
+        next(reader)  # skip headers
+        for row in reader:
+            v = var_data.get(tuple(row[:-1]))
+            # blank values are for variables that weren't used in the model
+            if v is not None and row[-1] not in ('', '.'):
+                v.value = clipped_value(v, float(row[-1]))
+                count += 1
+    return count
+
+def clipped_value(v, x, lb=None, ub=None):
+    """
+    Return x clipped to the bounds of variable v (and lb and ub if specified)
+    and rounded if v is integer.
+    """
+    for bound in (v.lb, lb):
+        if bound is not None and x < bound:
+            x = bound
+    for bound in (v.ub, ub):
+        if bound is not None and x > bound:
+            x = bound
+    if v.is_integer() or v.is_binary():
+        x = round(x)
+    return x
+
+def repair_values(m):
+    """
+    Move variables that are set directly by an active constraint (constraints
+    with a single variable as their body) within the limits of that
+    constraint. Returns the number of values changed.
+    """
+    count = 0
+    for c in m.component_data_objects(Constraint, active=True):
+        body = c.body
+        if getattr(body, 'is_variable_type', lambda: False)() and body.value is not None:
+            x = clipped_value(
+                body, body.value,
+                None if c.lower is None else value(c.lower),
+                None if c.upper is None else value(c.upper)
+            )
+            if x != body.value:
+                body.value = x
+                count += 1
+    return count